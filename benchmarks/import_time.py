@@ -0,0 +1,41 @@
+"""
+Import time.
+
+Imports a module in fresh interpreters, like a new worker process
+does, and prints the median time of the import::
+
+    python -m benchmarks.import_time [module] [runs]
+
+Bytecode is cached in a temporary directory, so the sources are only
+compiled by a first run which is not measured.
+"""
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+SCRIPT = '''
+import time
+start = time.perf_counter()
+import %s
+print(time.perf_counter() - start)
+'''
+
+
+def measure(module, runs):
+    times = []
+    with tempfile.TemporaryDirectory() as cache:
+        env = dict(os.environ, PYTHONPYCACHEPREFIX=cache)
+        env.pop('PYTHONDONTWRITEBYTECODE', None)
+        for _ in range(runs + 1):
+            out = subprocess.check_output(
+                [sys.executable, '-c', SCRIPT % module], env=env)
+            times.append(float(out))
+    return statistics.median(times[1:])
+
+
+if __name__ == '__main__':
+    module = sys.argv[1] if len(sys.argv) > 1 else 'ecrterm.ecr'
+    runs = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    print('%s: %.1f ms' % (module, measure(module, runs) * 1000))
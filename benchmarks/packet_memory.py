@@ -0,0 +1,43 @@
+"""
+Memory per packet.
+
+Parses a typical payment status information many times, decodes all
+bitmaps and keeps the packets, like Transmission.history does. Prints
+the allocated bytes per packet::
+
+    python -m benchmarks.packet_memory [count]
+"""
+import sys
+import tracemalloc
+
+from ecrterm.conv import toBytes
+from ecrterm.packets.base_packets import Packet
+
+#: status information after a payment: result, amount, trace, time,
+#: date, expiry, card sequence, payment type, pan, tid, currency,
+#: receipt, card type.
+BITMAPS = bytes(toBytes(
+    '27 00 04 00 00 00 00 40 00 0B 00 00 01 0C 12 34 56 0D 12 31 '
+    '0E 24 12 17 00 01 19 40 22 F0 F8 67 26 00 00 00 00 00 01 '
+    '29 52 50 00 09 49 09 78 87 00 01 8A 05'))
+STATUS = bytes([0x04, 0x0F, len(BITMAPS)]) + BITMAPS
+
+
+def measure(count):
+    packets = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(count):
+        packet = Packet.parse(STATUS)
+        packet.bitmaps
+        packets.append(packet)
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    size = sum(stat.size_diff for stat in after.compare_to(
+        before, 'filename'))
+    return size / count
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    print('%d bytes per packet' % measure(count))
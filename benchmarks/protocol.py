@@ -0,0 +1,38 @@
+"""
+Protocol exchanges without I/O.
+
+Runs a payment through the ZVTProtocol with canned answers of the PT:
+Packet Received, two intermediate status informations, a status
+information, ten print lines and the completion, all in one chunk.
+Prints the exchanges per second::
+
+    python -m benchmarks.protocol [count]
+"""
+import sys
+import time
+
+from benchmarks.packet_memory import STATUS
+from ecrterm.packets.base_packets import Authorisation
+from ecrterm.transmission.protocol import ZVTProtocol
+
+#: a print line with attribute 0 and 24 characters.
+LINE = b'\x06\xD1\x19\x00' + b'Total               1,00'
+ANSWERS = (b'\x80\x00\x00' + b'\x04\xFF\x01\x0A' * 2 + STATUS +
+           LINE * 10 + b'\x06\x0F\x00')
+
+
+def measure(count):
+    start = time.perf_counter()
+    for _ in range(count):
+        protocol = ZVTProtocol()
+        protocol.send(Authorisation(amount=100, currency_code=978))
+        protocol.data_to_send()
+        protocol.receive_data(ANSWERS)
+        protocol.data_to_send()
+        assert protocol.is_master
+    return count / (time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print('%d exchanges per second' % measure(count))
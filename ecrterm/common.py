@@ -295,6 +295,7 @@ class Dumpling(object):
       - tell you how much bytes of data it has.
       - dumpling does not solve how you store your data.
     """
+    __slots__ = ()
 
     def dump(self):
         """
@@ -313,6 +314,10 @@ class Dumpling(object):
 
 class Transport(Logling):
     insert_delays = False
+    #: True if a received packet is buffered, so receive does not wait.
+    has_apdu = False
+    #: True if ECR.detect_pt can probe the PT over this transport.
+    supports_detection = False
 
     def connect(self, *args, **kwargs):
         """
@@ -324,3 +329,8 @@ class Transport(Logling):
 
     def send(self, message, *args, **kwargs):
         """Send data."""
+
+    def send_packets(self, packets):
+        """Send packets which need no answer, one after the other."""
+        for packet in packets:
+            self.send(packet, no_wait=True)
@@ -24,15 +24,14 @@ along with pyscard; if not, write to the Free Software
 Foundation, Inc., 51 Franklin St, Fifth Floor, Boston, MA  02110-1301  USA
 """
 import re
-import sys
-from functools import reduce
-from struct import unpack
 
 PACK = 1
 HEX = 2
 UPPERCASE = 4
 COMMA = 8
 
+_NON_WORD = re.compile(r'\W+')
+
 
 def padd(bytelist, length, padding='FF'):
     """
@@ -52,8 +51,7 @@ def padd(bytelist, length, padding='FF'):
     """
 
     if len(bytelist) < length:
-        for index in range(length - len(bytelist)):
-            bytelist.append(eval('0x' + padding))
+        bytelist.extend([int(padding, 16)] * (length - len(bytelist)))
 
     return bytelist
 
@@ -73,7 +71,7 @@ def toASCIIBytes(stringtoconvert):
         [0x4E, 0x75, 0x6D, 0x62, 0x65, 0x72, 0x20, 0x31, 0x30, 0x31]
     """
 
-    return map(ord, list(stringtoconvert))
+    return BinStringToHexList(stringtoconvert)
 
 
 def toASCIIString(bytelist):
@@ -93,29 +91,23 @@ def toASCIIString(bytelist):
     ) returns "Number 101")
     """
 
-    return ''.join(map(chr, bytelist))
+    return HexListToBinString(bytelist)
 
 
 def ascii_bytes_to_bytes(ascii_bytes):
-    packedstring = ''.join(re.split(r'\W+', ascii_bytes))
-    if sys.version_info[0] > 2 and isinstance(packedstring, str):
-        packedstring = packedstring.encode()
+    packedstring = _NON_WORD.sub('', ascii_bytes)
     try:
-        return reduce(lambda x, y: x + [int(y, 16)], unpack(
-            '2s' * (len(packedstring) // 2), packedstring), [])
-    except Exception:
+        return list(bytes.fromhex(packedstring))
+    except ValueError:
         raise TypeError('not a string representing a list of bytes')
 
 
 def is_ascii_alnum(s):
     try:
-        if sys.version_info.major == 2:
-            return unicode.isalnum(s.decode('ascii'))
-        elif sys.version_info.major == 3:
-            if isinstance(s, str):
-                s = s.encode().decode('ascii')
-            return s.isalnum()
-    except UnicodeDecodeError:
+        if isinstance(s, str):
+            s = s.encode('ascii')
+        return s.isalnum()
+    except UnicodeEncodeError:
         return False
 
 
@@ -125,13 +117,27 @@ def toBytes(bytestring):
 
     bytestring: a byte string of the format "3B 65 00 00 9C 11 01 01 03" or
     "3B6500009C11010103" or "3B6500   009C1101  0103"
+
+    bytes, bytearray and memoryview are returned as list, text with
+    characters other than letters and digits which is no hex as list of
+    its character codes. A single word which is no hex raises TypeError.
     """
+    if isinstance(bytestring, (bytes, bytearray, memoryview)):
+        return list(bytestring)
+    try:
+        return list(bytes.fromhex(bytestring))
+    except ValueError:
+        pass
     if is_ascii_alnum(bytestring):
         return ascii_bytes_to_bytes(bytestring)
-    else:
-        if sys.version_info.major == 3 and isinstance(bytestring, bytes):
-            return list(bytestring)
-        return list(map(ord, bytestring))
+    # hex with separators, or any other text.
+    packedstring = _NON_WORD.sub('', bytestring)
+    if packedstring and is_ascii_alnum(packedstring):
+        try:
+            return list(bytes.fromhex(packedstring))
+        except ValueError:
+            pass
+    return BinStringToHexList(bytestring)
 
 
 """GSM3.38 character conversion table."""
@@ -207,8 +213,8 @@ def toHexString(input_bytes=None, format=0):
     """
     Returns an hex string representing bytes
 
-    bytes:  a list of bytes to stringify, e.g.
-        [59, 22, 148, 32, 2, 1, 0, 0, 13]
+    bytes:  a list of bytes, bytes, bytearray or memoryview to stringify,
+        e.g. [59, 22, 148, 32, 2, 1, 0, 0, 13]
     format: a logical OR of
         COMMA: add a comma between bytes
         HEX: add the 0x chars before bytes
@@ -235,52 +241,44 @@ def toHexString(input_bytes=None, format=0):
     toHexString(bytes, HEX | UPPERCASE | COMMA) returns
         0X3B, 0X65, 0X00, 0X00, 0X9C, 0X11, 0X01, 0X01, 0X03
     """
-
-    try:
-        from string import rstrip
-    except ImportError:  # Python3
-        def rstrip(s, chars=None):
-            return s.rstrip(chars)
-
-    input_bytes = input_bytes or []
-
-    for byte in tuple(input_bytes):
-        pass
-
-    if type(input_bytes) is not list:
-        raise TypeError('not a list of bytes')
-
-    if input_bytes is None or input_bytes == []:
+    if not input_bytes:
         return ""
+    if type(input_bytes) is list:
+        try:
+            input_bytes = bytes(input_bytes)
+        except ValueError:
+            # negative or too big values, we only show the lowest byte.
+            input_bytes = bytes([byte & 0xFF for byte in input_bytes])
+    elif not isinstance(input_bytes, (bytes, bytearray, memoryview)):
+        raise TypeError('not a list of bytes')
+    hexstring = input_bytes.hex().upper()
+    separator = ',' if COMMA & format else ''
+    if not PACK & format:
+        separator += ' '
+    if HEX & format:
+        prefix = '0X' if UPPERCASE & format else '0x'
+    elif not separator:
+        return hexstring
     else:
-        pformat = "%-0.2X"
-        if COMMA & format:
-            pformat = pformat + ","
-        pformat = pformat + " "
-        if PACK & format:
-            pformat = rstrip(pformat)
-        if HEX & format:
-            if UPPERCASE & format:
-                pformat = "0X" + pformat
-            else:
-                pformat = "0x" + pformat
-        return rstrip(rstrip(reduce(
-            lambda a, b: a + pformat % (
-                (b + 256) % 256), [""] + input_bytes)), ',')
+        prefix = ''
+    return separator.join([
+        prefix + hexstring[i:i + 2] for i in range(0, len(hexstring), 2)])
 
 
 def HexListToBinString(hexlist):
-    binstring = ""
-    for byte in hexlist:
-        binstring = binstring + chr(eval('0x%x' % byte))
-    return binstring
+    try:
+        return bytes(hexlist).decode('latin-1')
+    except (ValueError, TypeError):
+        return ''.join(map(chr, hexlist))
 
 
 def BinStringToHexList(binstring):
-    hexlist = []
-    for byte in binstring:
-        hexlist = hexlist + [byte if isinstance(byte, int) else ord(byte)]
-    return hexlist
+    if isinstance(binstring, str):
+        try:
+            return list(binstring.encode('latin-1'))
+        except UnicodeEncodeError:
+            return [ord(char) for char in binstring]
+    return list(binstring)
 
 
 def hl2bs(hexlist):
@@ -3,7 +3,8 @@
     CRC Funktionen
 
 """
-from six.moves import range
+#: ZVT uses the reversed XMODEM-16 polynome
+POLY_XMODEM16 = 0x8408
 
 
 def build_codetable(poly):
@@ -14,29 +15,15 @@ def build_codetable(poly):
     crc_table = []
     for i in range(256):
         crc = i
-        for j in range(1, 9):
-            if (crc & 1) == 1:
-                crc = int(crc / 2.0) ^ poly
+        for j in range(8):
+            if crc & 1:
+                crc = (crc >> 1) ^ poly
             else:
-                crc = int(crc / 2.0)
-        crc_table += [crc]
+                crc >>= 1
+        crc_table.append(crc)
     return crc_table
 
 
-def crc_checksum(something, poly=33800):
-    """
-        makes a crc checksum with any given polynome, building the table
-        every time.
-    """
-    crc_table = build_codetable(poly)
-    crc = 0
-    for i in something:
-        hb = int(crc / 256.0)
-        lb = crc - (256 * hb)
-        crc = crc_table[lb ^ ord(i)] ^ hb
-    return crc
-
-
 #: poly = 0x8408
 TABLE_XMODEM16 = [
     0, 4489, 8978, 12955, 17956, 22445, 25910, 29887, 35912,
@@ -70,15 +57,97 @@ TABLE_XMODEM16 = [
     15843, 11370, 7921, 3960]
 
 
+#: one codetable per polynome, built on first use.
+_CODETABLES = {POLY_XMODEM16: TABLE_XMODEM16}
+
+
+def get_codetable(poly):
+    """Returns the cached codetable for a polynome."""
+    table = _CODETABLES.get(poly)
+    if table is None:
+        table = _CODETABLES[poly] = build_codetable(poly)
+    return table
+
+
+def _as_bytes(something):
+    # bytes, bytearray and byte memoryviews iterate as ints already.
+    if isinstance(something, memoryview) and something.format != 'B':
+        return something.cast('B')
+    if isinstance(something, str):
+        return [ord(c) for c in something]
+    return something
+
+
+class CRC16(object):
+    """
+    Incremental crc checksum.
+
+    >>> CRC16(b'\\x80\\x00\\x00').update(b'\\x03').digest()
+    b'\\xf5\\x1f'
+
+    Accepts bytes, bytearray, memoryview and lists of ints (str for
+    compatibility).
+    """
+
+    def __init__(self, data=None, poly=POLY_XMODEM16, crc=0):
+        self.poly = poly
+        self.crc = crc
+        self._table = get_codetable(poly)
+        if data is not None:
+            self.update(data)
+
+    def update(self, data):
+        """Adds data to the checksum, returns self."""
+        table = self._table
+        crc = self.crc
+        for b in _as_bytes(data):
+            crc = table[(crc ^ b) & 0xFF] ^ (crc >> 8)
+        self.crc = crc
+        return self
+
+    def digest(self):
+        """Returns the checksum as two bytes, low byte first."""
+        return bytes((self.crc & 0xFF, self.crc >> 8))
+
+    def copy(self):
+        return CRC16(poly=self.poly, crc=self.crc)
+
+
+def crc_checksum(something, poly=33800):
+    """
+        makes a crc checksum with any given polynome.
+    """
+    return CRC16(something, poly).crc
+
+
 def crc_xmodem16(something):
     """
         short for hardcoded 0x8408 (XMODEM-16) crc checksum from a predefined
         codetable.
     """
-    crc_table = TABLE_XMODEM16
-    crc = 0
-    for i in something:
-        hb = int(crc / 256.0)
-        lb = crc - (256 * hb)
-        crc = crc_table[lb ^ ord(i)] ^ hb
-    return crc
+    return CRC16(something).crc
+
+
+def verify_checksums(items, poly=POLY_XMODEM16, suffix=None):
+    """
+    Verifies a lot of checksums at once.
+
+    @param items: iterable of (data, checksum) tuples, checksum being
+        an int or the two bytes of the digest.
+    @param suffix: data appended to every item before checking, e.g.
+        the ETX of a serial frame.
+    @returns: a list of bools, one per item.
+    """
+    table = get_codetable(poly)
+    suffix = _as_bytes(suffix or b'')
+    results = []
+    for data, checksum in items:
+        crc = 0
+        for b in _as_bytes(data):
+            crc = table[(crc ^ b) & 0xFF] ^ (crc >> 8)
+        for b in suffix:
+            crc = table[(crc ^ b) & 0xFF] ^ (crc >> 8)
+        if not isinstance(checksum, int):
+            checksum = checksum[0] | (checksum[1] << 8)
+        results.append(crc == checksum)
+    return results
@@ -6,7 +6,6 @@ Maybe create a small console program which allows us to:
 - see the representation of the packet
 - ability for incoming and outgoing
 """
-import sys
 from logging import error
 from time import sleep
 
@@ -18,11 +17,10 @@ from ecrterm.packets.apdu import Packets
 from ecrterm.packets.base_packets import (
     Authorisation, Completion, DisplayText, EndOfDay, Packet, PrintLine,
     Registration, ResetTerminal, StatusEnquiry, StatusInformation, PrintTextBlock)
-from ecrterm.packets.bmp import BCD
 from ecrterm.transmission._transmission import Transmission
-from ecrterm.transmission.signals import ACK, DLE, ETX, NAK, STX, TRANSMIT_OK
-from ecrterm.transmission.transport_serial import SerialTransport
-from ecrterm.transmission.transport_socket import SocketTransport
+from ecrterm.transmission.framing import SerialFrameDecoder
+from ecrterm.transmission.signals import ACK, DLE, NAK, STX, TRANSMIT_OK
+from ecrterm.transmission.registry import create_transport
 from ecrterm.utils import detect_pt_serial, is_stringlike
 
 
@@ -35,43 +33,55 @@ _logfile = A()
 
 
 def dismantle_serial_packet(data):
-    apdu = []
-    crc = None
-    i = 2
-    header = data[:i]
-    # header = bs2hl(header)
+    header = list(data[:2])
     # test if there was a transmission:
     if header == []:
         raise TransportLayerException('No Header')
     # test our header to be valid
     if header != [DLE, STX]:
         raise TransportLayerException('Header Error: %s' % header)
-    # read until DLE, ETX is reached.
-    dle = False
-    while not crc and i < len(data):
-        b = data[i]  # read a byte.
-        if b == ETX and dle:
-            # dle was set, and this is ETX, so we are at the end.
-            # we read the CRC now.
-            crc = [data[i + 1], data[i + 2]]
-            # and break
-            continue
-        elif b == DLE:
-            if not dle:
-                # this is a dle
-                dle = True
-                continue
-            else:
-                # this is the second dle. we take it.
-                dle = False
-        elif dle:
-            # dle was set, but we got no etx here.
-            # this seems to be an error.
-            raise Exception('DLE without sense detected.')
-        # we add this byte to our apdu.
-        apdu += [b]
-        i += 1
-    return crc, apdu
+    frames = SerialFrameDecoder().feed(bytes(data))
+    if not frames:
+        raise TransportLayerException('Incomplete serial packet.')
+    apdu, crc = frames[0]
+    return list(crc), list(apdu)
+
+
+#: longest APDU with the extended length 0xFF.
+MAX_APDU_LENGTH = 3 + 2 + 0xFFFF
+#: lines per PrintTextBlock for PTs which report no max_apdu_length.
+PRINT_LINES_PER_BLOCK = 10
+#: bytes of a PrintTextBlock APDU besides its lines: header with extended
+#: length, TLV bitmap and print texts container with up to 3 byte
+#: lengths each, closing attribute.
+_PRINT_TEXT_OVERHEAD = 5 + 4 + 4 + 3
+
+
+def chunk_print_lines(lines, max_apdu_length=None):
+    """
+    Splits (text, attribute) lines into chunks which fit into one
+    PrintTextBlock each. Without max_apdu_length, the chunks have
+    PRINT_LINES_PER_BLOCK lines, which any PT accepts.
+    """
+    if max_apdu_length is None:
+        return [lines[i:i + PRINT_LINES_PER_BLOCK]
+                for i in range(0, len(lines), PRINT_LINES_PER_BLOCK)]
+    budget = min(max_apdu_length, MAX_APDU_LENGTH) - _PRINT_TEXT_OVERHEAD
+    chunks = []
+    chunk = []
+    size = 0
+    for line in lines:
+        # tag 07 and 09 with their lengths, attribute byte.
+        entry = 5 + len(line[0][:PrintTextBlock.LINE_LENGTH])
+        if chunk and size + entry > budget:
+            chunks.append(chunk)
+            chunk = []
+            size = 0
+        chunk.append(line)
+        size += entry
+    if chunk:
+        chunks.append(chunk)
+    return chunks
 
 
 def parse_represented_data(data):
@@ -125,91 +135,85 @@ def ecr_log(data, incoming=False):
         print('| error in log')
 
 
-class ECR(object):
+class ECRBase(object):
+    """
+    State, packets and results shared by ECR and AsyncECR, which differ
+    in how they transmit.
+    """
     transmitter = None
     transport = None
     version = None
     terminal_id = None
     MAX_TEXT_LINES = 4
+    #: longest APDU the PT accepts, if it tells on registration.
+    max_apdu_length = None
     _state_registered = None
     _state_connected = None
 
-    def __init__(self, device='/dev/ttyUSB0', password='123456'):
-        """
-        Initializes an ECR object and connects to the serial device
-        given. Fails if Serial Device is not found.
-
-        You can access the Device on low level as the `transport`.
-        You can access the Protocol Handler on low level as
-        `transmission`.
-
-        Pass `socket://` prefixed IP address and port for TCP/IP
-        transport: `socket://192.168.1.163:20007`
-        """
-        if device.startswith('/') or device.startswith('COM'):
-            self.transport = SerialTransport(device)
-        elif device.startswith('socket://'):
-            self.transport = SocketTransport(uri=device)
-        # This turns on debug logging
-        # self.transport.slog = ecr_log
+    def _init_state(self, password):
         self.daylog = []
         self.daylog_template = ''
         self.history = []
         self.terminal_id = None
+        # frozen packets by their arguments, see prepared.
+        self._templates = {}
         # we save some states here.
         self._state_registered = False
         self._state_connected = False
         self.password = password
 
-        if self.transport.connect():
-            self.transmitter = Transmission(self.transport)
-            self._state_connected = True
-        else:
-            raise TransportConnectionFailed('ECR could not connect.')
-
     def __get_last(self):
         if self.transmitter is not None:
             return self.transmitter.last
     # !: Last is a short access for transmitter.last if possible.
     last = property(__get_last)
 
-    def register(self, config_byte, **kwargs):
+    def prepared(self, packet_class, *args, **kwargs):
         """
-        registers this ECR at the PT, locking menus
-        for real world conditions.
+        Returns packet_class(*args, **kwargs) for constant commands.
+        The packet is created and serialized (with its serial frame)
+        only once, later calls return a copy of that frozen packet.
         """
+        try:
+            key = (packet_class, args, frozenset(kwargs.items()))
+            template = self._templates.get(key)
+        except TypeError:
+            # unhashable arguments, nothing to prepare.
+            return packet_class(*args, **kwargs)
+        if template is None:
+            template = packet_class(*args, **kwargs).freeze()
+            self._templates[key] = template
+        return template.copy()
+
+    def _registration_packet(self, config_byte, kwargs):
         kwargs = dict(kwargs)
         if self.password:
             kwargs['password'] = self.password
         if config_byte is not None:
             kwargs['config_byte'] = config_byte
+        return self.prepared(Registration, **kwargs)
 
-        ret = self.transmit(Registration(**kwargs))
-
+    def _registration_result(self, ret):
         if ret == TRANSMIT_OK:
             # get the terminal-id if its there.
             for inc, packet in self.transmitter.last_history:
                 if inc and isinstance(packet, Completion):
-                    if 'tid' in packet.bitmaps_as_dict().keys():
-                        self.terminal_id = packet.bitmaps_as_dict()\
-                            .get('tid', BCD(0)).value()
+                    tid = packet.get_bitmap('tid')
+                    if tid is not None:
+                        self.terminal_id = tid.value()
+                    max_length = packet.tlv.get('max_apdu_length')
+                    if max_length:
+                        self.max_apdu_length = max_length
             # remember this.
             self._state_registered = True
         return ret
 
-    def register_unlocked(self):
-        """
-        registers to the PT, not locking the master menu on it.
-        do not use in production environment.
-        """
-        ret = self.transmit(
-            Registration(
-                password=self.password,
-                config_byte=Registration.generate_config(
-                    ecr_controls_admin=False),))
-        if ret == TRANSMIT_OK:
-            self._state_registered = True
-        return ret
+    def _unlocked_registration_packet(self):
+        return self.prepared(
+            Registration,
+            password=self.password,
+            config_byte=Registration.generate_config(
+                ecr_controls_admin=False),)
 
     def _end_of_day_info_packet(self, history=None):
         """
@@ -229,20 +233,13 @@ class ECR(object):
             eod_info['terminal-id'] = self.terminal_id
             return eod_info
 
-    def end_of_day(self, listener=None):
-        """
-        - sends an end of day packet.
-        - saves the log in `daylog`
-
-        @returns: 0 if there were no protocol errors.
-        """
-        # old_histoire = self.transmitter.history
-        # self.transmitter.history = []
-        # we send the packet
-        packet = EndOfDay(self.password)
+    def _end_of_day_packet(self, listener):
+        packet = self.prepared(EndOfDay, self.password)
         if listener:
             packet.register_response_listener(listener)
-        result = self.transmit(packet=packet)
+        return packet
+
+    def _end_of_day_result(self, result):
         # now save the log
         self.daylog = self.last_printout()
 
@@ -270,21 +267,16 @@ class ECR(object):
                 printout += [packet.fixed_values['text']]
         return printout
 
-    def payment(self, amount_cent=50, listener=None):
-        """
-        executes a payment in amount of cents.
-        @returns: True, if payment went through, or False if it was
-        canceled.
-        throws exceptions.
-        """
+    def _payment_packet(self, amount_cent, listener):
         packet = Authorisation(
             amount=amount_cent,  # in cents.
             currency_code=978,  # euro, only one that works, can be skipped.
         )
         if listener:
             packet.register_response_listener(listener)
-        code = self.transmit(packet=packet)
+        return packet
 
+    def _payment_result(self, code):
         if code == 0:
             # now check if the packet actually got what it wanted.
             if self.transmitter.last.completion:
@@ -297,10 +289,103 @@ class ECR(object):
             print('transmit error?')
         return False
 
+    def _display_text_packet(self, lines, duration, beeps):
+        lines = lines or ['Hello world!', ]
+        kw = {'display_duration': duration}
+        if beeps:
+            kw['beeps'] = int(beeps)
+        i = 1
+        for line in lines[:self.MAX_TEXT_LINES]:
+            kw['line%s' % i] = line
+            i += 1
+        return DisplayText(**kw)
+
+    def _status_result(self, errors):
+        if not errors:
+            if isinstance(self.last.completion, Completion):
+                # try to get version
+                if not self.version:
+                    self.version = self.last.completion.fixed_values.get(
+                        'sw-version', None)
+                return self.last.completion.fixed_values.get(
+                    'terminal-status', None)
+            # no completion means some error.
+        return False
+
+    def parse_str(self, s):
+        return parse_represented_data(s)
+
+
+class ECR(ECRBase):
+    def __init__(self, device='/dev/ttyUSB0', password='123456'):
+        """
+        Initializes an ECR object and connects to the serial device
+        given. Fails if Serial Device is not found.
+
+        You can access the Device on low level as the `transport`.
+        You can access the Protocol Handler on low level as
+        `transmission`.
+
+        Pass `socket://` prefixed IP address and port for TCP/IP
+        transport: `socket://192.168.1.163:20007`. Other transports can
+        be added with transmission.registry.register_transport.
+        """
+        self.transport = create_transport(device)
+        # This turns on debug logging
+        # self.transport.slog = ecr_log
+        self._init_state(password)
+
+        if self.transport.connect():
+            self.transmitter = Transmission(self.transport)
+            self._state_connected = True
+        else:
+            raise TransportConnectionFailed('ECR could not connect.')
+
+    def register(self, config_byte, **kwargs):
+        """
+        registers this ECR at the PT, locking menus
+        for real world conditions.
+        """
+        return self._registration_result(
+            self.transmit(self._registration_packet(config_byte, kwargs)))
+
+    def register_unlocked(self):
+        """
+        registers to the PT, not locking the master menu on it.
+        do not use in production environment.
+        """
+        ret = self.transmit(self._unlocked_registration_packet())
+        if ret == TRANSMIT_OK:
+            self._state_registered = True
+        return ret
+
+    def end_of_day(self, listener=None):
+        """
+        - sends an end of day packet.
+        - saves the log in `daylog`
+
+        @returns: 0 if there were no protocol errors.
+        """
+        # old_histoire = self.transmitter.history
+        # self.transmitter.history = []
+        # we send the packet
+        return self._end_of_day_result(
+            self.transmit(packet=self._end_of_day_packet(listener)))
+
+    def payment(self, amount_cent=50, listener=None):
+        """
+        executes a payment in amount of cents.
+        @returns: True, if payment went through, or False if it was
+        canceled.
+        throws exceptions.
+        """
+        return self._payment_result(
+            self.transmit(packet=self._payment_packet(amount_cent, listener)))
+
     def restart(self):
         """Restarts/resets the PT."""
         self._state_registered = False
-        return self.transmit(ResetTerminal())
+        return self.transmit(self.prepared(ResetTerminal))
 
     def reset(self):
         """
@@ -325,42 +410,21 @@ class ECR(object):
 
         @note: any error due to wrong strings given are not checked.
         """
-        lines = lines or ['Hello world!', ]
-        kw = {'display_duration': duration}
-        if beeps:
-            kw['beeps'] = int(beeps)
-        i = 1
-        for line in lines[:self.MAX_TEXT_LINES]:
-            kw['line%s' % i] = line
-            i += 1
-        return self.transmit(DisplayText(**kw))
+        return self.transmit(
+            self._display_text_packet(lines, duration, beeps))
 
     def print_text(self, lines):
-        lines_count = 10
-        if sys.version_info.major == 2:
-            chunks = [lines[x:x+lines_count] for x in xrange(0, len(lines), lines_count)]
-        else:
-            chunks = [lines[x:x + lines_count] for x in range(0, len(lines), lines_count)]
-
-        for chunk in chunks:
-            lines_packet = []
-
-            for line, attribute in chunk:
-                lines_packet.extend(Packet(text_lines=bs2hl(line[:24])).get_data_raw())
-                lines_packet.extend(Packet(attribute=attribute).get_data_raw())
-
-            if chunks[len(chunks) - 1] == chunk:
-                lines_packet.extend(Packet(attribute=0xff).get_data_raw())
-
-            texts_packet = Packet(print_texts=lines_packet).get_data_raw()
-
-            res = self.transmit(
-                PrintTextBlock(tlv=texts_packet)
-            )
-
+        """
+        prints (text, attribute) lines on the PT printer. The lines are
+        sent in as few PrintTextBlocks as max_apdu_length allows, see
+        chunk_print_lines.
+        """
+        chunks = chunk_print_lines(lines, self.max_apdu_length)
+        for i, chunk in enumerate(chunks):
+            res = self.transmit(PrintTextBlock.from_lines(
+                chunk, close=i == len(chunks) - 1))
             if res != TRANSMIT_OK:
                 return res
-
         return TRANSMIT_OK
 
     def status(self):
@@ -376,17 +440,8 @@ class ECR(object):
         to check for the status code:
             common.TERMINAL_STATUS_CODES.get( status, 'Unknown' )
         """
-        errors = self.transmit(StatusEnquiry(self.password))
-        if not errors:
-            if isinstance(self.last.completion, Completion):
-                # try to get version
-                if not self.version:
-                    self.version = self.last.completion.fixed_values.get(
-                        'sw-version', None)
-                return self.last.completion.fixed_values.get(
-                    'terminal-status', None)
-            # no completion means some error.
-        return False
+        return self._status_result(
+            self.transmit(self.prepared(StatusEnquiry, self.password)))
 
     def transmit(self, packet):
         """
@@ -451,13 +506,10 @@ class ECR(object):
 
     def detect_pt(self):
         # note: this only executes utils.detect_pt with the local ecrterm.
-        if type(self.transport) is SerialTransport:
+        if getattr(self.transport, 'supports_detection', False):
             return detect_pt_serial(timeout=2, silent=False, ecr=self)
         return True
 
-    def parse_str(self, s):
-        return parse_represented_data(s)
-
     def close(self):
         self.transport.close()
 
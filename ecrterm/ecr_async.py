@@ -0,0 +1,146 @@
+"""
+asyncio ECR.
+
+AsyncECR is the ECR for TCP/IP terminals on asyncio: the commands are
+coroutines, so one event loop can drive many terminals without a
+thread each::
+
+    async def pay(uri, amount):
+        async with AsyncECR(uri) as ecr:
+            await ecr.register(config_byte=None)
+            return await ecr.payment(amount)
+
+    loop.run_until_complete(asyncio.gather(
+        pay('socket://192.168.1.163:20007', 100),
+        pay('socket://192.168.1.164:20007', 250)))
+"""
+import asyncio
+from logging import info, warning
+
+from ecrterm.common import TERMINAL_STATUS_CODES
+from ecrterm.ecr import ECRBase, chunk_print_lines
+from ecrterm.exceptions import TransportConnectionFailed
+from ecrterm.packets.base_packets import (
+    PrintTextBlock, ResetTerminal, StatusEnquiry)
+from ecrterm.transmission._transmission import AsyncTransmission
+from ecrterm.transmission.signals import TRANSMIT_OK
+from ecrterm.transmission.transport_socket_async import AsyncSocketTransport
+
+
+class AsyncECR(ECRBase):
+    """
+    ECR with coroutines for its commands. It connects in connect (or
+    when used with async with), not when it is created.
+    """
+
+    def __init__(self, device, password='123456'):
+        if not device.startswith('socket://'):
+            raise ValueError('AsyncECR needs a socket:// device.')
+        self.transport = AsyncSocketTransport(device)
+        self._init_state(password)
+
+    async def connect(self):
+        if await self.transport.connect():
+            self.transmitter = AsyncTransmission(self.transport)
+            self._state_connected = True
+        else:
+            raise TransportConnectionFailed('ECR could not connect.')
+        return self
+
+    async def __aenter__(self):
+        return await self.connect()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    async def register(self, config_byte, **kwargs):
+        """
+        registers this ECR at the PT, locking menus
+        for real world conditions.
+        """
+        return self._registration_result(await self.transmit(
+            self._registration_packet(config_byte, kwargs)))
+
+    async def register_unlocked(self):
+        """
+        registers to the PT, not locking the master menu on it.
+        do not use in production environment.
+        """
+        ret = await self.transmit(self._unlocked_registration_packet())
+        if ret == TRANSMIT_OK:
+            self._state_registered = True
+        return ret
+
+    async def end_of_day(self, listener=None):
+        """
+        - sends an end of day packet.
+        - saves the log in `daylog`
+
+        @returns: 0 if there were no protocol errors.
+        """
+        return self._end_of_day_result(
+            await self.transmit(self._end_of_day_packet(listener)))
+
+    async def payment(self, amount_cent=50, listener=None):
+        """
+        executes a payment in amount of cents.
+        @returns: True, if payment went through, or False if it was
+        canceled.
+        """
+        return self._payment_result(
+            await self.transmit(self._payment_packet(amount_cent, listener)))
+
+    async def restart(self):
+        """Restarts/resets the PT."""
+        self._state_registered = False
+        return await self.transmit(self.prepared(ResetTerminal))
+
+    async def show_text(self, lines=None, duration=5, beeps=0):
+        """displays a text on the PT screen for duration of seconds."""
+        return await self.transmit(
+            self._display_text_packet(lines, duration, beeps))
+
+    async def print_text(self, lines):
+        """prints (text, attribute) lines on the PT printer."""
+        chunks = chunk_print_lines(lines, self.max_apdu_length)
+        for i, chunk in enumerate(chunks):
+            res = await self.transmit(PrintTextBlock.from_lines(
+                chunk, close=i == len(chunks) - 1))
+            if res != TRANSMIT_OK:
+                return res
+        return TRANSMIT_OK
+
+    async def status(self):
+        """
+        executes a status enquiry. also sets self.version if not set.
+        see ECR.status for the return values.
+        """
+        return self._status_result(await self.transmit(
+            self.prepared(StatusEnquiry, self.password)))
+
+    async def transmit(self, packet):
+        """transmits a packet, see ECR.transmit."""
+        if self.transport.insert_delays:
+            await asyncio.sleep(0.2)
+        return await self.transmitter.transmit(packet)
+
+    async def wait_for_status(self, interval=2):
+        """waits until status() returns 0 (or False/None)."""
+        status = await self.status()
+        while status:
+            info(TERMINAL_STATUS_CODES.get(status, 'Unknown Status'))
+            await asyncio.sleep(interval)
+            status = await self.status()
+
+    async def listen(self, timeout=15):
+        """Dev function to simply listen."""
+        while True:
+            try:
+                ok, message = await self.transport.receive(timeout)
+                if ok and message:
+                    return message
+            except Exception as e:
+                warning('listen: %s', e)
+
+    async def close(self):
+        await self.transport.close()
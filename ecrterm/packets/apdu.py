@@ -1,13 +1,12 @@
 """Classes and Functions which deal with the APDU Layer."""
-import struct
 from logging import debug
 
-from six.moves import range
-
 from ecrterm.conv import toBytes
 from ecrterm.exceptions import NotEnoughData
-from ecrterm.packets.bitmaps import BITMAPS_ARGS
-from ecrterm.packets.bmp import BMP, int_word_split
+from ecrterm.packets.bitmaps import (
+    BITMAPS_ARGS, DECODERS, decode_bitmaps, scan_bitmaps)
+from ecrterm.packets.bmp import read_bitmap
+from ecrterm.packets.writer import PacketWriter
 from ecrterm.utils import is_stringlike
 
 
@@ -28,48 +27,129 @@ class _PacketRegister:
 
     def __init__(self):
         self.packets = {}
+        # dispatch table: one 256 entry row per command class, indexed
+        # by command instruction. fallbacks are already filled in.
+        self._table = [None] * 256
+        self._fallbacks = {}
 
     def register(self, packet_class):
         if packet_class.cmd_class:
+            cc = packet_class.cmd_class
             # cmd_class is needed to be registered.
             if packet_class.cmd_instr is not None:
                 # this packet is a specific tuple of instructions.
                 # it will be registered as such
-                key_str = '%s_%s' % (
-                    hex(packet_class.cmd_class), hex(packet_class.cmd_instr))
-                # debug
-                debug('Registered Class %s for Command Tuple ( %s, %s )'
-                      % (str(packet_class),
-                         hex(packet_class.cmd_class),
-                         hex(packet_class.cmd_instr)))
+                key_str = '%s_%s' % (hex(cc), hex(packet_class.cmd_instr))
+                debug('Registered Class %s for Command Tuple ( %#x, %#x )',
+                      packet_class, cc, packet_class.cmd_instr)
             else:
                 # this packet handles a variety of supercommands
-                key_str = '%s' % hex(packet_class.cmd_class)
-                # debug
-                debug('Registered Class %s for Super Command Fallback ( %s )'
-                      % (str(packet_class),
-                         hex(packet_class.cmd_class)))
+                key_str = '%s' % hex(cc)
+                debug('Registered Class %s for Super Command Fallback '
+                      '( %#x )', packet_class, cc)
             self.packets[key_str] = packet_class
+            self._compile(cc, packet_class)
+
+    def _compile(self, cc, packet_class):
+        """Puts a registered class into the dispatch table."""
+        row = self._table[cc]
+        if packet_class.cmd_instr is None:
+            old_fallback = self._fallbacks.get(cc)
+            self._fallbacks[cc] = packet_class
+            if row is None:
+                self._table[cc] = [packet_class] * 256
+            else:
+                for ci in range(256):
+                    if row[ci] is old_fallback:
+                        row[ci] = packet_class
+        else:
+            if row is None:
+                row = self._table[cc] = [self._fallbacks.get(cc)] * 256
+            row[packet_class.cmd_instr] = packet_class
 
     def detect(self, datastream):
-        def _convert(dt):
-            for x in dt:
-                if isinstance(x, int):
-                    yield x
-                    continue
+        cc, ci = datastream[0], datastream[1]
+        if not isinstance(cc, int):
+            cc, ci = ord(cc), ord(ci)
+        row = self._table[cc]
+        if row is None:
+            return None
+        return row[ci]
+
 
-                if isinstance(x, str):
-                    yield ord(x)
-                    continue
+Packets = _PacketRegister()
 
-        datastream2 = list(_convert(datastream))
-        cc, ci = datastream2[:2]
-        return self.packets.get(
-            '%s_%s' % (hex(cc), hex(ci)),
-            self.packets.get('%s' % (hex(cc)), None))
 
+def _invalidating(method):
+    """Wraps a mutating container method to invalidate its owner."""
+    def wrapper(self, *args, **kwargs):
+        self._owner.invalidate()
+        return method(self, *args, **kwargs)
+    wrapper.__name__ = method.__name__
+    return wrapper
 
-Packets = _PacketRegister()
+
+class _TrackedDict(dict):
+    """A dict which tells its packet when it has been changed."""
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner, *args, **kwargs):
+        self._owner = owner
+        super(_TrackedDict, self).__init__(*args, **kwargs)
+
+
+class _TrackedList(list):
+    """A list which tells its packet when it has been changed."""
+    __slots__ = ('_owner',)
+
+    def __init__(self, owner, *args):
+        self._owner = owner
+        super(_TrackedList, self).__init__(*args)
+
+
+for _name in ('__setitem__', '__delitem__', 'clear', 'pop', 'popitem',
+              'setdefault', 'update'):
+    setattr(_TrackedDict, _name, _invalidating(getattr(dict, _name)))
+for _name in ('__setitem__', '__delitem__', '__iadd__', '__imul__', 'append',
+              'extend', 'insert', 'pop', 'remove', 'clear', 'sort',
+              'reverse'):
+    setattr(_TrackedList, _name, _invalidating(getattr(list, _name)))
+del _name
+
+
+class _FieldIndex(object):
+    """Positions of the bitmaps of a packet by key and by id."""
+    __slots__ = ('keys', 'ids', 'as_dict')
+
+    def __init__(self):
+        self.keys = {}
+        self.ids = {}
+        self.as_dict = None
+
+    def add(self, position, bmp_id, key):
+        # like bitmaps_as_dict always did, the last bitmap wins.
+        self.keys[key] = position
+        self.ids[bmp_id] = position
+
+
+_INTERNAL_SLOTS = (
+    '_wire', '_bitmaps', '_bitmap_data', '_bitmap_spans', '_bitmap_cache',
+    '_field_index', '_tlv_view', '_encoded', '_frozen')
+
+
+#: slot names of the packet classes, see _slot_names.
+_SLOT_NAMES = {}
+
+
+def _slot_names(cls):
+    """All slots of cls and its bases, but __dict__ and __weakref__."""
+    names = _SLOT_NAMES.get(cls)
+    if names is None:
+        names = _SLOT_NAMES[cls] = tuple(
+            name for klass in cls.__mro__
+            for name in klass.__dict__.get('__slots__', ())
+            if name not in ('__dict__', '__weakref__'))
+    return names
 
 
 class APDUPacket(object):
@@ -82,15 +162,45 @@ class APDUPacket(object):
     cmd_instr = None
     allowed_bitmaps = None  # None=All, [] = None.
     fixed_arguments = []
-    fixed_values = {}
+    # fixed_values of a class are the defaults of its packets, see
+    # __init_subclass__.
+    _default_fixed_values = {}
+    #: received bitmaps are only decoded when they are accessed.
+    lazy_bitmaps = True
+    # internal state, all None after __init__:
+    # _wire: cache of the serialized data (length and data).
+    # _bitmap_data, _bitmap_spans, _bitmap_cache: undecoded bitmap data
+    # of a parsed packet, its spans and the bitmaps decoded from it so
+    # far, by span index.
+    # _field_index: _FieldIndex of the bitmaps, built on first lookup.
+    # _tlv_view: decoded TLV container, see Packet.tlv
+    # _encoded: wire data encoded by transports, see encode_with.
+    # _frozen: see freeze.
+    # Subclasses declare __slots__ as well, their instances have no
+    # __dict__ unless they need one.
+    __slots__ = _INTERNAL_SLOTS + (
+        'fixed_values', 'args', 'kwargs', '__weakref__')
+    #: public attributes which do not change the serialized data.
+    _state_attributes = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # a class attribute would hide the fixed_values slot.
+        if 'fixed_values' in cls.__dict__:
+            cls._default_fixed_values = cls.__dict__['fixed_values']
+            del cls.fixed_values
 
     # Initializing
     def __init__(self, *args, **kwargs):
+        for name in _INTERNAL_SLOTS:
+            object.__setattr__(self, name, None)
+        for name in self._state_attributes:
+            object.__setattr__(self, name, None)
         num_fixed = len(self.fixed_arguments or [])
         num_given = len(args or [])
         fvalues = {}
-        if self.fixed_values:
-            fvalues.update(self.fixed_values)
+        if self._default_fixed_values:
+            fvalues.update(self._default_fixed_values)
         i = 0
         while (i < num_given) and (i < num_fixed):
             #
@@ -104,15 +214,117 @@ class APDUPacket(object):
             else:
                 key, klass, info = BITMAPS_ARGS.get(k, (None, None, None))
                 if klass:
-                    bmp = klass(v)
-                    bmp._id = key
-                    bmp._descr = info
-                    bitmaps += [bmp]
+                    bitmaps += [klass(v)]
         self.fixed_values = fvalues
         self.args = args or []
         self.kwargs = kwargs or {}
         self.bitmaps = bitmaps
 
+    def __setattr__(self, name, value):
+        # any change of public state makes the serialized data stale.
+        if name == 'fixed_values' and value is not None:
+            if not (isinstance(value, _TrackedDict) and
+                    value._owner is self):
+                value = _TrackedDict(self, value)
+        elif name == 'bitmaps' and value is not None:
+            if not (isinstance(value, _TrackedList) and
+                    value._owner is self):
+                value = _TrackedList(self, value)
+        if not name.startswith('_') and name not in self._state_attributes:
+            if self._frozen:
+                raise TypeError('%s is frozen.' % type(self).__name__)
+            object.__setattr__(self, '_wire', None)
+            object.__setattr__(self, '_encoded', None)
+        object.__setattr__(self, name, value)
+
+    def get_bitmaps(self):
+        if self._bitmaps is None and self._bitmap_data is not None:
+            # first access after parsing: decode everything now.
+            spans = self._get_bitmap_spans()
+            bitmaps = [self._decode_span(i) for i in range(len(spans))]
+            self._bitmaps = _TrackedList(self, bitmaps)
+            self._bitmap_data = None
+            self._bitmap_spans = None
+            self._bitmap_cache = None
+        return self._bitmaps
+
+    def set_bitmaps(self, bitmaps):
+        self._bitmaps = bitmaps
+        self._field_index = None
+        self._tlv_view = None
+        self._bitmap_data = None
+        self._bitmap_spans = None
+        self._bitmap_cache = None
+    bitmaps = property(get_bitmaps, set_bitmaps)
+
+    def _get_bitmap_spans(self):
+        if self._bitmap_spans is None:
+            self._bitmap_spans = scan_bitmaps(self._bitmap_data)
+        return self._bitmap_spans
+
+    def _decode_span(self, index):
+        cache = self._bitmap_cache
+        if cache is None:
+            cache = self._bitmap_cache = {}
+        bmp = cache.get(index)
+        if bmp is None:
+            start, end = self._bitmap_spans[index]
+            bmp = cache[index] = read_bitmap(
+                self._bitmap_data, start, DECODERS)[0]
+        return bmp
+
+    def _get_field_index(self):
+        index = self._field_index
+        if index is None:
+            index = _FieldIndex()
+            if self._bitmaps is None and self._bitmap_data is not None:
+                # a parsed packet: index the spans, decode nothing.
+                data = self._bitmap_data
+                for position, (start, end) in enumerate(
+                        self._get_bitmap_spans()):
+                    bmp_id = data[start]
+                    index.add(position, bmp_id, DECODERS[bmp_id][1])
+            else:
+                for position, bmp in enumerate(self.bitmaps or ()):
+                    index.add(position, bmp._id, bmp._key)
+            self._field_index = index
+        return index
+
+    def _bitmap_at(self, position):
+        if self._bitmaps is None and self._bitmap_data is not None:
+            return self._decode_span(position)
+        return self._bitmaps[position]
+
+    def get_bitmap(self, key, default=None):
+        """
+        Returns the bitmap named `key` (e.g. 'amount'), or `default`.
+        On a parsed packet only this bitmap is decoded.
+        """
+        position = self._get_field_index().keys.get(key)
+        if position is None:
+            return default
+        return self._bitmap_at(position)
+
+    def get_bitmap_by_id(self, bmp_id, default=None):
+        """Returns the bitmap with the code `bmp_id`, or `default`."""
+        position = self._get_field_index().ids.get(bmp_id)
+        if position is None:
+            return default
+        return self._bitmap_at(position)
+
+    def invalidate(self):
+        """
+        Forget the serialized data. Call this if you changed a bitmap
+        in place, changes to `fixed_values`, `bitmaps` and attributes
+        are noticed automatically.
+        """
+        if self._frozen:
+            raise TypeError('%s is frozen.' % type(self).__name__)
+        self._wire = None
+        self._encoded = None
+        self._field_index = None
+        self._tlv_view = None
+
     def validate(self):
         # look thru all arguments: all needed fixed arguments here?
         # look thru all bitmaps: all bitmaps allowed?
@@ -137,7 +349,7 @@ class APDUPacket(object):
             if data_len > 65535:
                 raise NotImplementedError(
                     "APDU Data length cannot be bigger than 2 bytes.")
-            return [0xFF, ] + int_word_split(data_len)
+            return [0xFF, data_len & 0xFF, data_len >> 8]
         return [data_len]
 
     def enrich_fixed(self):
@@ -145,52 +357,137 @@ class APDUPacket(object):
         fixed arguments should be enriched here into the datastream.
         as to speak: serialized.
 
-        by default, it will try to serialize fixed_arguments from fixed_values
+        returns the fixed data written by write_fixed as a list of
+        bytes. packets do not override this, but write_fixed.
+        """
+        writer = PacketWriter()
+        self.write_fixed(writer)
+        return list(writer.buffer)
+
+    def write_fixed(self, writer):
+        """
+        Serializes the fixed arguments into a PacketWriter. Packets with
+        fixed data of their own override this.
+
+        by default, it will try to serialize fixed_arguments from
+        fixed_values.
         """
         self.validate()
-        ds = []
         if self.fixed_arguments and self.fixed_values:
             # we have fixed arguments here
-            for i in range(len(self.fixed_arguments)):
-                val = self.fixed_values.get(self.fixed_arguments[i], None)
+            for name in self.fixed_arguments:
+                val = self.fixed_values.get(name, None)
                 if val:
                     if is_stringlike(val):
-                        val = toBytes(val)
-                    elif isinstance(val, list):
-                        pass
+                        writer.write(toBytes(val))
+                    elif isinstance(val, (list, bytearray, memoryview)):
+                        writer.write(val)
                     else:
-                        val = [val, ]
-                    # now just save it into ds
-                    ds += val
-        return ds
+                        writer.write_byte(val)
 
     def introspect_fixed(self):
         """Return a description of your fixed data."""
         return self.fixed_values
 
-    def get_data_raw(self):
-        # getting the data of a packet means it is serialized into bytes.
-        data = []
-        # first, lets get the enriched fixed arguments:
-        data += self.enrich_fixed()
+    def write_data(self, writer):
+        """Serializes fixed arguments and bitmaps into a PacketWriter."""
+        self.write_fixed(writer)
+        if self._bitmaps is None and self._bitmap_data is not None \
+                and not self._bitmap_cache:
+            # nothing decoded, nothing changed: the received data is fine.
+            writer.write(self._bitmap_data)
+            return
         # now serialise all our bitmaps.
         # try to order our bitmaps after allowed_bitmaps maybe?
         for bitmap in self.bitmaps:
-            # is bitmap allowed?
-            # if y,
-            data += bitmap.dump()
-        # last: insert the length
-        return data
+            bitmap.dump_into(writer)
+
+    def get_data_raw(self):
+        # getting the data of a packet means it is serialized into bytes.
+        writer = PacketWriter()
+        self.write_data(writer)
+        return list(writer.buffer)
+
+    def get_wire(self):
+        """
+        Returns the whole APDU as bytes. The packet is serialized only
+        once until it changes.
+        """
+        if self._wire is None:
+            writer = PacketWriter()
+            writer.write_byte(self.cmd_class)
+            writer.write_byte(self.cmd_instr or 0)
+            mark = writer.begin_length()
+            self.write_data(writer)
+            # last: insert the length
+            writer.end_length(mark)
+            self._wire = writer.getvalue()
+        return self._wire
+
+    def encode_with(self, encoder):
+        """
+        Returns encoder(wire data), e.g. the serial frame of the packet.
+        The result is cached until the packet changes.
+        """
+        encoded = self._encoded
+        if encoded is None:
+            encoded = self._encoded = {}
+        ret = encoded.get(encoder)
+        if ret is None:
+            ret = encoded[encoder] = encoder(self.get_wire())
+        return ret
+
+    def freeze(self):
+        """
+        Serializes the packet for good, for packets which are sent
+        again and again. A frozen packet can not be changed anymore,
+        neither can its copies. Returns the packet.
+        """
+        self.get_wire()
+        if self._encoded is None:
+            # shared with the copies, so they reuse frames.
+            self._encoded = {}
+        self._frozen = True
+        return self
+
+    def copy(self):
+        """
+        Returns a shallow copy of the packet without its state (like
+        the completion). The copy of a frozen packet shares the
+        serialized data, any other copy gets containers of its own.
+        """
+        clone = object.__new__(type(self))
+        for name in _slot_names(type(self)):
+            try:
+                object.__setattr__(clone, name, getattr(self, name))
+            except AttributeError:
+                pass
+        if hasattr(self, '__dict__'):
+            clone.__dict__.update(self.__dict__)
+        for name in self._state_attributes:
+            object.__setattr__(clone, name, None)
+        if not self._frozen:
+            # the tracked containers would invalidate the original.
+            for name in ('_wire', '_encoded', '_field_index', '_tlv_view'):
+                object.__setattr__(clone, name, None)
+            if self.fixed_values is not None:
+                clone.fixed_values = dict(self.fixed_values)
+            if self._bitmaps is not None:
+                object.__setattr__(
+                    clone, '_bitmaps', _TrackedList(clone, self._bitmaps))
+            if self._bitmap_cache is not None:
+                clone._bitmap_cache = dict(self._bitmap_cache)
+            clone.kwargs = dict(self.kwargs)
+        return clone
 
     def get_data(self):
-        data = self.get_data_raw()
-        return self.data_length(data) + data
+        return list(self.get_wire()[2:])
 
     def to_list(self):
-        return [self.cmd_class, self.cmd_instr or 0] + self.data
+        return list(self.get_wire())
 
     def to_bytes(self):
-        return struct.pack('BB{}B'.format(len(self.data)), self.cmd_class, self.cmd_instr, *self.data)
+        return self.get_wire()
 
     #############################################
     # Parsing ###################################
@@ -218,7 +515,6 @@ class APDUPacket(object):
         # now we introspect data
 
         pos = 0
-        bitmaps = []
         if blob[pos] == 0xff:
             # length field is next two bytes.
             # @todo: could be wrong:
@@ -238,29 +534,53 @@ class APDUPacket(object):
         # parsed first.
         data = self.consume_fixed(data, length)
         # step 2: bitmaps.
-        while data:
-            bmp, data = BMP.read_stream(data)
-            bitmaps += [bmp]
-        self.bitmaps = bitmaps
+        if self.lazy_bitmaps:
+            # only remember where they are, see get_bitmaps. scanning
+            # them here raises KeyError for unknown bitmaps right away.
+            spans = scan_bitmaps(data)
+            self.bitmaps = None
+            self._bitmap_data = data
+            self._bitmap_spans = spans
+        else:
+            self.bitmaps = decode_bitmaps(data)
     data = property(get_data, set_data)
 
     @classmethod
     def parse(cls, blob=''):
+        if isinstance(blob, (bytes, bytearray, memoryview)):
+            return cls.parse_buffer(blob)
         if is_stringlike(blob):
             # lets convert our string into a bytelist.
             blob = toBytes(blob)
         if type(blob) is list:
-            # allright.
-            # first we detect our packetclass
-            PacketClass = Packets.detect(blob[:2])
-            if PacketClass:
-                instance = PacketClass()
-                # fix for multipackets:
-                if instance.cmd_instr is None:
-                    instance.cmd_instr = blob[1]
-                instance.data = blob[2:]
-                if not instance.validate():
-                    debug('Validation Error')
-                return instance
-            else:
-                debug('Unknown Packet')
+            return cls._parse_apdu(blob)
+
+    @classmethod
+    def parse_buffer(cls, buffer):
+        """
+        Parses a packet from bytes, bytearray or memoryview without
+        converting it into a list of ints: fixed values and bitmaps keep
+        memoryview slices into `buffer`, so the buffer lives as long as
+        the packet.
+        """
+        blob = memoryview(buffer)
+        if blob.format != 'B':
+            blob = blob.cast('B')
+        return cls._parse_apdu(blob)
+
+    @classmethod
+    def _parse_apdu(cls, blob):
+        """Parses a list of ints or a memoryview, see parse."""
+        # first we detect our packetclass
+        PacketClass = Packets.detect(blob)
+        if PacketClass:
+            instance = PacketClass()
+            # fix for multipackets:
+            if instance.cmd_instr is None:
+                instance.cmd_instr = blob[1]
+            instance.data = blob[2:]
+            if not instance.validate():
+                debug('Validation Error')
+            return instance
+        else:
+            debug('Unknown Packet')
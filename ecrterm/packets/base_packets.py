@@ -1,22 +1,96 @@
 import datetime
+from collections.abc import Mapping
 
 from ecrterm.common import ERRORCODES, INTERMEDIATE_STATUS_CODES
 from ecrterm.conv import bs2hl, toHexString
+from ecrterm.packets import tlv_tags
 from ecrterm.packets.apdu import APDUPacket, Packets
-from ecrterm.packets.bmp import BCD, LLLVAR
-from ecrterm.packets.tlv_parser import TlvParser
+from ecrterm.packets.bmp import LLLVAR
+from ecrterm.packets.records import TOTALS_CARDS, decode_record
+from ecrterm.packets.tlv import TlvBuilder
+from ecrterm.packets.tlv_parser import find_tlv
+
+
+class PacketFields(Mapping):
+    """
+    Read only view of the bitmaps of a packet by key::
+
+        packet.fields.amount.value()
+        'tid' in packet.fields
+    """
+    __slots__ = ('_packet',)
+
+    def __init__(self, packet):
+        self._packet = packet
+
+    def __getitem__(self, key):
+        bmp = self._packet.get_bitmap(key)
+        if bmp is None:
+            raise KeyError(key)
+        return bmp
+
+    def __getattr__(self, key):
+        bmp = self._packet.get_bitmap(key)
+        if bmp is None:
+            raise AttributeError(key)
+        return bmp
+
+    def __contains__(self, key):
+        return key in self._packet._get_field_index().keys
+
+    def __iter__(self):
+        return iter(self._packet._get_field_index().keys)
+
+    def __len__(self):
+        return len(self._packet._get_field_index().keys)
 
 
 class Packet(APDUPacket):
+    __slots__ = ('completion', 'response_listener')
     wait_for_completion = False
-    completion = None
-    response_listener = None
+    _state_attributes = ('completion', 'response_listener')
+
+    @property
+    def fields(self):
+        return PacketFields(self)
+
+    def get_tlv_data(self):
+        """
+        Returns the data of the TLV container of this packet, or None.
+        By default this is the tlv bitmap (06).
+        """
+        bmp = self.get_bitmap('tlv')
+        if bmp is None:
+            return None
+        return bmp._data
+
+    @property
+    def tlv(self):
+        """
+        The TLV container decoded into a tlv_tags.TlvView, decoded once
+        until the packet changes. Empty if there is no TLV data.
+        """
+        view = self._tlv_view
+        if view is None:
+            data = self.get_tlv_data()
+            if data is None:
+                view = tlv_tags.EMPTY
+            else:
+                view = tlv_tags.decode_tlv(data)
+            self._tlv_view = view
+        return view
 
     def bitmaps_as_dict(self):
-        ret = {}
-        for r in self.bitmaps:
-            ret[r._key] = r
-        return ret
+        """
+        Returns a dict of all bitmaps by key. The dict is kept until the
+        bitmaps change, so do not modify it.
+        """
+        index = self._get_field_index()
+        if index.as_dict is None:
+            index.as_dict = dict(
+                (key, self._bitmap_at(position))
+                for key, position in index.keys.items())
+        return index.as_dict
 
     def __repr__(self):
         bitmap_stati = [{b._key: b.value()} for b in self.bitmaps]
@@ -110,6 +184,7 @@ class Registration(Packet):
     arguments: password, cc, config_byte
     bitmaps: service_byte
     """
+    __slots__ = ()
     cmd_class = 0x6
     cmd_instr = 0x0
     fixed_arguments = ['password', 'config_byte', 'cc']
@@ -137,7 +212,7 @@ class Registration(Packet):
                 [toHexString([c]) for c in data[0:3]])
             self.fixed_values['config_byte'] = data[3]
         if length >= 6:
-            self.fixed_values['cc'] = data[3:5]
+            self.fixed_values['cc'] = list(data[4:6])
         # rest is bitmaps
         if length > 6:
             return data[6:]
@@ -203,6 +278,7 @@ Packets.register(Registration)
 
 class Kassenbericht(Packet):
     """A cardcomplete packet?"""
+    __slots__ = ()
     cmd_class = 0x0f
     cmd_instr = 0x10
     fixed_arguments = ['password', ]
@@ -221,6 +297,7 @@ Packets.register(Kassenbericht)
 
 
 class EndOfDay(Packet):
+    __slots__ = ()
     cmd_instr = 0x50
     fixed_arguments = ['password', ]
     fixed_values = {'password': '123456', }
@@ -239,6 +316,7 @@ Packets.register(EndOfDay)
 
 class LogOff(Packet):
     """06 02 Log Off"""
+    __slots__ = ()
     cmd_instr = 0x2
 
 
@@ -251,6 +329,7 @@ class Initialisation(Packet):
     With this command the ECR forces the PT to execute a
     Network-Initialization.
     """
+    __slots__ = ()
     cmd_instr = 0x93
     fixed_arguments = ['password']
     fixed_values = {'password': '123456'}
@@ -276,6 +355,7 @@ class DisplayText(Packet):
     bitmap: F0, duration, 0 = forever
     F1-F8: text, 7bit ascii
     """
+    __slots__ = ()
     cmd_instr = 0xe0
     allowed_bitmaps = [
         'display_duration', 'line1', 'line2', 'line3', 'line4', 'line5',
@@ -290,6 +370,7 @@ class DisplayTextIntInput(Packet):
     06 E2
     text output with numerical input.
     """
+    __slots__ = ()
     cmd_instr = 0xe2
 
 
@@ -302,6 +383,7 @@ class AbortCommand(Packet):
     * Sent by ECR to abort a running transaction in the PT
     * Allowed without master rights, but only for some commands
     """
+    __slots__ = ()
     cmd_class = 0x06
     cmd_instr = 0xb0
 
@@ -315,27 +397,23 @@ class Completion(Packet):
     * Sent to the ECR to signal him getting master rights back.
     * PT>ECR
     """
+    __slots__ = ()
     cmd_instr = 0xf
 
     def consume_fixed(self, data, length):
         if length == 1:
             self.fixed_values['terminal_status'] = data[0]
             return []
-        elif length >= 2:
-            try:
-                # try to LLLVAR parse:
-                l_var = LLLVAR()
-                rest = l_var.parse(data)
-                self.fixed_values['sw-version'] = l_var.value()
-                if len(rest) >= 1:
-                    self.fixed_values['terminal-status'] = rest[0]
-                    # FIXME Ignores TLV components
-                    return []
-                else:
-                    self.fixed_values = {}
-                    return data
-            except Exception:
-                pass
+        elif length >= 2 and 0xF0 <= data[0] <= 0xF9:
+            # software version as LLLVAR, terminal status, then bitmaps
+            # like the TLV container.
+            l_var = LLLVAR()
+            offset = l_var.parse_at(data, 0)
+            self.fixed_values['sw-version'] = l_var.value()
+            if offset < len(data):
+                self.fixed_values['terminal-status'] = data[offset]
+                return data[offset + 1:]
+            return []
         return data
 
 
@@ -348,8 +426,12 @@ class Abort(Packet):
     usually length 1, it can have data, which represents a one byte error
     code
     """
+    __slots__ = ('error_code',)
     cmd_instr = 0x1E
-    error_code = 0
+
+    def __init__(self, *args, **kwargs):
+        super(Abort, self).__init__(*args, **kwargs)
+        self.error_code = 0
 
     def consume_fixed(self, data, length):
         # length should be 1, and data should contain the error code.
@@ -358,11 +440,10 @@ class Abort(Packet):
             return data[1:]
         return []
 
-    def enrich_fixed(self):
+    def write_fixed(self, writer):
         """Enrich the serialized data with fixed argument error_code."""
         if self.error_code:
-            return [int(self.error_code)]
-        return []
+            writer.write_byte(int(self.error_code))
 
 
 Packets.register(Abort)
@@ -370,11 +451,17 @@ Packets.register(Abort)
 # --- 0x04 XXXX ---
 
 
+#: result keys of the cards in records.TOTALS
+_TOTALS_KEYS = [
+    (card, card.replace('_', '-')) for card in TOTALS_CARDS]
+
+
 class StatusInformation(Packet):
     """
     04 0F
     this one is important so i mark it here.
     """
+    __slots__ = ()
     cmd_class = Packets.CMD_PT
     cmd_instr = 0x0f
 
@@ -396,87 +483,65 @@ class StatusInformation(Packet):
           receipts
         """
         ret = {}
-        # create a dictionary of bitmaps:
-        bdict = self.bitmaps_as_dict()
+        bdict = self.fields
         # at least amount should be present:
-        if 'amount' not in bdict.keys():
+        if 'amount' not in bdict:
             return {}
         else:
             ret = {'amount': int(bdict['amount'].value()), }
         # bitmap 0x60 (totals) contains the required information.
         # another bitmap (amount) holds the amount
-        if 'totals' not in bdict.keys():
+        if 'totals' not in bdict:
             # this packet holds no detail information but an amount.
             return ret
-        totals = bdict['totals']
-        totals_list = totals.value()
-        # totals_list = str(bdict['totals'])
-        # now we build our real data our of it.
+        totals = self.get_totals()
 
         # rebuild date and time.
+        # time holds simply HHMMSS (BCD)
+        # date holds simply mmdd (BCD)
         my_time = None
         my_date = None
-        if 'time' in bdict.keys():
-            # print bdict['time'].value()
+        if 'time' in bdict:
             mt = str(bdict['time'].value())
             my_time = datetime.time(
                 hour=int(mt[0:2]), minute=int(mt[2:4]), second=int(mt[4:6]))
-        if 'date_day' in bdict.keys():
-            # print bdict['date'].value()
+        if 'date_day' in bdict:
             md = str(bdict['date_day'].value())
             my_date = datetime.date(
                 year=datetime.datetime.now().year, month=int(md[0:2]),
                 day=int(md[2:4]))
+        amount = ret['amount']
         ret = {
-            'receipt-number-start':
-                BCD.as_int(BCD.decode_bcd(totals_list[0:2])),
-            'receipt-number-end':
-                BCD.as_int(BCD.decode_bcd(totals_list[2:4])),
-            'number-ec-card': bs2hl(totals_list[4])[0],
-            'turnover-ec-card':
-                BCD.as_int(BCD.decode_bcd(totals_list[5:5 + 6])),
-            'number-jcb': bs2hl(totals_list[11])[0],
-            'turnover-jcb': BCD.as_int(BCD.decode_bcd(totals_list[12:12 + 6])),
-            'number-eurocard': bs2hl(totals_list[18])[0],
-            'turnover-eurocard':
-                BCD.as_int(BCD.decode_bcd(totals_list[19:19 + 6])),
-            'number-amex': bs2hl(totals_list[25])[0],
-            'turnover-amex':
-                BCD.as_int(BCD.decode_bcd(totals_list[26:26 + 6])),
-            'number-visa': bs2hl(totals_list[32])[0],
-            'turnover-visa':
-                BCD.as_int(BCD.decode_bcd(totals_list[33:33 + 6])),
-            'number-diners': bs2hl(totals_list[39])[0],
-            'turnover-diners':
-                BCD.as_int(BCD.decode_bcd(totals_list[40:40 + 6])),
-            'number-remaining': bs2hl(totals_list[46])[0],
-            'turnover-remaining':
-                BCD.as_int(BCD.decode_bcd(totals_list[47:47 + 6])),
-            'amount': int(bdict['amount'].value()),
-            'turnover-amount': int(bdict['amount'].value()),
+            'receipt-number-start': totals.receipt_number_start,
+            'receipt-number-end': totals.receipt_number_end,
+            'amount': amount,
+            'turnover-amount': amount,
+            'float-amount': amount / 100.0,
             'date': my_date,
             'time': my_time,
-            'number-total': 0,
         }
-        # time holds simply HHMMSS (BCD)
-        # date holds simply mmdd (BCD)
-
-        # adding a formatted version
-        tn = 0
-        float_version = {}
-        for key, value in ret.items():
-            if key.startswith('turnover-'):
-                key_id = key.replace('turnover-', '')
-                # add a key with a formatted representation.
-                v = float(value) / 100.0
-                float_version['float-%s' % key_id] = v
-            elif key.startswith('number-'):
-                # add total numbers.
-                tn += int(value)
-        ret['number-total'] = tn
-        ret.update(float_version)
+        # number and turnover of each card, with a formatted version.
+        number_total = 0
+        for card, name in _TOTALS_KEYS:
+            number = getattr(totals, 'number_' + card)
+            turnover = getattr(totals, 'turnover_' + card)
+            number_total += number
+            ret['number-' + name] = number
+            ret['turnover-' + name] = turnover
+            ret['float-' + name] = turnover / 100.0
+        ret['number-total'] = number_total
         return ret
 
+    def get_totals(self):
+        """
+        Returns the individual totals (bitmap 0x60) of an end of day as
+        a records.TOTALS record, or None.
+        """
+        totals = self.get_bitmap('totals')
+        if totals is None:
+            return None
+        return decode_record(totals)
+
 
 Packets.register(StatusInformation)
 
@@ -486,6 +551,7 @@ class IntermediateStatusInformation(Packet):
     04 FF
     this one is important so i mark it here.
     """
+    __slots__ = ()
     cmd_class = Packets.CMD_PT
     cmd_instr = 0xff
     fixed_arguments = ['intermediate_status']
@@ -518,6 +584,7 @@ class PacketReceived(Packet):
     most used packet ever: Packet Received Successfully.
     PT<->ECR
     """
+    __slots__ = ()
     cmd_class = 0x80
     cmd_instr = 0x00
 
@@ -530,6 +597,8 @@ class PacketReceivedError(Packet):
     84 XX
     Some error occured receiving the packet.
     """
+    # cmd_instr is the error code, set per instance.
+    __slots__ = ('__dict__',)
     cmd_class = 0x84
     cmd_instr = None
 
@@ -559,6 +628,7 @@ class Authorisation(Packet):
     If you want to authorize a transaction, this is the packet you need
     to start with. Also for reading card data in general.
     """
+    __slots__ = ()
     cmd_class = 0x6
     cmd_instr = 0x1
     wait_for_completion = True
@@ -578,6 +648,7 @@ class PrintLine(Packet):
     Usually sent by PT to ECR telling him to print a line.
     Needed for diagnosis.
     """
+    __slots__ = ()
     cmd_class = 0x6
     cmd_instr = 0xd1
     fixed_arguments = ['attribute', 'text']
@@ -594,11 +665,10 @@ class PrintLine(Packet):
             return []
         return []
 
-    def enrich_fixed(self):
+    def write_fixed(self, writer):
         # take attribute first
-        bs = [self.fixed_values.get('attribute', 0)]
-        bs += bs2hl(self.fixed_values.get('text', ''))
-        return bs
+        writer.write_byte(self.fixed_values.get('attribute', 0))
+        writer.write(bs2hl(self.fixed_values.get('text', '')))
 
 
 Packets.register(PrintLine)
@@ -610,42 +680,54 @@ class PrintTextBlock(Packet):
     Same as Printline but for a textblock.
     However, uses TLV so not used in basic implementation.
     """
+    __slots__ = ('_tlv_container',)
     cmd_class = 0x6
     cmd_instr = 0xd3
     fixed_arguments = ['attribute', 'text', 'receipt_type', 'lines']
     fixed_values = {}
+    #: longest text of a line.
+    LINE_LENGTH = 24
+
+    def __init__(self, *args, **kwargs):
+        super(PrintTextBlock, self).__init__(*args, **kwargs)
+        self._tlv_container = None
+
+    @classmethod
+    def from_lines(cls, lines, close=True):
+        """
+        Creates a text block from (text, attribute) tuples. close adds
+        the attribute 0xFF, ending the print job.
+        """
+        builder = TlvBuilder()
+        with builder.container(0x25):  # PrintTexts
+            for line, attribute in lines:
+                builder.add(0x07, bs2hl(line[:cls.LINE_LENGTH]))
+                builder.add(0x09, attribute)
+            if close:
+                builder.add(0x09, 0xFF)
+        return cls(tlv=builder)
+
+    def get_tlv_data(self):
+        if self._tlv_container is not None:
+            return self._tlv_container
+        return super(PrintTextBlock, self).get_tlv_data()
 
     def consume_fixed(self, data, length):
         """We just print the data for now."""
         if length:
-            res = TlvParser.parse(data)
             receipt = ''
             lines = []
             receipt_type = 0
 
-            if  len(res) and res[0].get('tag') == 0x06: # RestrictionCode1
-                res = TlvParser.parse(res[0].get('data'))
-                if len(res) > 0 and res[0].get('tag') == 0x1F07:  # ReceiptType
-                    r_data = res[0].get('data')
-                    if r_data:
-                        receipt_type = r_data[0]
-
-                if len(res) > 1 and res[1].get('tag') == 0x25: # PrintTexts
-                    res = TlvParser.parse(res[1].get('data'))
-                    for item in res:
-                        if item.get('tag') == 0x07: # TextLines
-                            line_data = item.get('data')
-                            if not line_data:
-                                receipt += '\n'
-                                lines.append('')
-                                continue
-                            try:
-                                line = bytearray(line_data).decode('cp437')
-                            except:
-                                continue
-                            lines.append(line)
-                            receipt += line
-                            receipt += '\n'
+            container = find_tlv(data, (0x06,))  # RestrictionCode1
+            if container is not None:
+                self._tlv_container = container.value
+                tlv = self.tlv
+                receipt_type = tlv.get('receipt_type', 0)
+                texts = tlv.get('print_texts')
+                if texts is not None:
+                    lines = texts.getlist('text_lines')
+                    receipt = ''.join([line + '\n' for line in lines])
 
             self.fixed_values['attribute'] = int(data[0])  # attribute 1 byte
             self.fixed_values['text'] = receipt
@@ -655,11 +737,10 @@ class PrintTextBlock(Packet):
 
         return []
 
-    def enrich_fixed(self):
+    def write_fixed(self, writer):
         # take attribute first
-        bs = [self.fixed_values.get('attribute', 0)]
-        bs += bs2hl(self.fixed_values.get('text', ''))
-        return bs
+        writer.write_byte(self.fixed_values.get('attribute', 0))
+        writer.write(bs2hl(self.fixed_values.get('text', '')))
 
 
 Packets.register(PrintTextBlock)
@@ -670,6 +751,7 @@ class Diagnosis(Packet):
     """
     06 70
     """
+    __slots__ = ()
     cmd_class = 0x6
     cmd_instr = 0x70
     wait_for_completion = True
@@ -689,6 +771,7 @@ class ActivateCardReader(Packet):
     08 50
     Dieses Paket ist im CardComplete nicht implementiert.
     """
+    __slots__ = ()
     cmd_class = 0x8
     cmd_instr = 0x50
     fixed_arguments = ('activate',)
@@ -698,6 +781,7 @@ class ActivateCardReader(Packet):
 
 
 class DeActivateCardReader(ActivateCardReader):
+    __slots__ = ()
     fixed_values = {'activate': 0xFF}
 
 
@@ -710,6 +794,7 @@ class ReadCard(Packet):
     inserted. Following this the card can be read.
     !!! Cardcomplete does not use card_type or any other stuff here.
     """
+    __slots__ = ()
 
     cmd_class = 0x6
     cmd_instr = 0xc0
@@ -731,6 +816,7 @@ class ResetTerminal(Packet):
     06 18
     works.
     """
+    __slots__ = ()
     cmd_class = 0x6
     cmd_instr = 0x18
     wait_for_completion = True
@@ -743,6 +829,7 @@ class StatusEnquiry(Packet):
     """
     05 01
     """
+    __slots__ = ()
     cmd_class = 0x5
     cmd_instr = 0x1
     fixed_arguments = ('password',)
@@ -9,10 +9,14 @@ keyname (and description)
 BITMAPS_ARGS is created from BITMAPS, representing bitmaps in a
 key-value-store. use this if you know "the key name" of the bitmap
 and want to get its class, code (and description)
+
+Both are read only, DECODERS is BITMAPS as a tuple indexed by code.
 """
-from ecrterm.packets.bmp import BMP
+from types import MappingProxyType
+
+from ecrterm.packets.bmp import BMP, read_bitmap, skip_bitmap
 
-BITMAPS = {
+BITMAPS = MappingProxyType({
     0x01: (BMP.FormatByte(1), 'timeout', 'binary time-out'),
     0x02: (BMP.FormatByte(1), 'max_status_infos', 'binary max.status infos'),
     0x03: (BMP.FormatByte(1), 'service_byte', 'binary service-byte'),
@@ -115,18 +119,64 @@ BITMAPS = {
     0xFC: (BMP.FormatByte(1), 'dialog_control', "binary dialog-control"),
     0x6f: (BMP.FormatByte(1), "???", "???"),  # FIXME: New for Lane/5000
     0x78: (BMP.FormatByte(1), "???", "???"),  # FIXME: New for Lane/5000
-}
+})
+
+
+def bitmap_class(code, klass, key, descr):
+    """
+    Returns a subclass of klass for one bitmap code. It knows its id,
+    key and description, so its instances do not have to.
+    """
+    return type(klass.__name__, (klass,), {
+        '__slots__': (), '_default_id': code, '_key': key, '_descr': descr})
+
+
+#: BITMAPS as a tuple indexed by the bitmap code, for decoding streams.
+DECODERS = [None] * 256
+for key, (klass, k, info) in BITMAPS.items():
+    DECODERS[key] = (bitmap_class(key, klass, k, info), k, info)
+DECODERS = tuple(DECODERS)
+
+
+def decode_bitmaps(data, offset=0, end=None):
+    """
+    Decodes all bitmaps in data from offset to end (default: the end of
+    data) in one pass. Returns a list of bitmaps.
+    """
+    if end is None:
+        end = len(data)
+    bitmaps = []
+    while offset < end:
+        bmp, offset = read_bitmap(data, offset, DECODERS)
+        bitmaps.append(bmp)
+    return bitmaps
+
+
+def scan_bitmaps(data, offset=0, end=None):
+    """
+    Finds the bitmaps in data without decoding them. Returns a list of
+    (offset, end) tuples, offset pointing to the bitmap code.
+    """
+    if end is None:
+        end = len(data)
+    spans = []
+    while offset < end:
+        next_offset = skip_bitmap(data, offset, DECODERS)
+        spans.append((offset, next_offset))
+        offset = next_offset
+    return spans
+
 
 BITMAPS_ARGS = {}
-test_keys = []
-for key in BITMAPS.keys():
-    klass, k, info = BITMAPS[key]
-    test_keys += [k]
+for key in BITMAPS:
+    klass, k, info = DECODERS[key]
     BITMAPS_ARGS[k] = (key, klass, info)
+BITMAPS_ARGS = MappingProxyType(BITMAPS_ARGS)
 
 if __name__ == '__main__':
     from pprint import pprint
-    pprint(BITMAPS_ARGS)
+    pprint(dict(BITMAPS_ARGS))
+    test_keys = [k for (klass, k, info) in BITMAPS.values()]
     if len(test_keys) != len(set(test_keys)):
         print("#" * 80)
         raise Exception("Duplicate Keys in BITMAPS_ARGS, please check.")
@@ -5,9 +5,7 @@
     Each variable in the protocol is saved into a bitmap.
 
 """
-from struct import pack
-
-from six.moves import range
+import re
 
 from ecrterm import conv
 from ecrterm.common import Dumpling
@@ -16,21 +14,52 @@ from ecrterm.utils import is_stringlike
 
 def int_word_split(x, endian='>'):  # default big endian.
     """ splits 2byte integer (sometimes called a word) into 2 byte list"""
-    return conv.bs2hl(pack('%sH' % endian, x & 0xFFFF))
+    if endian == '<':
+        return [x & 0xFF, (x >> 8) & 0xFF]
+    return [(x >> 8) & 0xFF, x & 0xFF]
+
+
+_FCD_PADDING = bytes([0xF0] * 3)
+_DIGITS = re.compile(r'[0-9]*\Z')
+#: ascii digits to fcd digits.
+_FCD_DIGITS = bytes.maketrans(b'0123456789', bytes(range(0xF0, 0xFA)))
+#: fcd coded lengths 0..999 for LLVAR and LLLVAR headers.
+_FCD_LENGTHS = [
+    str(n).encode().translate(_FCD_DIGITS) for n in range(1000)]
+#: the two digits of each bcd byte. nibbles above 9 stay numbers.
+_BCD_PAIRS = [(b >> 4, b & 0x0F) for b in range(256)]
+_BCD_STRINGS = ['%d%d' % pair for pair in _BCD_PAIRS]
+#: bcd byte for two digits as 10 * high + low.
+_BCD_BYTES = [((n // 10) << 4) + n % 10 for n in range(100)]
+
+
+#: classes of FormatByte and FormatBCDByte by length.
+_BYTE_CLASSES = {}
+_BCD_CLASSES = {}
 
 
 class BMPFactory(Dumpling):
+    __slots__ = ()
+
     @classmethod
     def FormatByte(cls, length=1):
-        class SomeBytes(BYTE):
-            _length = length
-        return SomeBytes
+        klass = _BYTE_CLASSES.get(length)
+        if klass is None:
+            class SomeBytes(BYTE):
+                __slots__ = ()
+                _default_length = length
+            klass = _BYTE_CLASSES[length] = SomeBytes
+        return klass
 
     @classmethod
     def FormatBCDByte(cls, length=1):
-        class SomeBCD(BCD):
-            _length = length
-        return SomeBCD
+        klass = _BCD_CLASSES.get(length)
+        if klass is None:
+            class SomeBCD(BCD):
+                __slots__ = ()
+                _default_length = length
+            klass = _BCD_CLASSES[length] = SomeBCD
+        return klass
 
     @classmethod
     def FormatTLV(cls,):
@@ -50,29 +79,70 @@ class BMPFactory(Dumpling):
         """
             returns a tuple, containing a bitmap and the rest of the stream.
         """
-        from ecrterm.packets.bitmaps import BITMAPS
-        # the first byte of the stream is the bitmap type
-        bitmap_type = data[0]
-        data = data[1:]
-        bitmap_class, bmp_key, bmp_descr = BITMAPS[bitmap_type]
-        #  now read the stream out of the bitmap class.
-        bmp = bitmap_class()
-        bmp._id = bitmap_type
-        bmp._descr = bmp_descr
-        bmp._key = bmp_key
-        rest = bmp.parse(data)
-        if len(rest) and (len(rest) == len(data)):
-            raise NotImplementedError(
-                "Bitmap Class without parsing mechanism detected")
-        return bmp, rest
+        bmp, offset = read_bitmap(data, 0)
+        return bmp, data[offset:]
+
+
+def read_bitmap(data, offset, decoders=None):
+    """
+        reads the bitmap starting at offset in data. returns a tuple of
+        the bitmap and the offset after it.
+    """
+    if decoders is None:
+        from ecrterm.packets.bitmaps import DECODERS as decoders
+    # the first byte of the stream is the bitmap type
+    bitmap_type = data[offset]
+    entry = decoders[bitmap_type]
+    if entry is None:
+        raise KeyError(bitmap_type)
+    #  now read the stream out of the bitmap class, which already
+    #  knows its id, key and description.
+    bmp = entry[0]()
+    start = offset + 1
+    end = bmp.parse_at(data, start)
+    if end == start and end < len(data):
+        raise NotImplementedError(
+            "Bitmap Class without parsing mechanism detected")
+    return bmp, end
+
+
+def skip_bitmap(data, offset, decoders):
+    """
+        like read_bitmap, but only returns the offset after the bitmap
+        without decoding it.
+    """
+    entry = decoders[data[offset]]
+    if entry is None:
+        raise KeyError(data[offset])
+    start = offset + 1
+    end = entry[0].skip(data, start)
+    if end == start and end < len(data):
+        raise NotImplementedError(
+            "Bitmap Class without parsing mechanism detected")
+    return end
+
+
+#: class attributes holding the defaults of unset BMP slots.
+_SLOT_DEFAULTS = {'_id': '_default_id', '_length': '_default_length'}
 
 
 class BMP(BMPFactory):
-    _id = 0x0
-    _data = None
+    # _default_id, _key and _descr are class attributes of the bitmap
+    # classes in bitmaps.DECODERS. Instances may set their own _id.
+    __slots__ = ('_data', '_id')
+    _default_id = 0x0
+    _default_length = 0
     _descr = ""
     _key = ''
 
+    def __getattr__(self, name):
+        # only called for unset slots (or missing attributes).
+        try:
+            default = _SLOT_DEFAULTS[name]
+        except KeyError:
+            raise AttributeError(name) from None
+        return getattr(type(self), default)
+
     def get_id(self):
         return self._id or 0x0
     id = property(get_id)
@@ -81,13 +151,12 @@ class BMP(BMPFactory):
         """
             initializes a BMP and makes sure _data contains a list.
         """
-        if not self._data:
-            if data is None:
-                self._data = []
-            elif isinstance(data, list):
-                self._data = data
-            else:
-                self._data = [data]
+        if data is None:
+            self._data = []
+        elif isinstance(data, list):
+            self._data = data
+        else:
+            self._data = [data]
         self._rangecheck()
 
     def value(self):
@@ -95,6 +164,9 @@ class BMP(BMPFactory):
             has to be overwritten.
             represents the value of this bitmap as single expression.
         """
+        if isinstance(self._data, (memoryview, bytearray)):
+            # parsed from a buffer.
+            return list(self._data)
         return self._data
 
     def values(self):
@@ -103,6 +175,13 @@ class BMP(BMPFactory):
         """
         return [self._data, ]
 
+    def dump_into(self, writer):
+        """
+            writes the bytes of this bitmap into a PacketWriter.
+            override this together with dump.
+        """
+        writer.write(self.dump())
+
     def _rangecheck(self):
         """
             checks the range of each data line in the BMP if it can be
@@ -116,6 +195,23 @@ class BMP(BMPFactory):
         # returns data unparsable back
         return data
 
+    def parse_at(self, data, offset):
+        """
+            parses this bitmap from data starting at offset, returns the
+            offset after this bitmap. override this instead of parse
+            to avoid copying the rest of the stream.
+        """
+        rest = self.parse(data[offset:])
+        return len(data) - len(rest)
+
+    @classmethod
+    def skip(cls, data, offset):
+        """
+            returns the offset after a bitmap of this class starting at
+            offset, without decoding it.
+        """
+        return cls().parse_at(data, offset)
+
     # classmethods:
     @classmethod
     def encode_fcd(cls, x, factor=0xf0):
@@ -125,7 +221,12 @@ class BMP(BMPFactory):
         >>> [ hex(i) for i in BMP.encode_fcd( 1234 ) ]
         ['0xf1', '0xf2', '0xf3', '0xf4']
         """
-        return [factor + int(i) for i in list(str(int(x)))]
+        x = int(x)
+        if factor == 0xf0:
+            if 0 <= x < 1000:
+                return list(_FCD_LENGTHS[x])
+            return list(str(x).encode().translate(_FCD_DIGITS))
+        return [factor + int(i) for i in str(x)]
 
     @classmethod
     def decode_fcd(cls, number_list, factor=0xf0):
@@ -149,9 +250,9 @@ class LVAR(BMP):
         ZVT Protocol.
         also implements bases for LLVar and LLLVar.
     """
-    _id = None  # the lvar does not know its id from start.
+    __slots__ = ()
+    _default_id = None  # the lvar does not know its id from start.
     LL = 0  # : length of length header minimum.
-    _data = []
 
     def __init__(self, data=None):
         if is_stringlike(data):
@@ -189,24 +290,62 @@ class LVAR(BMP):
                 length = [0xF0] + length
             if is_stringlike(line):
                 ret += length + conv.bs2hl(line)
-            elif isinstance(line, list):
-                ret += length + line
+            elif isinstance(line, (list, bytearray, memoryview)):
+                ret += length + list(line)
             else:
                 raise TypeError(
                     "Line has unsupported type in LVAR: %s" % type(line))
         return ret
 
+    def dump_into(self, writer):
+        if self._id:
+            writer.write_byte(self._id)
+        line = self._data
+        if is_stringlike(line):
+            line = conv.bs2hl(line)
+        elif not isinstance(line, (list, bytearray, memoryview)):
+            raise TypeError(
+                "Line has unsupported type in LVAR: %s" % type(line))
+        if len(line) < 1000:
+            length = _FCD_LENGTHS[len(line)]
+        else:
+            length = LVAR.length(len(line))
+        if len(length) < self.LL:
+            writer.write(_FCD_PADDING[:self.LL - len(length)])
+        writer.write(length)
+        writer.write(line)
+
     def parse(self, data):
         """
             do the exact opposite of dump.
         """
-        # read the length
-        length = data[:self.LL]
-        length = BMP.decode_fcd(length)
+        return data[self.parse_at(data, 0):]  # we return the rest.
+
+    def parse_at(self, data, offset):
+        start, length = self.read_length(data, offset)
         # get the data
-        data = data[self.LL:]
-        self._data = data[:length]  # conversion of any kinds ?
-        return data[length:]  # we return the rest.
+        self._data = data[start:start + length]
+        return start + length
+
+    @classmethod
+    def read_length(cls, data, offset):
+        """
+            reads the length header FxFyFz at offset, returns the offset
+            of the data and its length.
+        """
+        start = offset + cls.LL
+        length = 0
+        for pos in range(offset, start):
+            x = data[pos]
+            if x < 0xF0 or x > 0xF9:
+                break
+            length = length * 10 + x - 0xF0
+        return start, length
+
+    @classmethod
+    def skip(cls, data, offset):
+        start, length = cls.read_length(data, offset)
+        return start + length
 
     @classmethod
     def length(cls, length):
@@ -223,6 +362,7 @@ class LLVAR(LVAR):
         each LLVar Line has a length code of FxFy,
         where length = x *10 + y
     """
+    __slots__ = ()
     LL = 2
 
 
@@ -231,11 +371,13 @@ class LLLVAR(LVAR):
         each LLLVar Line has a length code of FxFyFz,
         where length = x *100 + y*10 +z
     """
+    __slots__ = ()
     LL = 3
 
 
 class FixedLength(BMP):
-    _length = 0
+    # _default_length is a class attribute of the Format classes.
+    __slots__ = ('_length',)
 
     def get_length(self):
         return self._length
@@ -246,10 +388,24 @@ class FixedLength(BMP):
 
     def parse(self, data):
         if self.length:
-            self._data = data[:self.length]
-            data = data[self.length:]
+            return data[self.parse_at(data, 0):]
         return data
 
+    def parse_at(self, data, offset):
+        length = self.length
+        if length:
+            data = data[offset:offset + length]
+            if isinstance(data, memoryview):
+                # a copy of a few bytes is smaller than the view.
+                data = bytearray(data)
+            self._data = data
+            offset += length
+        return offset
+
+    @classmethod
+    def skip(cls, data, offset):
+        return offset + cls._default_length
+
     def dump(self):
         ret = []
         # first encode our bitmap id.
@@ -261,14 +417,42 @@ class FixedLength(BMP):
             ret += self._data[:self.length]
         return ret
 
+    def dump_into(self, writer):
+        if self._id:
+            writer.write_byte(self._id)
+        data = self._data[:self.length]
+        if is_stringlike(data):
+            data = [ord(c) for c in data]
+        writer.write(data)
+
 # two simple classes (BCD and BYTE)
 
 
 class BCD(FixedLength):
+    __slots__ = ()
+
     @classmethod
     def as_int(cls, a_list):
         ''' represent a bcd list as integer '''
-        return int(''.join([str(a) for a in a_list]))
+        ret = 0
+        for digit in a_list:
+            ret = ret * 10 + digit
+        return ret
+
+    @classmethod
+    def decode_int(cls, something):
+        """
+            decodes bcd bytes straight into an integer, like
+            as_int(decode_bcd(something)).
+            @param something: bytes, a list of bytes or a string
+        """
+        if isinstance(something, str):
+            something = conv.bs2hl(something)
+        digits = bytes(something).hex()
+        if digits.isdigit():
+            return int(digits)
+        # nibbles above 9 count as numbers of their own.
+        return cls.as_int(cls.decode_bcd(something))
 
     @classmethod
     def bcd_split(cls, b):
@@ -293,10 +477,8 @@ class BCD(FixedLength):
         """
         if is_stringlike(something):
             something = conv.bs2hl(something)
-        ret = []
-        for x in something:
-            ret += list(cls.bcd_split(x))
-        return ret
+        pairs = _BCD_PAIRS
+        return [digit for x in something for digit in pairs[x]]
 
     @classmethod
     def encode_bcd(cls, something, strict=False):
@@ -307,15 +489,24 @@ class BCD(FixedLength):
             Note: this function fills up numbers missing with 0,
             except you tell strict to be True.
         """
+        if isinstance(something, str) and _DIGITS.match(something):
+            # you gave something like "123456": the hex digits of
+            # bcd bytes are the decimal digits.
+            if len(something) % 2:
+                something = '0' + something
+            return list(bytes.fromhex(something))
         if is_stringlike(something):
-            # you gave something like "123456"
             something = [int(x) for x in something]
         # check the length if even
         if len(something) % 2:
             something = [0] + something
+        bcd_bytes = _BCD_BYTES
         ret = []
-        for i in range(len(something) // 2):
-            ret += [cls.bcd_unite((something[i * 2], something[i * 2 + 1]))]
+        for i in range(0, len(something), 2):
+            high, low = something[i], something[i + 1]
+            if high > 9 or low > 9:
+                raise ValueError("BCD Unite can only unify two numbers < 10")
+            ret.append(bcd_bytes[high * 10 + low])
         return ret
 
     def __init__(self, data=None):
@@ -338,11 +529,13 @@ class BCD(FixedLength):
         """
             returns the actual bcd value as a string
         """
-        values = self.values()
-        if not values:
-            return ''
-        # return ''.join(values)
-        return '%s' * len(values) % tuple(values)
+        data = self._data
+        if is_stringlike(data):
+            data = conv.bs2hl(data)
+        digits = bytes(data).hex()
+        if digits.isdigit() or not digits:
+            return digits
+        return ''.join([_BCD_STRINGS[b] for b in data])
 
     def __repr__(self):
         return "Bitmap %s, <BCD %s>" % (self._key, self._length)
@@ -357,12 +550,22 @@ class BCD(FixedLength):
             ret = [self._id]
         # now look up our length.
         # our data has to be same length !
-        data = self._data[:]
-        while len(data) < self._length:
-            data = [00, ] + data
+        data = list(self._data)
+        if len(data) < self._length:
+            data = [0] * (self._length - len(data)) + data
         return ret + data
 
+    def dump_into(self, writer):
+        if self._id:
+            writer.write_byte(self._id)
+        # our data has to be same length !
+        if len(self._data) < self._length:
+            writer.write(bytes(self._length - len(self._data)))
+        writer.write(self._data)
+
 
 class BYTE(FixedLength):
+    __slots__ = ()
+
     def __repr__(self):
         return "Bitmap %s, <BYTES %s>" % (self._key, self._length)
@@ -0,0 +1,106 @@
+"""
+Record Layouts.
+
+Some LLLVAR bitmaps carry records of fixed fields instead of a single
+value, e.g. the individual totals (0x60) of an end of day. A
+RecordLayout describes such a record once, compiles it into a struct
+and decodes a record in one pass into a namedtuple.
+
+Layouts are registered by bitmap id in RECORD_LAYOUTS, see
+register_layout and decode_record.
+"""
+import struct
+from collections import namedtuple
+
+from ecrterm.packets.bmp import BCD as BCDBitmap
+
+#: field kinds
+BCD = 'bcd'  # packed bcd number, decoded to int
+BINARY = 'binary'  # unsigned big endian number of 1, 2 or 4 bytes
+BYTES = 'bytes'  # left as bytes
+
+_BINARY_FORMATS = {1: 'B', 2: 'H', 4: 'I'}
+
+
+class RecordLayout(object):
+    """
+    A record of fixed fields, each given as (name, kind, length)::
+
+        layout = RecordLayout('Receipt', [
+            ('number', BCD, 2), ('count', BINARY, 1)])
+        layout.decode(b'\\x00\\x42\\x03')  # Receipt(number=42, count=3)
+    """
+
+    def __init__(self, name, fields):
+        self.name = name
+        self.fields = tuple(fields)
+        fmt = '>'
+        bcd = []
+        for index, (field, kind, length) in enumerate(self.fields):
+            if kind == BINARY:
+                fmt += _BINARY_FORMATS[length]
+            elif kind in (BCD, BYTES):
+                fmt += '%ds' % length
+                if kind == BCD:
+                    bcd.append(index)
+            else:
+                raise ValueError('Unknown field kind %s' % kind)
+        self._struct = struct.Struct(fmt)
+        self._bcd = tuple(bcd)
+        self.size = self._struct.size
+        self.record = namedtuple(name, [f[0] for f in self.fields])
+
+    def decode(self, data, offset=0):
+        """Decodes the record at offset in data."""
+        values = self._struct.unpack_from(data, offset)
+        if self._bcd:
+            values = list(values)
+            decode_int = BCDBitmap.decode_int
+            for index in self._bcd:
+                values[index] = decode_int(values[index])
+        return self.record._make(values)
+
+    def decode_all(self, data):
+        """Decodes all complete records following each other in data."""
+        size = self.size
+        return [self.decode(data, offset)
+                for offset in range(0, len(data) - size + 1, size)]
+
+
+#: cards in the individual totals, in order.
+TOTALS_CARDS = (
+    'ec_card', 'jcb', 'eurocard', 'amex', 'visa', 'diners', 'remaining')
+
+#: bitmap 0x60: receipt number range, then count and turnover per card.
+TOTALS = RecordLayout('Totals', [
+    ('receipt_number_start', BCD, 2),
+    ('receipt_number_end', BCD, 2),
+] + [
+    field
+    for card in TOTALS_CARDS
+    for field in (('number_%s' % card, BINARY, 1),
+                  ('turnover_%s' % card, BCD, 6))
+])
+
+#: record layouts by bitmap id.
+RECORD_LAYOUTS = {
+    0x60: TOTALS,
+}
+
+
+def register_layout(bmp_id, layout):
+    """
+    Registers the record layout of a bitmap, e.g. for Geldkarte (0x9A)
+    or ec-Cash chip offline (0x92) records of your terminal.
+    """
+    RECORD_LAYOUTS[bmp_id] = layout
+
+
+def decode_record(bmp):
+    """Decodes the record of a bitmap with its registered layout."""
+    return RECORD_LAYOUTS[bmp._id].decode(bytes(bmp._data))
+
+
+def decode_records(bmp):
+    """Decodes a bitmap holding several records of its layout."""
+    return RECORD_LAYOUTS[bmp._id].decode_all(bytes(bmp._data))
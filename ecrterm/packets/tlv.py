@@ -16,17 +16,96 @@ TLV Container Format.
         # b8 if 0, length is a 7 bit number.
         # b8 if 1, this byte only codes how many follow.
 """
+from contextlib import contextmanager
+
 from ecrterm.packets.bmp import BMP
 
 
+def encode_tag(tag):
+    """Returns the bytes of a tag number, e.g. 0x1F07 -> 1F 07."""
+    return tag.to_bytes(max(1, (tag.bit_length() + 7) // 8), 'big')
+
+
+class TlvBuilder(object):
+    """
+    Assembles TLV objects, also nested ones, into one buffer. Container
+    lengths are inserted when the container is closed.
+
+    >>> builder = TlvBuilder()
+    >>> with builder.container(0x25):
+    ...     builder.add(0x07, 'Hi')
+    ...     builder.add(0x09, 0)
+    >>> builder.getvalue()
+    b'%\\x07\\x07\\x02Hi\\t\\x01\\x00'
+    """
+    __slots__ = ('buffer', '_open')
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self._open = []
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def add(self, tag, value):
+        """
+        Adds a TLV object. value can be bytes, a list of bytes, a string
+        (latin-1) or an int for a single byte.
+        """
+        if isinstance(value, int):
+            value = (value,)
+        elif isinstance(value, str):
+            value = value.encode('latin-1')
+        length = bytes(TLV.length(len(value)))
+        buffer = self.buffer
+        buffer += encode_tag(tag)
+        buffer += length
+        buffer += bytes(value)
+
+    def begin(self, tag):
+        """Opens a container, everything added until end() goes in."""
+        self.buffer += encode_tag(tag)
+        self._open.append(len(self.buffer))
+
+    def end(self):
+        """Closes the last container opened."""
+        mark = self._open[-1]
+        self.buffer[mark:mark] = bytes(TLV.length(len(self.buffer) - mark))
+        self._open.pop()
+
+    @contextmanager
+    def container(self, tag):
+        self.begin(tag)
+        yield self
+        self.end()
+
+    def getvalue(self):
+        if self._open:
+            raise ValueError('TLV container not closed.')
+        return bytes(self.buffer)
+
+
 class TLV(BMP):
-    _id = 0x06
+    __slots__ = ()
+    _default_id = 0x06
+
+    def __init__(self, data=None):
+        if isinstance(data, TlvBuilder):
+            data = data.getvalue()
+        if isinstance(data, (bytes, bytearray, memoryview)):
+            self._data = data
+        else:
+            super(TLV, self).__init__(data)
 
     @classmethod
     def length(cls, length):
         """
         Transforms a number into a TLV Length ,returns list of bytes.
+        Raises ValueError for lengths above 0xFFFF.
         """
+        if length > 0xFFFF:
+            raise ValueError(
+                "TLV length cannot be bigger than 2 bytes: %s" % length)
         if length >= 0x80:  # 128 or more...
             # we need more than 1 byte.
             # lets see if we need only 2:
@@ -42,28 +121,42 @@ class TLV(BMP):
             return [length, ]
 
     def parse(self, data):
+        return data[self.parse_at(data, 0):]
+
+    def parse_at(self, data, offset):
         # just find out the length and skip that stuff
         # if not data:
         #    # sometimes an empty TLV container happens.
         #    return []
-        l1 = data[0]
-        if l1 > 0x80:
-            bytes = max(2, l1 - 0x80)
-            if bytes == 2:
-                # hb, lb
-                hb = data[1]
-                lb = data[2]
-                length = (hb << 8) + lb
-                data = data[3:]
-            elif bytes == 1:
-                # one byte.
-                length = data[1]
-                data = data[2:]
-        else:
-            length = l1
-            data = data[1:]
-        self._data = data[:length]
-        return data[length:]
+        offset, length = TLV.read_length(data, offset)
+        self._data = data[offset:offset + length]
+        return offset + length
+
+    @classmethod
+    def read_length(cls, data, offset):
+        """
+        Reads a TLV Length at offset, returns the offset of the value and
+        its length.
+        """
+        l1 = data[offset]
+        offset += 1
+        if l1 == 0x81:
+            # one byte.
+            return offset + 1, data[offset]
+        elif l1 == 0x82:
+            # hb, lb
+            return offset + 2, (data[offset] << 8) + data[offset + 1]
+        return offset, l1
+
+    @classmethod
+    def skip(cls, data, offset):
+        offset, length = cls.read_length(data, offset)
+        return offset + length
 
     def dump(self):  # dump the bytes.
-        return [self._id] + TLV.length(len(self._data)) + self._data
\ No newline at end of file
+        return [self._id] + TLV.length(len(self._data)) + list(self._data)
+
+    def dump_into(self, writer):
+        writer.write_byte(self._id)
+        writer.write(TLV.length(len(self._data)))
+        writer.write(self._data)
@@ -74,51 +74,149 @@ class TlvParser:
 
     @staticmethod
     def has_trait(tag, trait):
-        def get_most_significant_byte(value):
-            return (value >> 56) & 0xFF
-
-        upper = get_most_significant_byte(tag)
-
-        b7 = TlvParser.is_bit_set(upper, 7)
-        b6 = TlvParser.is_bit_set(upper, 6)
-
-        if trait == TlvParser.TagTrait.UniversalClass:
-            return not (b7 or b6)
-        elif trait == TlvParser.TagTrait.ApplicationClass:
-            return b6
-        elif trait == TlvParser.TagTrait.ContextSpecificClass:
-            return b7
-        elif trait == TlvParser.TagTrait.PrivateClass:
-            return b7 and b6
-        elif trait == TlvParser.TagTrait.PrimitiveDataObject:
-            return not TlvParser.is_bit_set(upper, 5)
-        elif trait == TlvParser.TagTrait.ConstructedDataObject:
-            return TlvParser.is_bit_set(upper, 5)
-
-        logging.warning(f'TlvParser trait: {trait} not supported!')
-        return False
+        # the traits are coded in the first byte of the tag.
+        traits = _TRAITS.get(trait)
+        if traits is None:
+            logging.warning(f'TlvParser trait: {trait} not supported!')
+            return False
+        return traits[_first_tag_byte(tag)]
 
     @staticmethod
     def parse(data):
-        offset = 0
-        data_len = len(data)
         objects = []
-
-        while offset < data_len:
-            tag, offset = TlvParser.calculate_tlv_tag(data, offset)
-            length, offset  = TlvParser.calculate_tlv_length(data, offset)
-
-            tlv_data = data[offset:offset+length]
-            offset += length
+        for node in iter_tlv(data):
+            tlv_data = data[node.start:node.end]
             children = []
-            if TlvParser.has_trait(tag, TlvParser.TagTrait.ConstructedDataObject):
+            if node.constructed:
                 children = TlvParser.parse(tlv_data)
-
             objects.append({
-                'tag': tag,
-                'length': length,
+                'tag': node.tag,
+                'length': node.length,
                 'data': tlv_data,
                 'children': children
             })
-
         return objects
+
+
+def _first_tag_byte(tag):
+    while tag > 0xFF:
+        tag >>= 8
+    return tag
+
+
+def _trait_table(test):
+    return [bool(test(b >> 7 & 1, b >> 6 & 1, b >> 5 & 1)) for b in range(256)]
+
+
+#: trait -> list of 256 bools, indexed by the first tag byte.
+_TRAITS = {
+    TlvParser.TagTrait.UniversalClass:
+        _trait_table(lambda b7, b6, b5: not (b7 or b6)),
+    TlvParser.TagTrait.ApplicationClass:
+        _trait_table(lambda b7, b6, b5: b6),
+    TlvParser.TagTrait.ContextSpecificClass:
+        _trait_table(lambda b7, b6, b5: b7),
+    TlvParser.TagTrait.PrivateClass:
+        _trait_table(lambda b7, b6, b5: b7 and b6),
+    TlvParser.TagTrait.PrimitiveDataObject:
+        _trait_table(lambda b7, b6, b5: not b5),
+    TlvParser.TagTrait.ConstructedDataObject:
+        _trait_table(lambda b7, b6, b5: b5),
+}
+
+
+class TlvNode(object):
+    """
+    One TLV object found by iter_tlv. The value is not copied, `value`
+    slices the underlying data on access and `children` walks it only
+    when asked for.
+    """
+    __slots__ = ('tag', 'constructed', 'data', 'start', 'end')
+
+    def __init__(self, tag, constructed, data, start, end):
+        self.tag = tag
+        self.constructed = constructed
+        self.data = data
+        self.start = start
+        self.end = end
+
+    @property
+    def length(self):
+        return self.end - self.start
+
+    @property
+    def value(self):
+        return self.data[self.start:self.end]
+
+    @property
+    def children(self):
+        """Iterates the objects inside the value of this object."""
+        return iter_tlv(self.data, self.start, self.end)
+
+    def find(self, *tag_path):
+        """
+        Returns the first object inside this one reached by following
+        tag_path, e.g. node.find(0x25, 0x07), or None.
+        """
+        return find_tlv(self.data, tag_path, self.start, self.end)
+
+    def __repr__(self):
+        return '<TlvNode %X, %d bytes>' % (self.tag, self.length)
+
+
+def iter_tlv(data, offset=0, end=None):
+    """
+    Iterates the TLV objects in data from offset to end, yielding a
+    TlvNode for each. bytes and bytearray are walked as memoryview, so
+    node values are not copied.
+    """
+    if isinstance(data, (bytes, bytearray)):
+        data = memoryview(data)
+    if end is None:
+        end = len(data)
+    while offset < end:
+        # tag: more bytes follow if b5-b1 are set in the first byte,
+        # then as long as b8 is set.
+        first = tag = data[offset]
+        offset += 1
+        if first & 0x1F == 0x1F:
+            for _ in range(8):
+                if offset >= end:
+                    break
+                byte = data[offset]
+                tag = (tag << 8) + byte
+                offset += 1
+                if not byte & 0x80:
+                    break
+        # length
+        length = 0
+        if offset < end:
+            length = data[offset]
+            offset += 1
+            if length == 0x81:
+                length = data[offset]
+                offset += 1
+            elif length == 0x82:
+                length = (data[offset] << 8) + data[offset + 1]
+                offset += 2
+            elif length > 0x80:
+                length = 0
+        value_end = min(offset + length, end)
+        yield TlvNode(tag, bool(first & 0x20), data, offset, value_end)
+        offset = value_end
+
+
+def find_tlv(data, tag_path, offset=0, end=None):
+    """
+    Follows tag_path into data and returns the first TlvNode found
+    there, or None. Only the objects along the path are visited.
+    """
+    node = None
+    for tag in tag_path:
+        for node in iter_tlv(data, offset, end):
+            if node.tag == tag:
+                break
+        else:
+            return None
+        data, offset, end = node.data, node.start, node.end
+    return node
@@ -0,0 +1,114 @@
+"""
+TLV Tags.
+
+Registry of the known tags inside the TLV container (bitmap 06), with
+the name and the decoder of each. decode_tlv turns a container into a
+TlvView in one pass::
+
+    view = decode_tlv(packet.get_bitmap('tlv')._data)
+    view.receipt_type
+    view.print_texts.getlist('text_lines')
+
+Unknown tags are kept as bytes under their tag number.
+"""
+from collections.abc import Mapping
+
+from ecrterm.packets.tlv_parser import iter_tlv
+
+
+def decode_text(value):
+    return bytes(value).decode('cp437')
+
+
+def decode_int(value):
+    return int.from_bytes(bytes(value), 'big')
+
+
+def decode_bytes(value):
+    return bytes(value)
+
+
+class _Container(object):
+    """Marker for the decoder of constructed tags."""
+    __slots__ = ()
+
+    def __repr__(self):
+        return 'CONTAINER'
+
+
+#: decoder for constructed tags, their value is decoded into a TlvView.
+CONTAINER = _Container()
+
+#: tag -> (name, decoder)
+TAGS = {}
+
+
+def register_tag(tag, name, decoder=decode_bytes):
+    """Adds a tag to the registry, replacing any former entry."""
+    if decoder is not CONTAINER and not callable(decoder):
+        raise TypeError('decoder of tag %#x is not callable.' % tag)
+    TAGS[tag] = (name, decoder)
+
+
+register_tag(0x07, 'text_lines', decode_text)
+register_tag(0x09, 'attribute', decode_int)
+register_tag(0x0A, 'zvt_command')
+register_tag(0x14, 'character_set', decode_int)
+register_tag(0x15, 'language_code', decode_text)
+register_tag(0x1A, 'max_apdu_length', decode_int)
+register_tag(0x25, 'print_texts', CONTAINER)
+register_tag(0x26, 'permitted_commands', CONTAINER)
+register_tag(0x27, 'character_sets', CONTAINER)
+register_tag(0x28, 'languages', CONTAINER)
+register_tag(0x1F07, 'receipt_type', decode_int)
+
+
+class TlvView(Mapping):
+    """
+    Decoded TLV objects by name. Item and attribute access return the
+    first object of a name, getlist returns all of them in order.
+    """
+    __slots__ = ('_values',)
+
+    def __init__(self, values=None):
+        self._values = values or {}
+
+    def __getitem__(self, name):
+        return self._values[name][0]
+
+    def __getattr__(self, name):
+        if name.startswith('_'):
+            raise AttributeError(name)
+        try:
+            return self._values[name][0]
+        except KeyError:
+            raise AttributeError(name)
+
+    def __iter__(self):
+        return iter(self._values)
+
+    def __len__(self):
+        return len(self._values)
+
+    def getlist(self, name):
+        return list(self._values.get(name, ()))
+
+    def __repr__(self):
+        return 'TlvView(%r)' % self._values
+
+
+def decode_tlv(data, offset=0, end=None):
+    """Decodes the TLV objects in data into a TlvView."""
+    values = {}
+    for node in iter_tlv(data, offset, end):
+        name, decoder = TAGS.get(node.tag, (node.tag, decode_bytes))
+        if decoder is CONTAINER or node.constructed:
+            value = decode_tlv(node.data, node.start, node.end)
+        else:
+            value = decoder(node.value)
+        values.setdefault(name, []).append(value)
+    return TlvView(values)
+
+
+#: the view of packets without TLV data.
+EMPTY = TlvView()
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""
+Packet Writer.
+
+Packets and bitmaps serialize themselves into one PacketWriter, which
+collects everything in a single bytearray. Length fields are reserved
+first and patched in once the data behind them is known.
+"""
+
+
+class PacketWriter(object):
+    """
+    Collects the bytes of a packet.
+
+    >>> w = PacketWriter()
+    >>> w.write([0x06, 0x01])
+    >>> mark = w.begin_length()
+    >>> w.write(b'\\x04\\x00\\x00\\x00\\x00\\x01\\x00')
+    >>> w.end_length(mark)
+    >>> w.getvalue()
+    b'\\x06\\x01\\x07\\x04\\x00\\x00\\x00\\x00\\x01\\x00'
+    """
+    __slots__ = ('buffer',)
+
+    def __init__(self):
+        self.buffer = bytearray()
+
+    def __len__(self):
+        return len(self.buffer)
+
+    def write(self, data):
+        """Appends bytes, bytearray, memoryview or a list of ints."""
+        self.buffer.extend(data)
+
+    def write_byte(self, byte):
+        self.buffer.append(byte)
+
+    def begin_length(self):
+        """
+        Reserves an APDU length field, returns a mark to pass to
+        end_length once the data is written.
+        """
+        self.buffer.append(0)
+        return len(self.buffer)
+
+    def end_length(self, mark):
+        """
+        Patches the APDU length for everything written since mark.
+        If data length l < 255: length is 1 byte, otherwise 0xFF is
+        followed by two bytes length, low byte first.
+        """
+        length = len(self.buffer) - mark
+        if length > 254:
+            if length > 65535:
+                raise NotImplementedError(
+                    "APDU Data length cannot be bigger than 2 bytes.")
+            self.buffer[mark - 1:mark] = bytes(
+                (0xFF, length & 0xFF, length >> 8))
+        else:
+            self.buffer[mark - 1] = length
+
+    def getvalue(self):
+        return bytes(self.buffer)
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the asyncio ECR against a fake terminal.
+"""
+import asyncio
+from unittest import TestCase, main
+
+from ecrterm.ecr import ECR
+from ecrterm.ecr_async import AsyncECR
+from ecrterm.exceptions import TransportTimeoutException
+from ecrterm.packets.base_packets import Completion, StatusEnquiry
+from ecrterm.transmission.protocol import PACKET_RECEIVED
+from ecrterm.transmission.signals import TRANSMIT_OK
+from ecrterm.transmission.transport_socket_async import AsyncSocketTransport
+
+RECEIVED = b'\x80\x00\x00'
+# completions with a tid, and with sw-version 'AB' and terminal status 0.
+COMPLETION_TID = b'\x06\x0F\x05\x29\x52\x50\x00\x09'
+COMPLETION_STATUS = b'\x06\x0F\x06\xF0\xF0\xF2AB\x00'
+
+
+class FakeTerminal(object):
+    """Answers each command with "Packet Received" and a completion."""
+
+    def __init__(self, completion):
+        self.completion = completion
+        self.received = []
+        self.done = asyncio.Event()
+
+    async def handle(self, reader, writer):
+        while True:
+            try:
+                header = await reader.readexactly(3)
+                apdu = header + await reader.readexactly(header[2])
+            except asyncio.IncompleteReadError:
+                break
+            self.received.append(apdu)
+            if apdu != RECEIVED and self.completion:
+                writer.write(RECEIVED + self.completion)
+        writer.close()
+        self.done.set()
+
+
+class TestAsyncECR(TestCase):
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_with(self, terminal, coroutine):
+        async def run():
+            server = await asyncio.start_server(
+                terminal.handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            try:
+                return await coroutine('socket://127.0.0.1:%d' % port)
+            finally:
+                server.close()
+                await server.wait_closed()
+        return self.loop.run_until_complete(run())
+
+    def test_register(self):
+        terminal = FakeTerminal(COMPLETION_TID)
+
+        async def register(uri):
+            async with AsyncECR(uri) as ecr:
+                ret = await ecr.register(config_byte=None)
+            await asyncio.wait_for(terminal.done.wait(), 1)
+            return ecr, ret
+        ecr, ret = self.run_with(terminal, register)
+        self.assertEqual(ret, TRANSMIT_OK)
+        self.assertEqual(ecr.terminal_id, '52500009')
+        self.assertEqual(terminal.received[0][:2], b'\x06\x00')
+        # the completion was acknowledged.
+        self.assertEqual(terminal.received[1:], [RECEIVED])
+
+    def test_many_terminals(self):
+        terminal = FakeTerminal(COMPLETION_STATUS)
+
+        async def status(uri):
+            async with AsyncECR(uri) as ecr:
+                return await ecr.status(), ecr.version
+        results = self.run_with(
+            terminal, lambda uri: asyncio.gather(
+                *[status(uri) for _ in range(5)]))
+        self.assertEqual(len(results), 5)
+        for code, version in results:
+            self.assertEqual(code, 0)
+            self.assertTrue(version)
+
+    def test_timeout(self):
+        terminal = FakeTerminal(None)
+
+        async def status(uri):
+            async with AsyncECR(uri) as ecr:
+                ecr.transport.connect_timeout = 0.05
+                await ecr.status()
+        with self.assertRaises(TransportTimeoutException):
+            self.run_with(terminal, status)
+
+    def test_timeout_within_apdu(self):
+        async def handle(reader, writer):
+            writer.write(COMPLETION_STATUS[:3])
+            await asyncio.sleep(0.1)
+            writer.write(COMPLETION_STATUS[3:])
+            await reader.read()
+            writer.close()
+
+        async def receive():
+            server = await asyncio.start_server(handle, '127.0.0.1', 0)
+            port = server.sockets[0].getsockname()[1]
+            transport = AsyncSocketTransport(
+                'socket://127.0.0.1:%d' % port)
+            await transport.connect()
+            try:
+                with self.assertRaises(TransportTimeoutException):
+                    await transport.receive(0.05)
+                # the header read before the timeout is not lost.
+                return (await transport.receive(1))[1]
+            finally:
+                await transport.close()
+                server.close()
+                await server.wait_closed()
+        packet = self.loop.run_until_complete(receive())
+        self.assertIsInstance(packet, Completion)
+        self.assertEqual(packet.fixed_values['sw-version'], 'AB')
+
+    def test_send_packets(self):
+        terminal = FakeTerminal(None)
+        command = StatusEnquiry('123456')
+
+        async def send(uri):
+            transport = AsyncSocketTransport(uri)
+            await transport.connect()
+            self.assertFalse(transport.has_apdu)
+            transport.send_packets([PACKET_RECEIVED, command])
+            await transport.drain()
+            await transport.close()
+            await asyncio.wait_for(terminal.done.wait(), 1)
+        self.run_with(terminal, send)
+        self.assertEqual(terminal.received, [RECEIVED, command.to_bytes()])
+
+    def test_not_an_ecr(self):
+        # the commands are coroutines, not those of ECR.
+        self.assertFalse(issubclass(AsyncECR, ECR))
+
+
+if __name__ == '__main__':
+    main()
@@ -15,10 +15,13 @@ erzeugen.
 
 from unittest import TestCase, main
 
-from ecrterm.conv import toHexString
+from ecrterm.conv import bs2hl, toHexString
+from ecrterm.ecr import ECR, chunk_print_lines
 from ecrterm.packets.base_packets import (
-    Authorisation, Diagnosis, DisplayText, Initialisation, PacketReceived,
-    PacketReceivedError, PrintLine, Registration, ResetTerminal, StatusEnquiry)
+    Authorisation, Diagnosis, DisplayText, Initialisation, Packet,
+    PacketReceived, PacketReceivedError, PrintLine, PrintTextBlock,
+    Registration, ResetTerminal, StatusEnquiry)
+from ecrterm.packets.tlv import TlvBuilder
 from ecrterm.transmission.signals import ACK, NAK
 from ecrterm.transmission.transport_serial import SerialMessage
 
@@ -74,6 +77,10 @@ class TestCaseDataEncoding(TestCase):
         pk = PrintLine(
             text='Gesamt      0       0,00', attribute=0)
         self.assertEqual(data_expected, list_of_bytes(pk))
+        # enrich_fixed lists what the write_fixed of the packet writes.
+        self.assertEqual(pk.enrich_fixed(), pk.get_data_raw())
+        pk = Registration(password='123456', config_byte=0xBA)
+        self.assertEqual(pk.enrich_fixed()[:4], [0x12, 0x34, 0x56, 0xBA])
 
     def test_packet_received(self):
         data_expected = '10 02 80 00 00 10 03 F5 1F'
@@ -114,6 +121,85 @@ class TestCaseDataEncoding(TestCase):
         pk = StatusEnquiry()
         self.assertEqual(data_expected, list_of_bytes(pk))
 
+    def test_serialization_cache(self):
+        pk = Registration()
+        wire = pk.to_bytes()
+        # unchanged packets hand out the same serialization.
+        self.assertIs(pk.get_wire(), pk.get_wire())
+        self.assertEqual(pk.to_list(), list(wire))
+        pk.fixed_values['password'] = '111111'
+        self.assertEqual(toHexString(list(pk.to_bytes())),
+                         '06 00 06 11 11 11 BA 09 78')
+        pk.bitmaps.append(StatusEnquiry(service_byte=1).bitmaps[0])
+        self.assertEqual(toHexString(pk.to_list()),
+                         '06 00 08 11 11 11 BA 09 78 03 01')
+
+    def test_fields(self):
+        """ bitmaps given as arguments are found by their key """
+        packet = Authorisation(amount=1000, currency_code=978)
+        self.assertEqual(packet.fields.amount.value(), '1000')
+        self.assertIs(packet.get_bitmap_by_id(0x49),
+                      packet.bitmaps_as_dict()['currency_code'])
+
+    def test_print_text_block(self):
+        """ print texts from the builder match the former packet way """
+        lines = [('Line %s' % i, i % 2) for i in range(12)]
+        lines.append(('x' * 30, 0))
+        expected = []
+        for line, attribute in lines:
+            expected += Packet(text_lines=bs2hl(line[:24])).get_data_raw()
+            expected += Packet(attribute=attribute).get_data_raw()
+        expected += Packet(attribute=0xff).get_data_raw()
+        expected = PrintTextBlock(
+            tlv=Packet(print_texts=expected).get_data_raw())
+        self.assertEqual(PrintTextBlock.from_lines(lines).to_bytes(),
+                         expected.to_bytes())
+        # without an apdu length, blocks have ten lines.
+        chunks = chunk_print_lines(lines * 20)
+        self.assertEqual([len(c) for c in chunks], [10] * 26)
+        # else chunks follow the apdu length.
+        chunks = chunk_print_lines(lines * 20, 0xFFFF)
+        self.assertEqual(len(chunks), 1)
+        chunks = chunk_print_lines(lines * 20, 300)
+        self.assertEqual(sum(len(c) for c in chunks), len(lines) * 20)
+        sizes = [len(PrintTextBlock.from_lines(
+            chunk, close=i == len(chunks) - 1).to_bytes())
+            for i, chunk in enumerate(chunks)]
+        self.assertLessEqual(max(sizes), 300)
+        self.assertGreater(sizes[0], 250)
+
+    def test_print_text_default(self):
+        # a PT which reports no max_apdu_length gets blocks of ten lines.
+        ecr = ECR.__new__(ECR)
+        ecr._init_state('123456')
+        sent = []
+        ecr.transmit = lambda packet: sent.append(packet) or 0
+        self.assertEqual(ecr.print_text([('Line', 0)] * 25), 0)
+        self.assertEqual(
+            [len(p.tlv['print_texts'].getlist('text_lines')) for p in sent],
+            [10, 10, 5])
+        self.assertTrue(all(len(p.to_bytes()) < 255 for p in sent))
+
+    def test_extended_length(self):
+        # lengths above 254 are coded as FF, low byte, high byte.
+        pk = PrintTextBlock(tlv=[0x07] * 300)
+        data = pk.to_bytes()
+        self.assertEqual(toHexString(list(data[:10])),
+                         '06 D3 FF 31 01 00 06 82 01 2C')
+        self.assertEqual(len(data), 5 + 0x131)
+        self.assertEqual(pk.get_data_raw(), list(data[5:]))
+
+    def test_tlv_length_limit(self):
+        builder = TlvBuilder()
+        builder.add(0x07, bytes(0xFFFF))
+        with self.assertRaises(ValueError):
+            builder.add(0x07, bytes(0x10000))
+        builder = TlvBuilder()
+        builder.begin(0x25)
+        builder.add(0x07, bytes(0xFFFF))
+        with self.assertRaises(ValueError):
+            builder.end()
+
 
 if __name__ == '__main__':
     main()
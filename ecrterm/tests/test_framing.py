@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the serial framing layer.
+"""
+from unittest import TestCase, main
+
+from ecrterm.conv import toBytes
+from ecrterm.ecr import dismantle_serial_packet
+from ecrterm.exceptions import TransportLayerException
+from ecrterm.packets.base_packets import (
+    Authorisation, Completion, Registration, StatusEnquiry)
+from ecrterm.packets.bitmaps import BITMAPS_ARGS
+from ecrterm.transmission._transmission import Transmission
+from ecrterm.transmission.framing import (
+    SerialFrame, SerialFrameDecoder, encode_serial_frame, verify_frames)
+from ecrterm.transmission.protocol import PACKET_RECEIVED
+from ecrterm.transmission.signals import ACK, NAK
+from ecrterm.transmission.transport_serial import SerialTransport
+
+
+class FakeSerial(object):
+    """Serial port which hands out a fixed stream."""
+    timeout = None
+
+    def __init__(self, data):
+        self.data = data
+
+    @property
+    def in_waiting(self):
+        return len(self.data)
+
+    def read(self, size=1):
+        chunk, self.data = self.data[:size], self.data[size:]
+        return chunk
+
+    def write(self, data):
+        self.written = bytes(data)
+
+
+# authorisation with a stuffed DLE in the amount.
+FRAME = bytes(toBytes(
+    '100206010A040000000110100049097810' '03F2FF'))
+APDU = bytes(toBytes('06010A04000000011000490978'))
+CRC = bytes([0xF2, 0xFF])
+
+
+class TestSerialFrameDecoder(TestCase):
+
+    def test_single_frame(self):
+        frames = SerialFrameDecoder().feed(FRAME)
+        self.assertEqual(len(frames), 1)
+        self.assertEqual(frames[0].apdu, APDU)
+        self.assertEqual(frames[0].crc, CRC)
+
+    def test_byte_by_byte(self):
+        decoder = SerialFrameDecoder()
+        frames = []
+        for i in range(len(FRAME)):
+            frames += decoder.feed(FRAME[i:i + 1])
+            if i < len(FRAME) - 1:
+                self.assertFalse(decoder.idle)
+        self.assertEqual(frames, [(APDU, CRC)])
+        self.assertTrue(decoder.idle)
+
+    def test_garbage_and_resync(self):
+        decoder = SerialFrameDecoder()
+        broken = FRAME[:6] + bytes([0x10, 0x42]) + FRAME[6:]
+        frames = decoder.feed(b'\x00\xff' + broken + FRAME + FRAME[:3])
+        self.assertEqual(frames, [(APDU, CRC)])
+        self.assertEqual(decoder.errors, 1)
+        # the partial frame is completed by the next chunk.
+        self.assertEqual(decoder.feed(FRAME[3:]), [(APDU, CRC)])
+
+    def test_control_bytes(self):
+        decoder = SerialFrameDecoder(keep_control=True)
+        self.assertEqual(decoder.feed(bytes([ACK]) + FRAME),
+                         [ACK, (APDU, CRC)])
+
+    def test_encode(self):
+        self.assertEqual(encode_serial_frame(APDU), FRAME)
+        self.assertEqual(encode_serial_frame(list(APDU)), FRAME)
+        # many DLEs survive a round trip.
+        apdu = bytes([0x06, 0xD3, 0xFF]) + bytes([0x10]) * 300
+        frame = encode_serial_frame(apdu)
+        self.assertEqual(frame.count(bytes([0x10, 0x10])), 300)
+        self.assertEqual(SerialFrameDecoder().feed(frame)[0].apdu, apdu)
+
+    def test_verify_frames(self):
+        frames = [SerialFrame(APDU, CRC), SerialFrame(APDU, b'\x00\x00'),
+                  SerialFrame(memoryview(APDU), CRC)]
+        self.assertEqual(verify_frames(frames), [True, False, True])
+
+    def test_dismantle(self):
+        crc, apdu = dismantle_serial_packet(list(FRAME))
+        self.assertEqual(crc, list(CRC))
+        self.assertEqual(apdu, list(APDU))
+
+    def test_transport_read(self):
+        transport = SerialTransport('/dev/null')
+        transport.connection = FakeSerial(FRAME + FRAME)
+        self.assertEqual(transport.read(), (list(CRC), list(APDU)))
+        # the second frame came with the same chunk.
+        self.assertEqual(transport.connection.data, b'')
+        self.assertEqual(transport.read(), (list(CRC), list(APDU)))
+
+    def test_transport_receive(self):
+        transport = SerialTransport('/dev/null')
+        transport.connection = FakeSerial(FRAME)
+        ok, packet = transport.receive()
+        self.assertTrue(ok)
+        self.assertEqual(transport.connection.written, bytes([ACK]))
+        self.assertIsInstance(packet, Authorisation)
+        # parsed straight from the received bytes, short fields copied.
+        self.assertIsInstance(packet.bitmaps[0]._data, bytearray)
+        self.assertEqual(packet.bitmaps_as_dict()['amount'].value(),
+                         '000000011000')
+        self.assertEqual(packet.to_bytes(), APDU)
+
+    def test_prepared_packets(self):
+        template = StatusEnquiry('123456').freeze()
+        packet = template.copy()
+        self.assertIs(packet.to_bytes(), template.to_bytes())
+        packet.completion = Completion()
+        self.assertIsNone(template.completion)
+        with self.assertRaises(TypeError):
+            packet.fixed_values['password'] = '654321'
+        with self.assertRaises(TypeError):
+            template.cmd_instr = 0x02
+        transport = SerialTransport('/dev/null')
+        transport.connection = FakeSerial(bytes([ACK]))
+        self.assertTrue(transport.send(packet, no_wait=True))
+        frame = encode_serial_frame(template.to_bytes())
+        self.assertEqual(transport.connection.written, frame)
+        # the frame is kept with the template.
+        self.assertIs(template.encode_with(encode_serial_frame),
+                      packet.encode_with(encode_serial_frame))
+
+    def test_copy_unfrozen(self):
+        packet = Registration()
+        wire = packet.to_bytes()
+        clone = packet.copy()
+        clone.fixed_values['password'] = '111111'
+        clone.bitmaps.append(BITMAPS_ARGS['tid'][1]('12345678'))
+        self.assertEqual(packet.to_bytes(), wire)
+        self.assertEqual(clone.to_bytes()[3:6], b'\x11\x11\x11')
+        self.assertEqual(clone.to_bytes()[-5:], b'\x29\x12\x34\x56\x78')
+
+    def test_send_received(self):
+        transport = SerialTransport('/dev/null')
+        transport.connection = FakeSerial(bytes([ACK]))
+        Transmission(transport).send_received()
+        self.assertEqual(transport.connection.written,
+                         encode_serial_frame(b'\x80\x00\x00'))
+        self.assertIs(PACKET_RECEIVED.encode_with(encode_serial_frame),
+                      PACKET_RECEIVED.encode_with(encode_serial_frame))
+        transport.connection = FakeSerial(bytes([NAK]))
+        self.assertRaises(TransportLayerException,
+                          Transmission(transport).send_received)
+
+
+if __name__ == '__main__':
+    main()
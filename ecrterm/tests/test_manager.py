@@ -0,0 +1,147 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the selector based terminal manager.
+"""
+import os
+import select
+import socket
+from unittest import TestCase, main
+
+import serial
+from ecrterm.exceptions import (
+    TransportLayerException, TransportTimeoutException)
+from ecrterm.packets.base_packets import Completion, StatusEnquiry
+from ecrterm.transmission.framing import (
+    SerialFrameDecoder, encode_serial_frame)
+from ecrterm.transmission.manager import TerminalManager
+from ecrterm.transmission.protocol import CompletionEvent
+from ecrterm.transmission.signals import ACK
+from ecrterm.transmission.transport_serial import SerialTransport
+
+RECEIVED = b'\x80\x00\x00'
+COMPLETION = b'\x06\x0F\x06\xF0\xF0\xF2AB\x00'
+
+
+class TestTerminalManager(TestCase):
+
+    def setUp(self):
+        self.manager = TerminalManager()
+        self.sockets = []
+
+    def tearDown(self):
+        self.manager.close()
+        for sock in self.sockets:
+            sock.close()
+
+    def add_terminal(self):
+        """Returns a managed terminal and the socket of its PT."""
+        server = socket.socket()
+        server.bind(('127.0.0.1', 0))
+        server.listen(1)
+        self.sockets.append(server)
+        terminal = self.manager.add(
+            'socket://127.0.0.1:%d' % server.getsockname()[1])
+        pt = server.accept()[0]
+        pt.settimeout(1)
+        self.sockets.append(pt)
+        return terminal, pt
+
+    def poll_until(self, future):
+        for _ in range(100):
+            if future.done():
+                return future
+            self.manager.poll(0.01)
+        self.fail('future is not done')
+
+    def test_many_terminals(self):
+        lanes = [self.add_terminal() for _ in range(3)]
+        events = []
+        futures = [terminal.submit(StatusEnquiry('123456'), events.append)
+                   for terminal, pt in lanes]
+        self.manager.poll(0)
+        command = StatusEnquiry('123456').to_bytes()
+        for terminal, pt in lanes:
+            self.assertEqual(pt.recv(100), command)
+        # the terminals answer in any order.
+        for terminal, pt in reversed(lanes):
+            pt.sendall(RECEIVED + COMPLETION)
+        for future, (terminal, pt) in zip(futures, lanes):
+            packet = self.poll_until(future).result()
+            self.assertIsInstance(packet.completion, Completion)
+            self.assertEqual(pt.recv(100), RECEIVED)
+        self.assertEqual(
+            sum(isinstance(e, CompletionEvent) for e in events), 3)
+
+    def test_queued_commands(self):
+        terminal, pt = self.add_terminal()
+        first = terminal.submit(StatusEnquiry('123456'))
+        second = terminal.submit(StatusEnquiry('123456'))
+        self.manager.poll(0)
+        pt.recv(100)
+        pt.sendall(RECEIVED + COMPLETION)
+        self.poll_until(first)
+        # acknowledge of the completion and the next command in one go.
+        self.assertEqual(
+            pt.recv(100), RECEIVED + StatusEnquiry('123456').to_bytes())
+        self.assertFalse(second.done())
+
+    def test_timeout_and_disconnect(self):
+        terminal, pt = self.add_terminal()
+        terminal.answer_timeout = 0.01
+        future = terminal.submit(StatusEnquiry('123456'))
+        with self.assertRaises(TransportTimeoutException):
+            self.poll_until(future).result()
+        future = terminal.submit(StatusEnquiry('123456'))
+        self.manager.poll(0)
+        pt.close()
+        with self.assertRaises(TransportLayerException):
+            self.poll_until(future).result()
+        self.assertEqual(self.manager.terminals, [])
+        self.assertRaises(TransportLayerException,
+                          terminal.submit(StatusEnquiry('123456')).result)
+
+    def test_serial_terminal(self):
+        master, slave = os.openpty()
+        self.addCleanup(os.close, master)
+        transport = SerialTransport(os.ttyname(slave))
+        transport.connection = serial.Serial(os.ttyname(slave))
+        os.close(slave)
+        terminal = self.manager.add_transport(transport)
+        future = terminal.submit(StatusEnquiry('123456'))
+        self.manager.poll(0)
+        decoder = SerialFrameDecoder()
+        frame = decoder.feed(os.read(master, 100))[0]
+        self.assertEqual(frame.apdu, StatusEnquiry('123456').to_bytes())
+        os.write(master, bytes([ACK]) + encode_serial_frame(RECEIVED) +
+                 encode_serial_frame(COMPLETION))
+        self.assertIsInstance(
+            self.poll_until(future).result().completion, Completion)
+        # both frames acknowledged, then Packet Received sent.
+        data = os.read(master, 100)
+        self.assertEqual(data[:2], bytes([ACK, ACK]))
+        self.assertEqual(decoder.feed(data[2:])[0].apdu, RECEIVED)
+
+    def test_serial_lost_ack(self):
+        master, slave = os.openpty()
+        self.addCleanup(os.close, master)
+        transport = SerialTransport(os.ttyname(slave))
+        transport.connection = serial.Serial(os.ttyname(slave))
+        os.close(slave)
+        terminal = self.manager.add_transport(transport)
+        terminal.answer_timeout = 0.01
+        command = StatusEnquiry('123456').to_bytes()
+        future = terminal.submit(StatusEnquiry('123456'))
+        self.manager.poll(0)
+        decoder = SerialFrameDecoder()
+        self.assertEqual(decoder.feed(os.read(master, 100))[0].apdu, command)
+        # the ACK never comes, the next command is sent nevertheless.
+        with self.assertRaises(TransportTimeoutException):
+            self.poll_until(future).result()
+        terminal.submit(StatusEnquiry('123456'))
+        self.manager.poll(0)
+        self.assertEqual(select.select([master], [], [], 1)[0], [master])
+        self.assertEqual(decoder.feed(os.read(master, 100))[0].apdu, command)
+
+
+if __name__ == '__main__':
+    main()
@@ -4,9 +4,17 @@ Misc. Tests.
 
 @author g4b
 """
+import subprocess
+import sys
 from unittest import TestCase, main
 
+from ecrterm.conv import (
+    COMMA, HEX, PACK, UPPERCASE, bs2hl, hl2bs, toBytes, toHexString)
+from ecrterm.crc import CRC16, crc_checksum, crc_xmodem16
+from ecrterm.ecr import ECR
 from ecrterm.packets.bmp import BCD
+from ecrterm.transmission.registry import (
+    TRANSPORTS, get_transport_class, register_transport)
 
 
 class TestSequenceFunctions(TestCase):
@@ -44,6 +52,18 @@ class TestSequenceFunctions(TestCase):
         self.assertEqual(d,
                          [666, 0, 0, 1])
 
+    def test_bcd_numbers(self):
+        """ bcd bytes straight to integers """
+        self.assertEqual(BCD.decode_int([0x00, 0x12, 0x34]), 1234)
+        self.assertEqual(BCD.decode_int(b'\x01\x0f'), 115)
+        self.assertEqual(BCD.decode_int(b'\x01\x0f'),
+                         BCD.as_int(BCD.decode_bcd(b'\x01\x0f')))
+        self.assertEqual(BCD.decode_int(b''), 0)
+        self.assertEqual(BCD.encode_bcd('12345'), [0x01, 0x23, 0x45])
+        self.assertRaises(ValueError, BCD.encode_bcd, [1, 10])
+        self.assertEqual(BCD(1234).value(), '1234')
+        self.assertEqual(BCD.encode_fcd(1005), [0xf1, 0xf0, 0xf0, 0xf5])
+
     def test_bmp(self):
         """
             test if the classmethods in bmp work
@@ -58,9 +78,73 @@ class TestSequenceFunctions(TestCase):
             BCD.decode_fcd(fcd_seq),
             bignum)
 
+    def test_crc(self):
+        """ the incremental crc matches the one shot functions """
+        data = b'\x06\x00\x06\x12\x34\x56\xba\x09\x78\x03'
+        self.assertEqual(crc_xmodem16(data), 0xC324)
+        self.assertEqual(crc_xmodem16(data.decode('latin-1')), 0xC324)
+        crc = CRC16(data[:4])
+        crc.update(memoryview(data)[4:])
+        self.assertEqual(crc.digest(), b'\x24\xc3')
+        self.assertEqual(crc_checksum(data, 0x8408), 0xC324)
+
+    def test_conv(self):
+        """ hex strings and byte lists """
+        data = [0x3B, 0x65, 0x00, 0x9C]
+        self.assertEqual(toHexString(data), '3B 65 00 9C')
+        self.assertEqual(toHexString(bytes(data)), '3B 65 00 9C')
+        self.assertEqual(toHexString(data, PACK), '3B65009C')
+        self.assertEqual(toHexString(data, COMMA), '3B, 65, 00, 9C')
+        self.assertEqual(toHexString(data, HEX | COMMA | PACK),
+                         '0x3B,0x65,0x00,0x9C')
+        self.assertEqual(toHexString(data, HEX | UPPERCASE),
+                         '0X3B 0X65 0X00 0X9C')
+        self.assertEqual(toHexString([-1]), 'FF')
+        self.assertEqual(toHexString([]), '')
+        self.assertRaises(TypeError, toHexString, 'abc')
+        self.assertEqual(toBytes('3B 65 00 9C'), data)
+        self.assertEqual(toBytes('3B65   009C'), data)
+        self.assertEqual(toBytes('3B, 65, 00, 9C'), data)
+        self.assertEqual(toBytes(b'\x3b\x65'), [0x3B, 0x65])
+        self.assertRaises(TypeError, toBytes, 'xyz')
+        # text which is no hex comes back as character codes.
+        self.assertEqual(toBytes('Hi You'), [72, 105, 32, 89, 111, 117])
+        self.assertEqual(bs2hl('A\xe4'), [0x41, 0xE4])
+        self.assertEqual(bs2hl(b'A\xe4'), [0x41, 0xE4])
+        self.assertEqual(hl2bs([0x41, 0xE4]), 'A\xe4')
+
     def test_llvar(self):
         pass
 
+    def test_transport_registry(self):
+        class FakeTransport(object):
+            def __init__(self, device):
+                self.device = device
+        saved = list(TRANSPORTS)
+        try:
+            register_transport('fake://', FakeTransport)
+            self.assertIs(get_transport_class('fake://1'), FakeTransport)
+        finally:
+            TRANSPORTS[:] = saved
+        self.assertRaises(ValueError, get_transport_class, 'fake://1')
+        # a socket only ecr does not load pyserial.
+        script = (
+            'import sys, ecrterm.ecr\n'
+            'from ecrterm.transmission.registry import get_transport_class\n'
+            'get_transport_class("socket://127.0.0.1:20007")\n'
+            'sys.exit("serial" in sys.modules)\n')
+        self.assertEqual(
+            subprocess.call([sys.executable, '-c', script]), 0)
+
+    def test_detection(self):
+        # only transports which support it are probed by detect_pt.
+        self.assertTrue(get_transport_class('/dev/ttyS0').supports_detection)
+        socket_class = get_transport_class('socket://127.0.0.1:20007')
+        self.assertFalse(socket_class.supports_detection)
+        ecr = ECR.__new__(ECR)
+        ecr.transport = socket_class('socket://127.0.0.1:20007')
+        self.assertTrue(ecr.detect_pt())
+
 
 if __name__ == '__main__':
     main()
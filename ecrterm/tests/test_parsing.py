@@ -7,8 +7,15 @@ from unittest import TestCase, main
 
 from ecrterm import conv
 from ecrterm.ecr import parse_represented_data
+from ecrterm.packets import records, tlv_tags
 from ecrterm.packets.apdu import Packets
-from ecrterm.packets.base_packets import Completion, Packet
+from ecrterm.packets.bitmaps import BITMAPS_ARGS, decode_bitmaps
+from ecrterm.packets.base_packets import (
+    Completion, Packet, PacketReceived, PacketReceivedError,
+    PrintTextBlock, StatusInformation)
+from ecrterm.packets.bmp import LLVAR
+from ecrterm.packets.records import RecordLayout
+from ecrterm.packets.tlv_parser import TlvParser, find_tlv, iter_tlv
 
 
 class TestParsingMechanisms(TestCase):
@@ -23,6 +30,159 @@ class TestParsingMechanisms(TestCase):
             rep = parse_represented_data(conv.toHexString(packet().to_list()))
             self.assertEqual(rep.__class__, packet)
 
+    def test_detect(self):
+        """ the dispatch table falls back to super commands """
+        self.assertIs(Packets.detect([0x80, 0x00]), PacketReceived)
+        self.assertIs(Packets.detect(b'\x84\x9c'), PacketReceivedError)
+        self.assertIs(Packets.detect([0x06, 0x0F]), Completion)
+        self.assertIsNone(Packets.detect([0x07, 0x01]))
+
+    def test_decode_bitmaps(self):
+        """ bitmaps are decoded in one pass from an offset """
+        data = [0xAA, 0xBB,  # not part of the bitmaps.
+                0x27, 0x00,
+                0x04, 0x00, 0x00, 0x00, 0x00, 0x40, 0x00,
+                0x22, 0xF0, 0xF2, 0x12, 0x34,
+                0x06, 0x81, 0x80] + [0x01] * 0x80
+        bitmaps = decode_bitmaps(data, offset=2)
+        self.assertEqual([b._key for b in bitmaps],
+                         ['result_code', 'amount', 'card_number', 'tlv'])
+        self.assertEqual(bitmaps[1].value(), '000000004000')
+        self.assertEqual(bitmaps[2]._data, [0x12, 0x34])
+        self.assertEqual(len(bitmaps[3]._data), 0x80)
+
+    def test_lazy_bitmaps(self):
+        """ received bitmaps are decoded on access """
+        data = bytes([0x06, 0x01, 0x0C,
+                      0x04, 0x00, 0x00, 0x00, 0x00, 0x40, 0x00,
+                      0x49, 0x09, 0x78, 0x19, 0x40])
+        packet = Packets.detect(data)()
+        packet.set_data(memoryview(data)[2:])
+        self.assertIsNone(packet._bitmaps)
+        self.assertEqual(packet.to_bytes(), data)
+        # a single field.
+        self.assertEqual(packet.get_bitmap('amount').value(), '000000004000')
+        self.assertIsNone(packet.get_bitmap('tid'))
+        self.assertIsNone(packet._bitmaps)
+        # all of them, the decoded field is kept.
+        amount = packet.get_bitmap('amount')
+        self.assertEqual([b._key for b in packet.bitmaps],
+                         ['amount', 'currency_code', 'type'])
+        self.assertIs(packet.bitmaps[0], amount)
+        self.assertEqual(packet.to_bytes(), data)
+        packet.bitmaps.pop()
+        self.assertEqual(packet.to_bytes()[2], 0x0A)
+        # unknown bitmaps still fail while parsing.
+        with self.assertRaises(KeyError):
+            Packet.parse(data[:2] + b'\x0E' + data[3:] + b'\x08\x00')
+
+    def test_fields(self):
+        """ bitmaps by key and id, kept until the bitmaps change """
+        data = bytes([0x04, 0x0F, 0x0A,
+                      0x27, 0x00,
+                      0x29, 0x52, 0x50, 0x00, 0x09,
+                      0x49, 0x09, 0x78])
+        packet = Packet.parse(data)
+        self.assertIn('tid', packet.fields)
+        self.assertNotIn('amount', packet.fields)
+        self.assertEqual(packet.fields.tid.value(), '52500009')
+        self.assertIsNone(packet._bitmaps)
+        self.assertEqual(packet.get_bitmap_by_id(0x27).value(), [0x00])
+        self.assertEqual(sorted(packet.fields),
+                         ['currency_code', 'result_code', 'tid'])
+        bdict = packet.bitmaps_as_dict()
+        self.assertIs(packet.bitmaps_as_dict(), bdict)
+        self.assertIs(bdict['tid'], packet.fields['tid'])
+        with self.assertRaises(AttributeError):
+            packet.fields.amount
+        packet.bitmaps.pop()
+        self.assertNotIn('currency_code', packet.bitmaps_as_dict())
+        self.assertEqual(len(packet.fields), 2)
+
+    def test_end_of_day(self):
+        """ the totals of an end of day status information """
+        totals = [0x00, 0x01, 0x00, 0x09]
+        for count in range(1, 8):
+            totals += [count, 0x00, 0x00, 0x00, 0x00, 0x10 * count, 0x00]
+        packet = StatusInformation(
+            amount=28000, totals=totals, date_day='1231', time='235959')
+        info = packet.get_end_of_day_information()
+        self.assertEqual(info['receipt-number-start'], 1)
+        self.assertEqual(info['receipt-number-end'], 9)
+        self.assertEqual(info['number-ec-card'], 1)
+        self.assertEqual(info['turnover-ec-card'], 1000)
+        self.assertEqual(info['number-remaining'], 7)
+        self.assertEqual(info['turnover-remaining'], 7000)
+        self.assertEqual(info['float-remaining'], 70.0)
+        self.assertEqual(info['time'].hour, 23)
+        self.assertEqual(info['date'].month, 12)
+        self.assertEqual(info['number-total'], 28)
+        self.assertEqual(info['float-amount'], 280.0)
+        self.assertEqual(packet.get_totals().turnover_jcb, 2000)
+
+    def test_record_layout(self):
+        """ records of fixed fields """
+        layout = RecordLayout('Entry', [
+            ('number', records.BCD, 2), ('count', records.BINARY, 2),
+            ('flag', records.BYTES, 1)])
+        self.assertEqual(layout.size, 5)
+        entries = layout.decode_all(b'\x00\x42\x01\x00\xAA' * 2 + b'\x00')
+        self.assertEqual(len(entries), 2)
+        self.assertEqual(entries[1], (42, 256, b'\xAA'))
+        self.assertEqual(entries[0].count, 256)
+
+    def test_tlv_walker(self):
+        """ tlv objects are found without parsing everything """
+        texts = bytes([0x07, 0x05]) + b'Hello' + bytes([0x07, 0x00,
+                                                       0x07, 0x02]) + b'\x84!'
+        container = bytes([0x1F, 0x07, 0x01, 0x02,
+                           0x25, len(texts)]) + texts
+        data = bytes([0x06, len(container)]) + container
+        nodes = list(iter_tlv(data))
+        self.assertEqual([(n.tag, n.length) for n in nodes],
+                         [(0x06, len(container))])
+        self.assertEqual(find_tlv(data, (0x06, 0x1F07)).value, b'\x02')
+        self.assertIsNone(find_tlv(data, (0x06, 0x07)))
+        lines = nodes[0].find(0x25).children
+        self.assertEqual([bytes(n.value) for n in lines],
+                         [b'Hello', b'', b'\x84!'])
+        self.assertTrue(TlvParser.has_trait(
+            0x25, TlvParser.TagTrait.ConstructedDataObject))
+        self.assertTrue(TlvParser.has_trait(
+            0x1F07, TlvParser.TagTrait.PrimitiveDataObject))
+        packet = PrintTextBlock.parse(
+            bytes([0x06, 0xD3, len(data)]) + data)
+        self.assertEqual(packet.fixed_values['lines'],
+                         ['Hello', '', '\xe4!'])
+        self.assertEqual(packet.fixed_values['receipt_type'], 2)
+
+    def test_tlv_view(self):
+        """ the tlv container of a packet is decoded once by name """
+        commands = bytes([0x0A, 0x02, 0x06, 0x01, 0x0A, 0x02, 0x06, 0xB0])
+        tlv = bytes([0x1A, 0x02, 0x01, 0x00,
+                     0x26, len(commands)]) + commands
+        # version, terminal status, then the tlv bitmap.
+        data = bytes([0xF0, 0xF0, 0xF3]) + b'1.0' + bytes(
+            [0x00, 0x06, len(tlv)]) + tlv
+        packet = Completion.parse(bytes([0x06, 0x0F, len(data)]) + data)
+        self.assertEqual(packet.fixed_values['sw-version'], '1.0')
+        self.assertEqual(packet.fixed_values['terminal-status'], 0)
+        self.assertIs(packet.tlv, packet.tlv)
+        self.assertEqual(packet.tlv.max_apdu_length, 256)
+        self.assertEqual(packet.tlv['permitted_commands'].getlist(
+            'zvt_command'), [b'\x06\x01', b'\x06\xB0'])
+        # bitmaps of a registration completion.
+        packet = Completion.parse(bytes(
+            [0x06, 0x0F, 0x07, 0x19, 0x00, 0x29, 0x52, 0x50, 0x00, 0x09]))
+        self.assertEqual(packet.fields.tid.value(), '52500009')
+        self.assertEqual(len(packet.tlv), 0)
+        # unknown tags are kept by number.
+        packet = StatusInformation(tlv=[0x1A, 0x01, 0xFF, 0x44, 0x01, 0x02])
+        self.assertEqual(dict(packet.tlv), {'max_apdu_length': 255,
+                                            0x44: b'\x02'})
+        # a tag needs a decoder or the CONTAINER marker.
+        self.assertRaises(TypeError, tlv_tags.register_tag, 0x44, 'x', None)
+
     def test_version_completion(self):
         # following completion is sent by the PT with version on
         # statusenquiry:
@@ -33,6 +193,31 @@ class TestParsingMechanisms(TestCase):
         rep = parse_represented_data(data_expected)
         self.assertEqual(rep.__class__, Completion)
 
+    def test_slots(self):
+        # parsed packets and their bitmaps have no instance dict.
+        packet = Packet.parse(bytes(conv.toBytes(
+            '04 0F 0B 27 00 04 00 00 00 00 40 00 29 52 50 00 09')))
+        self.assertIsInstance(packet, StatusInformation)
+        self.assertFalse(hasattr(packet, '__dict__'))
+        for bmp in packet.bitmaps:
+            self.assertFalse(hasattr(bmp, '__dict__'))
+        self.assertEqual(packet.copy().fixed_values, packet.fixed_values)
+        self.assertEqual(PacketReceivedError.parse(b'\x84\x9C\x00')
+                         .error_code, 0x9C)
+
+    def test_slot_defaults(self):
+        # class defaults must not make the _id and _length slots read only.
+        bmp = BITMAPS_ARGS['amount'][1]()
+        self.assertEqual((bmp._id, bmp.length), (0x04, 6))
+        bmp.length = 2
+        bmp._id = 0x05
+        self.assertEqual((bmp._id, bmp.length), (0x05, 2))
+        self.assertEqual(BITMAPS_ARGS['amount'][1]().length, 6)
+        lvar = LLVAR('abc')
+        self.assertIsNone(lvar._id)
+        lvar._id = 0x22
+        self.assertEqual(lvar.dump(), [0x22, 0xF0, 0xF3, 97, 98, 99])
+
     def test_parsing_two(self):
         """
         parse some packets
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the sans-IO protocol core.
+"""
+from unittest import TestCase, main
+
+from ecrterm.exceptions import TransmissionException
+from ecrterm.packets.base_packets import (
+    Authorisation, Completion, StatusEnquiry)
+from ecrterm.transmission.framing import APDUDecoder
+from ecrterm.transmission.protocol import (
+    PACKET_RECEIVED, AbortEvent, CompletionEvent, MasterRegainedEvent,
+    PrintEvent, ResponseEvent, StatusEvent, ZVTProtocol)
+
+RECEIVED = b'\x80\x00\x00'
+INTERMEDIATE = b'\x04\xFF\x01\x0A'
+PRINT_LINE = b'\x06\xD1\x05\x00Text'
+COMPLETION = b'\x06\x0F\x06\xF0\xF0\xF2AB\x00'
+ABORT = b'\x06\x1E\x01\x6C'
+
+
+class TestAPDUDecoder(TestCase):
+
+    def test_feed(self):
+        long_apdu = bytes([0x06, 0xD3, 0xFF, 0x2C, 0x01]) + bytes(300)
+        stream = RECEIVED + long_apdu + COMPLETION
+        decoder = APDUDecoder()
+        apdus = []
+        for i in range(len(stream)):
+            apdus += decoder.feed(stream[i:i + 1])
+        self.assertEqual(apdus, [RECEIVED, long_apdu, COMPLETION])
+        self.assertTrue(decoder.idle)
+        self.assertEqual(decoder.feed(stream + RECEIVED[:2]),
+                         [RECEIVED, long_apdu, COMPLETION])
+        self.assertFalse(decoder.idle)
+
+
+class TestZVTProtocol(TestCase):
+
+    def test_exchange(self):
+        protocol = ZVTProtocol()
+        command = StatusEnquiry('123456')
+        protocol.send(command)
+        self.assertEqual(protocol.data_to_send(), command.to_bytes())
+        self.assertFalse(protocol.is_master)
+        with self.assertRaises(TransmissionException):
+            protocol.send(StatusEnquiry('123456'))
+        events = protocol.receive_data(RECEIVED + COMPLETION[:4])
+        self.assertEqual([type(e) for e in events], [ResponseEvent])
+        self.assertEqual(protocol.data_to_send(), b'')
+        events = protocol.receive_data(COMPLETION[4:])
+        self.assertEqual([type(e) for e in events],
+                         [CompletionEvent, MasterRegainedEvent])
+        self.assertIsInstance(events[0].packet, Completion)
+        self.assertIs(events[1].packet, command)
+        self.assertIs(command.completion, events[0].packet)
+        self.assertEqual(protocol.data_to_send(), RECEIVED)
+        self.assertTrue(protocol.is_master)
+        self.assertEqual(
+            [(inc, type(p).__name__) for inc, p in protocol.last_history],
+            [(False, 'StatusEnquiry'), (True, 'PacketReceived'),
+             (True, 'Completion'), (False, 'PacketReceived')])
+
+    def test_payment(self):
+        protocol = ZVTProtocol()
+        protocol.send(Authorisation(amount=100, currency_code=978))
+        protocol.data_to_send()
+        events = protocol.receive_data(
+            RECEIVED + INTERMEDIATE + PRINT_LINE + ABORT)
+        self.assertEqual(
+            [type(e) for e in events],
+            [ResponseEvent, StatusEvent, PrintEvent, AbortEvent,
+             MasterRegainedEvent])
+        self.assertEqual(events[2].packet.fixed_values['text'], 'Text')
+        # every packet of the PT but the first is acknowledged.
+        self.assertEqual(protocol.packets_to_send(), [PACKET_RECEIVED] * 3)
+
+    def test_reset(self):
+        protocol = ZVTProtocol()
+        protocol.send(StatusEnquiry('123456'))
+        protocol.receive_data(RECEIVED[:1])
+        protocol.reset()
+        self.assertTrue(protocol.is_master)
+        self.assertEqual(protocol.data_to_send(), b'')
+        protocol.send(StatusEnquiry('123456'))
+        protocol.data_to_send()
+        self.assertEqual(len(protocol.receive_data(RECEIVED)), 1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Tests for the buffered reader of the socket transport.
+"""
+import socket
+from unittest import TestCase, main
+
+from ecrterm.exceptions import (
+    TransportLayerException, TransportTimeoutException)
+from ecrterm.packets.base_packets import (
+    Completion, PacketReceived, PrintLine, StatusEnquiry)
+from ecrterm.transmission._transmission import Transmission
+from ecrterm.transmission.protocol import PACKET_RECEIVED
+from ecrterm.transmission.transport_socket import (
+    SocketReader, SocketTransport)
+
+RECEIVED = b'\x80\x00\x00'
+INTERMEDIATE = b'\x04\xFF\x01\x0A'
+PRINT_LINE = b'\x06\xD1\x05\x00Text'
+COMPLETION = b'\x06\x0F\x06\xF0\xF0\xF2AB\x00'
+
+
+class FakeSocket(object):
+    """Socket which hands out fixed chunks with recv_into."""
+
+    def __init__(self, *chunks):
+        self.chunks = list(chunks)
+        self.reads = 0
+
+    def recv_into(self, buffer):
+        self.reads += 1
+        chunk = self.chunks.pop(0)
+        if isinstance(chunk, Exception):
+            raise chunk
+        if len(chunk) > len(buffer):
+            # the rest comes with the next read.
+            self.chunks.insert(0, chunk[len(buffer):])
+            chunk = chunk[:len(buffer)]
+        buffer[:len(chunk)] = chunk
+        return len(chunk)
+
+
+class PartialSocket(object):
+    """Socket whose sendmsg sends only a few bytes."""
+
+    def __init__(self, size):
+        self.size = size
+        self.sent = []
+
+    def sendmsg(self, buffers):
+        self.sent.append(b''.join(buffers)[:self.size])
+        return self.size
+
+    def sendall(self, data):
+        self.sent.append(data)
+
+
+class TestSocketReader(TestCase):
+
+    def test_back_to_back(self):
+        sock = FakeSocket(RECEIVED + PRINT_LINE + COMPLETION)
+        reader = SocketReader(sock)
+        self.assertEqual([reader.read_apdu() for _ in range(3)],
+                         [RECEIVED, PRINT_LINE, COMPLETION])
+        self.assertEqual(sock.reads, 1)
+        self.assertFalse(reader.has_apdu)
+
+    def test_partial_and_long(self):
+        long_apdu = bytes([0x06, 0xD3, 0xFF, 0x2C, 0x01]) + bytes(300)
+        stream = RECEIVED + long_apdu + COMPLETION
+        # a small buffer has to be compacted and grown.
+        chunks = [stream[i:i + 7] for i in range(0, len(stream), 7)]
+        reader = SocketReader(FakeSocket(*chunks), size=8)
+        self.assertEqual([reader.read_apdu() for _ in range(3)],
+                         [RECEIVED, long_apdu, COMPLETION])
+        # asking for a complete APDU leaves the buffer alone.
+        reader = SocketReader(FakeSocket(long_apdu[:8]), size=8)
+        self.assertEqual(reader.read(), [])
+        buffer = reader._buffer
+        self.assertFalse(reader.has_apdu)
+        self.assertIs(reader._buffer, buffer)
+        reader = SocketReader(FakeSocket(stream[:10], stream[10:]))
+        self.assertEqual(reader.read(), [RECEIVED])
+        self.assertEqual(reader.read(), [long_apdu, COMPLETION])
+
+    def test_errors(self):
+        reader = SocketReader(FakeSocket(RECEIVED[:2], socket.timeout(), b''))
+        with self.assertRaises(TransportTimeoutException):
+            reader.read_apdu()
+        with self.assertRaises(TransportLayerException):
+            reader.read_apdu()
+
+    def connect(self):
+        """Returns a SocketTransport and the socket of its PT."""
+        transport = SocketTransport('socket://127.0.0.1:20007')
+        transport.sock, pt = socket.socketpair()
+        pt.settimeout(1)
+        self.addCleanup(transport.sock.close)
+        self.addCleanup(pt.close)
+        transport.socket_reader = SocketReader(transport.sock)
+        return transport, pt
+
+    def test_transport_receive(self):
+        transport, pt = self.connect()
+        pt.sendall(RECEIVED + PRINT_LINE + COMPLETION)
+        packets = [transport.receive(1)[1] for _ in range(3)]
+        self.assertEqual([type(p) for p in packets],
+                         [PacketReceived, PrintLine, Completion])
+        with self.assertRaises(TransportTimeoutException):
+            transport.receive(0.01)
+
+    def test_partial_send(self):
+        transport = SocketTransport('socket://127.0.0.1:20007')
+        transport.sock = PartialSocket(5)
+        command = StatusEnquiry('123456')
+        transport.send_packets([PACKET_RECEIVED, command, PACKET_RECEIVED])
+        sent = transport.sock.sent
+        # only the unsent rest of the second buffer is a memoryview.
+        self.assertIsInstance(sent[1], memoryview)
+        self.assertIs(sent[2], PACKET_RECEIVED.to_bytes())
+        self.assertEqual(b''.join(sent),
+                         RECEIVED + command.to_bytes() + RECEIVED)
+        # a single packet is sent as it is.
+        transport.send_packets([command])
+        self.assertIs(sent[-1], command.to_bytes())
+
+    def test_transport_send(self):
+        transport, pt = self.connect()
+        command = StatusEnquiry('123456')
+        transport.send_packets([PACKET_RECEIVED, command])
+        self.assertEqual(pt.recv(100), RECEIVED + command.to_bytes())
+        # answers to packets which came back to back are sent together.
+        pt.sendall(RECEIVED + INTERMEDIATE + COMPLETION)
+        Transmission(transport).transmit(command)
+        self.assertEqual(pt.recv(100), command.to_bytes() + RECEIVED * 2)
+        # the command goes out with what the protocol queued before.
+        transmission = Transmission(transport)
+        transmission.protocol.send_received()
+        pt.sendall(RECEIVED + COMPLETION)
+        transmission.transmit(command)
+        self.assertEqual(pt.recv(100),
+                         RECEIVED + command.to_bytes() + RECEIVED)
+
+    def test_handle_response_hook(self):
+        # hooks written for the Transmission still find its attributes.
+        seen = []
+
+        class Enquiry(StatusEnquiry):
+            __slots__ = ()
+
+            def handle_response(self, response, tm):
+                seen.append((tm.transport, tm.is_master))
+                return super().handle_response(response, tm)
+
+        transport, pt = self.connect()
+        pt.sendall(RECEIVED + COMPLETION)
+        Transmission(transport).transmit(Enquiry('123456'))
+        self.assertEqual(seen, [(transport, False)] * 2)
+
+
+if __name__ == '__main__':
+    main()
@@ -2,8 +2,8 @@
 Transmission Basics.
 @author g4b
 """
-from ecrterm.exceptions import TransmissionException, TransportLayerException
-from ecrterm.packets.base_packets import PacketReceived
+from ecrterm.exceptions import TransmissionException
+from ecrterm.transmission.protocol import ZVTProtocol
 from ecrterm.transmission.signals import TIMEOUT_T4_DEFAULT, TRANSMIT_OK
 
 
@@ -12,18 +12,33 @@ class Transmission(object):
     A Transmission Object represents an open connection between ECR and
     PT. It regulates the flow of packets, and uses a Transport to send
     its data. The default Transport to use is the serial transport.
+
+    The protocol itself is a ZVTProtocol, the Transmission only moves
+    its packets over the transport.
     """
     actual_timeout = TIMEOUT_T4_DEFAULT
-    last = None
 
     def __init__(self, transport):
         self.transport = transport
-        self.is_master = True
+        self.protocol = ZVTProtocol(self)
         self.is_waiting = False
-        self.last = None  # saves last sent master
         self.log_list = []
-        self.history = []
-        self.last_history = []
+
+    @property
+    def is_master(self):
+        return self.protocol.is_master
+
+    @property
+    def last(self):
+        return self.protocol.last
+
+    @property
+    def history(self):
+        return self.protocol.history
+
+    @property
+    def last_history(self):
+        return self.protocol.last_history
 
     def log_response(self, response):
         """
@@ -34,64 +49,97 @@ class Transmission(object):
 
     def send_received(self):
         """Send the "Packet Received" Packet."""
-        packet = PacketReceived()
-        self.history += [(False, packet), ]
-        self.transport.send(packet, no_wait=True)
+        self.protocol.send_received()
+        self._send_queued()
 
     def handle_packet_response(self, packet, response):
-        """A shortcut for calling the handle_response of the packet."""
-        return packet.handle_response(response, self)
+        """
+        A shortcut for calling the handle_response of the packet. It
+        gets the protocol, which queues what it sends.
+        """
+        return packet.handle_response(response, self.protocol)
+
+    def _send_queued(self):
+        packets = self.protocol.packets_to_send()
+        if packets:
+            self.transport.send_packets(packets)
 
     def _transmit(self, packet, history):
         """
         Transmit the packet, go into slave mode and wait until the whole
         sequence is finished.
         """
-        if not self.is_master or self.is_waiting:
+        if self.is_waiting:
             raise TransmissionException(
                 'Can\'t send until transmisson is ready')
-        self.is_master = False
-        self.last = packet
+        protocol = self.protocol
+        protocol.send(packet, history)
         try:
-            history += [(False, packet)]
-            success, response = self.transport.send(packet)
-            history += [(True, response)]
-            # we sent the packet.
+            # the command goes out with anything else the protocol queued,
+            # the first answer comes within the timeout of the transport.
+            self._send_queued()
+            success, response = self.transport.receive()
+            protocol.receive_packet(response)
             # now lets wait until we get master back.
-            while not self.is_master:
-                self.is_master = self.handle_packet_response(
-                    self.last, response)
-                if self.is_master:
-                    break
-                try:
-                    success, response = self.transport.receive(
-                        self.actual_timeout)
-                    history += [(True, response)]
-                except TransportLayerException:
-                    # some kind of timeout.
-                    # if we are already master, we can bravely ignore this.
-                    if self.is_master:
-                        return TRANSMIT_OK
-                    raise
-                if self.is_master and success:
-                    # we actually have to handle a last packet
-                    stay_master = self.handle_packet_response(
-                        packet, response)
-                    print('Is Master Read Ahead happened.')
-                    self.is_master = stay_master
+            while not protocol.is_master:
+                # answers to packets which came back to back are sent
+                # together, once the transport has no more of them.
+                if not self.transport.has_apdu:
+                    self._send_queued()
+                success, response = self.transport.receive(
+                    self.actual_timeout)
+                protocol.receive_packet(response)
+            self._send_queued()
         except Exception:
-            self.is_master = True
+            protocol.reset()
             raise
-        self.is_master = True
         return TRANSMIT_OK
 
     def transmit(self, packet, history=None):
-        # we create a new history:
-        self.last_history = history or []
+        return self._transmit(packet, history)
+
+
+class AsyncTransmission(Transmission):
+    """
+    Transmission over an asynchronous transport like the
+    AsyncSocketTransport, transmit is a coroutine. Packets are queued
+    with transport.write and drained before the next packet is read.
+    """
+
+    def send_received(self):
+        """Queue the "Packet Received" Packet."""
+        self.protocol.send_received()
+        self._write_queued()
+
+    def _write_queued(self):
+        for packet in self.protocol.packets_to_send():
+            self.transport.write(packet)
+
+    async def _transmit(self, packet, history):
+        """
+        Transmit the packet, go into slave mode and wait until the whole
+        sequence is finished.
+        """
+        if self.is_waiting:
+            raise TransmissionException(
+                'Can\'t send until transmisson is ready')
+        protocol = self.protocol
+        protocol.send(packet, history)
+        # the first answer comes within the timeout of the transport.
+        timeout = None
         try:
-            ret = self._transmit(packet, self.last_history)
-            self.history += self.last_history
-            return ret
+            while True:
+                self._write_queued()
+                await self.transport.drain()
+                if protocol.is_master:
+                    break
+                success, response = await self.transport.receive(timeout)
+                protocol.receive_packet(response)
+                timeout = self.actual_timeout
         except Exception:
-            self.history += self.last_history
+            protocol.reset()
             raise
+        return TRANSMIT_OK
+
+    async def transmit(self, packet, history=None):
+        return await self._transmit(packet, history)
@@ -0,0 +1,237 @@
+"""
+Serial Framing.
+
+The serial layer of the ZVT protocol wraps every APDU in a frame:
+
+    DLE STX <APDU, every DLE doubled> DLE ETX CRC-L CRC-H
+
+This module holds the framing logic independent of any port, so it can
+be used by the SerialTransport as well as by offline tools which only
+have a captured byte stream (logs, sniffer dumps).
+
+Over TCP/IP the APDUs follow each other without a frame, APDUDecoder
+splits such a stream.
+
+@author g4b
+"""
+from collections import namedtuple
+
+from ecrterm.crc import CRC16, verify_checksums
+from ecrterm.transmission.signals import ACK, DLE, ETX, NAK, STX
+
+#: a decoded frame: the unstuffed apdu and the two crc bytes (low, high)
+SerialFrame = namedtuple('SerialFrame', ['apdu', 'crc'])
+
+_FRAME_START = bytes([DLE, STX])
+_FRAME_END = bytes([DLE, ETX])
+_DLE = bytes([DLE])
+_DLE_DLE = bytes([DLE, DLE])
+_ETX = bytes([ETX])
+
+# decoder states
+_IDLE = 0
+_APDU = 1
+_CRC = 2
+
+
+def frame_crc(apdu):
+    """
+    Returns the crc of an apdu as int. The crc covers the unstuffed apdu
+    and the closing ETX.
+    """
+    return CRC16(apdu).update(_ETX).crc
+
+
+def verify_frames(frames):
+    """
+    Checks the crc of many decoded frames at once, e.g. all frames of a
+    captured log. Returns a list of bools in the order of `frames`.
+    """
+    return verify_checksums(frames, suffix=_ETX)
+
+
+def encode_serial_frame(apdu, crc=None):
+    """
+    Builds the complete serial frame for an apdu as bytes:
+    DLE STX, the apdu with every DLE doubled, DLE ETX, CRC-L, CRC-H.
+
+    @param apdu: bytes, bytearray or a list of ints.
+    @param crc: the crc as int, if it is already known.
+    """
+    apdu = bytes(apdu)
+    if crc is None:
+        crc = frame_crc(apdu)
+    frame = bytearray(_FRAME_START)
+    frame += apdu.replace(_DLE, _DLE_DLE)
+    frame += _FRAME_END
+    frame.append(crc & 0xFF)
+    frame.append(crc >> 8)
+    return bytes(frame)
+
+
+class SerialFrameDecoder(object):
+    """
+    Incremental decoder for serial frames.
+
+    Feed it whatever bytes the port has buffered, it returns all frames
+    completed by that chunk and keeps partial data for the next call::
+
+        decoder = SerialFrameDecoder()
+        for frame in decoder.feed(port.read(port.in_waiting or 1)):
+            handle(frame.apdu, frame.crc)
+
+    Garbage in front of a frame is skipped. A DLE followed by anything
+    but DLE, ETX or STX inside a frame drops that frame; the decoder
+    resynchronises at the next DLE STX. Both cases are counted in
+    `discarded` and `errors`.
+
+    If `keep_control` is set, ACK and NAK bytes received between frames
+    are returned as ints in the output of `feed`.
+    """
+
+    def __init__(self, keep_control=False):
+        self.keep_control = keep_control
+        self.errors = 0
+        self.discarded = 0
+        self.reset()
+
+    def reset(self):
+        """Forget any partial frame and buffered data."""
+        self._state = _IDLE
+        self._buffer = bytearray()
+        self._apdu = bytearray()
+        self._crc = bytearray()
+
+    @property
+    def idle(self):
+        """True if the decoder is not in the middle of a frame."""
+        return self._state == _IDLE and not self._buffer
+
+    def feed(self, data):
+        """
+        Add data to the stream, return a list of completed frames.
+        """
+        if data:
+            self._buffer += data
+        buf = self._buffer
+        size = len(buf)
+        pos = 0
+        more = False
+        frames = []
+        while pos < size and not more:
+            if self._state == _IDLE:
+                pos, more = self._skip_to_frame(buf, pos, size, frames)
+            elif self._state == _APDU:
+                pos, more = self._read_apdu(buf, pos, size)
+            else:
+                end = min(size, pos + 2 - len(self._crc))
+                self._crc += buf[pos:end]
+                pos = end
+                if len(self._crc) == 2:
+                    frames.append(
+                        SerialFrame(bytes(self._apdu), bytes(self._crc)))
+                    self._apdu = bytearray()
+                    self._crc = bytearray()
+                    self._state = _IDLE
+        # keep whatever we could not consume yet.
+        del buf[:pos]
+        return frames
+
+    def _skip_to_frame(self, buf, pos, size, frames):
+        if self.keep_control:
+            while pos < size and buf[pos] in (ACK, NAK):
+                frames.append(buf[pos])
+                pos += 1
+            if pos == size:
+                return pos, False
+        start = buf.find(_FRAME_START, pos)
+        if start < 0:
+            # a trailing DLE might be the start of the next frame.
+            keep = size - 1 if buf[size - 1] == DLE else size
+            self.discarded += keep - pos
+            return keep, keep < size
+        self.discarded += start - pos
+        self._state = _APDU
+        return start + 2, False
+
+    def _read_apdu(self, buf, pos, size):
+        dle = buf.find(DLE, pos)
+        if dle < 0:
+            self._apdu += buf[pos:size]
+            return size, False
+        self._apdu += buf[pos:dle]
+        if dle + 1 == size:
+            # we have to see the byte after DLE first.
+            return dle, True
+        follow = buf[dle + 1]
+        if follow == DLE:
+            # stuffed DLE, we take one.
+            self._apdu.append(DLE)
+        elif follow == ETX:
+            self._state = _CRC
+        elif follow == STX:
+            # a new frame starts in the middle of this one.
+            self._drop_frame()
+            self._state = _APDU
+        else:
+            # DLE without sense, drop the frame and resync.
+            self._drop_frame()
+        return dle + 2, False
+
+    def _drop_frame(self):
+        self.errors += 1
+        self.discarded += len(self._apdu)
+        self._apdu = bytearray()
+        self._state = _IDLE
+
+
+def iter_serial_frames(chunks):
+    """
+    Decode frames from an iterable of byte chunks, e.g. a captured log
+    file opened in binary mode.
+    """
+    decoder = SerialFrameDecoder()
+    for chunk in chunks:
+        for frame in decoder.feed(chunk):
+            yield frame
+
+
+class APDUDecoder(object):
+    """
+    Incremental decoder for a stream of APDUs without framing, as sent
+    over TCP/IP. feed returns the APDUs completed by a chunk as bytes
+    and keeps partial data for the next call.
+    """
+    __slots__ = ('_buffer',)
+
+    def __init__(self):
+        self._buffer = bytearray()
+
+    @property
+    def idle(self):
+        """True if the decoder holds no partial APDU."""
+        return not self._buffer
+
+    def feed(self, data):
+        """Add data to the stream, return a list of completed APDUs."""
+        buf = self._buffer
+        buf += data
+        size = len(buf)
+        pos = 0
+        apdus = []
+        while size - pos >= 3:
+            length = buf[pos + 2]
+            start = pos + 3
+            if length == 0xFF:
+                # two bytes length follow, low byte first.
+                if size - pos < 5:
+                    break
+                length = buf[pos + 3] | buf[pos + 4] << 8
+                start = pos + 5
+            end = start + length
+            if end > size:
+                break
+            apdus.append(bytes(buf[pos:end]))
+            pos = end
+        del buf[:pos]
+        return apdus
@@ -0,0 +1,358 @@
+"""
+Terminal Manager.
+
+Drives many PTs from one thread: a TerminalManager waits for all their
+sockets and serial ports with the selectors module and advances the
+ZVTProtocol of a terminal whenever its data arrives. Commands are
+submitted per terminal and answered with futures, from any thread::
+
+    manager = TerminalManager()
+    lanes = [manager.add('socket://192.168.1.%d:20007' % i)
+             for i in range(101, 141)]
+    threading.Thread(target=manager.run_forever, daemon=True).start()
+    future = lanes[0].submit(Authorisation(amount=100))
+    packet = future.result()  # packet.completion tells the outcome
+
+The devices are the ones of ECR, see the transport registry. The
+connection is opened in add, then used without blocking.
+"""
+import selectors
+import socket
+import time
+from collections import deque
+from concurrent.futures import Future
+
+from ecrterm.exceptions import (
+    TransportConnectionFailed, TransportLayerException,
+    TransportTimeoutException)
+from ecrterm.packets.apdu import APDUPacket
+from ecrterm.transmission.framing import (
+    SerialFrameDecoder, encode_serial_frame, frame_crc)
+from ecrterm.transmission.protocol import ZVTProtocol
+from ecrterm.transmission.registry import create_transport
+from ecrterm.transmission.signals import (
+    ACK, ACK_BYTE, NAK, NAK_BYTE, TIMEOUT_T3)
+from ecrterm.transmission.transport_socket import SocketReader
+
+
+class SocketChannel(object):
+    """The non-blocking socket of a SocketTransport."""
+
+    def __init__(self, transport):
+        self.sock = transport.sock
+        self.sock.setblocking(False)
+        self.reader = SocketReader(self.sock)
+        self.output = bytearray()
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    @property
+    def wants_write(self):
+        return bool(self.output)
+
+    def read(self):
+        """Returns the APDUs completed by the received data."""
+        try:
+            return self.reader.read()
+        except BlockingIOError:
+            return []
+        except OSError as exc:
+            raise TransportLayerException(str(exc))
+
+    def write(self, packets):
+        """Queue packets, they are sent with the next flush."""
+        for packet in packets:
+            self.output += packet.to_bytes()
+
+    def flush(self):
+        if not self.output:
+            return
+        try:
+            sent = self.sock.send(self.output)
+        except BlockingIOError:
+            return
+        del self.output[:sent]
+
+    def reset(self):
+        """Drops a partly received APDU."""
+        self.reader.reset()
+
+    def close(self):
+        self.sock.close()
+
+
+class SerialChannel(object):
+    """
+    The port of a SerialTransport. Every frame is acknowledged with ACK
+    (or NAK for a bad crc) and sent frames wait for theirs before the
+    next one is written.
+    """
+    wants_write = False
+
+    def __init__(self, transport):
+        self.port = transport.connection
+        self.port.timeout = 0
+        self.decoder = SerialFrameDecoder(keep_control=True)
+        self.frames = deque()
+        self.unacknowledged = None
+
+    def fileno(self):
+        return self.port.fileno()
+
+    def read(self):
+        """Returns the APDUs of the received frames with a valid crc."""
+        apdus = []
+        data = self.port.read(self.port.in_waiting or 1)
+        for frame in self.decoder.feed(data):
+            if frame == ACK:
+                self.unacknowledged = None
+                self._next_frame()
+            elif frame == NAK:
+                raise TransportLayerException('Could not send message')
+            elif frame_crc(frame.apdu) == frame.crc[0] | frame.crc[1] << 8:
+                self.port.write(ACK_BYTE)
+                apdus.append(frame.apdu)
+            else:
+                self.port.write(NAK_BYTE)
+        return apdus
+
+    def write(self, packets):
+        for packet in packets:
+            self.frames.append(packet.encode_with(encode_serial_frame))
+        self._next_frame()
+
+    def flush(self):
+        pass
+
+    def _next_frame(self):
+        if self.unacknowledged is None and self.frames:
+            self.unacknowledged = self.frames.popleft()
+            self.port.write(self.unacknowledged)
+
+    def reset(self):
+        """Drops the frames waiting for an ACK and partial frames."""
+        self.unacknowledged = None
+        self.frames.clear()
+        self.decoder.reset()
+
+    def close(self):
+        self.port.close()
+
+
+def channel_for(transport):
+    """Returns the channel for a connected transport."""
+    if getattr(transport, 'sock', None) is not None:
+        return SocketChannel(transport)
+    if getattr(transport, 'connection', None) is not None:
+        return SerialChannel(transport)
+    raise TypeError('%s can not be managed.' % type(transport).__name__)
+
+
+class Terminal(object):
+    """
+    One PT of a TerminalManager. Its commands are transmitted one
+    after the other.
+    """
+    #: seconds to wait for the first answer to a command.
+    answer_timeout = TIMEOUT_T3
+
+    def __init__(self, manager, transport):
+        self.manager = manager
+        self.transport = transport
+        self.channel = channel_for(transport)
+        self.protocol = ZVTProtocol()
+        self.commands = deque()
+        self.current = None
+        self.deadline = None
+        self.error = None
+
+    def submit(self, packet, listener=None):
+        """
+        Queues a command, returns a Future of the packet, which is set
+        once the terminal is master again. listener is called with the
+        events of the protocol (in the thread of the manager).
+        """
+        future = Future()
+        if self.error is not None:
+            future.set_exception(self.error)
+            return future
+        self.commands.append((packet, future, listener))
+        self.manager.wakeup()
+        return future
+
+    def start(self):
+        """Starts the next command if the terminal is idle."""
+        while self.current is None and self.commands:
+            packet, future, listener = self.commands.popleft()
+            if not future.set_running_or_notify_cancel():
+                continue
+            self.current = (packet, future, listener)
+            self.protocol.send(packet)
+            self.deadline = time.monotonic() + self.answer_timeout
+            try:
+                self.channel.write(self.protocol.packets_to_send())
+            except Exception as exc:
+                self.fail(exc)
+
+    def writable(self):
+        try:
+            self.channel.flush()
+        except Exception as exc:
+            self.fail(exc)
+
+    def readable(self):
+        try:
+            apdus = self.channel.read()
+            for apdu in apdus:
+                self.handle_packet(APDUPacket.parse(apdu))
+            self.channel.write(self.protocol.packets_to_send())
+        except Exception as exc:
+            self.fail(exc)
+
+    def handle_packet(self, response):
+        events = self.protocol.receive_packet(response)
+        if self.current is None:
+            return
+        packet, future, listener = self.current
+        if listener:
+            for event in events:
+                listener(event)
+        if self.protocol.is_master:
+            self.current = None
+            self.deadline = None
+            future.set_result(packet)
+        else:
+            self.deadline = time.monotonic() + self.protocol.actual_timeout
+
+    def check_timeout(self, now):
+        if self.deadline is not None and now >= self.deadline:
+            self.protocol.reset()
+            self.channel.reset()
+            self.deadline = None
+            packet, future, listener = self.current
+            self.current = None
+            future.set_exception(TransportTimeoutException('Timed out.'))
+
+    def fail(self, exc):
+        """The connection is broken: fail all commands, stop the terminal."""
+        self.error = exc
+        self.protocol.reset()
+        self.channel.reset()
+        self.deadline = None
+        if self.current is not None:
+            self.current[1].set_exception(exc)
+            self.current = None
+        while self.commands:
+            packet, future, listener = self.commands.popleft()
+            if future.set_running_or_notify_cancel():
+                future.set_exception(exc)
+        self.manager.remove(self)
+
+
+class TerminalManager(object):
+    """Many terminals on one selector, see the module documentation."""
+
+    def __init__(self, selector=None):
+        self.selector = selector or selectors.DefaultSelector()
+        self.terminals = []
+        self._running = False
+        self._wakeup_read, self._wakeup_write = socket.socketpair()
+        self._wakeup_read.setblocking(False)
+        self._wakeup_write.setblocking(False)
+        self.selector.register(
+            self._wakeup_read, selectors.EVENT_READ, None)
+
+    def add(self, device):
+        """Connects to device, returns its Terminal."""
+        transport = create_transport(device)
+        if not transport.connect():
+            raise TransportConnectionFailed('Could not connect %s.' % device)
+        return self.add_transport(transport)
+
+    def add_transport(self, transport):
+        """Adds an already connected transport, returns its Terminal."""
+        terminal = Terminal(self, transport)
+        self.terminals.append(terminal)
+        self.selector.register(
+            terminal.channel, selectors.EVENT_READ, terminal)
+        return terminal
+
+    def remove(self, terminal):
+        """Stops managing a terminal and closes its connection."""
+        if terminal in self.terminals:
+            self.terminals.remove(terminal)
+            self.selector.unregister(terminal.channel)
+            terminal.channel.close()
+
+    def wakeup(self):
+        """Lets a waiting poll return, e.g. for new commands."""
+        try:
+            self._wakeup_write.send(b'\0')
+        except BlockingIOError:
+            # a wakeup is pending anyway.
+            pass
+
+    def poll(self, timeout=None):
+        """
+        Waits up to timeout seconds for data of the terminals and
+        advances them.
+        """
+        for terminal in list(self.terminals):
+            terminal.start()
+        self._flush()
+        deadlines = [t.deadline for t in self.terminals
+                     if t.deadline is not None]
+        if deadlines:
+            wait = max(0, min(deadlines) - time.monotonic())
+            timeout = wait if timeout is None else min(timeout, wait)
+        for key, events in self.selector.select(timeout):
+            terminal = key.data
+            if terminal is None:
+                self._wakeup_read.recv(4096)
+                continue
+            if events & selectors.EVENT_WRITE:
+                terminal.writable()
+            if events & selectors.EVENT_READ and terminal.error is None:
+                terminal.readable()
+        now = time.monotonic()
+        for terminal in list(self.terminals):
+            terminal.check_timeout(now)
+            terminal.start()
+        self._flush()
+
+    def _flush(self):
+        """
+        Send what the terminals queued in one write each, e.g. the
+        "Packet Received" of a completion and the next command.
+        """
+        for terminal in list(self.terminals):
+            if terminal.channel.wants_write:
+                terminal.writable()
+        self._update_writers()
+
+    def _update_writers(self):
+        for terminal in self.terminals:
+            events = selectors.EVENT_READ
+            if terminal.channel.wants_write:
+                events |= selectors.EVENT_WRITE
+            if self.selector.get_key(terminal.channel).events != events:
+                self.selector.modify(terminal.channel, events, terminal)
+
+    def run_forever(self):
+        """Polls until stop is called."""
+        self._running = True
+        while self._running:
+            self.poll()
+
+    def stop(self):
+        self._running = False
+        self.wakeup()
+
+    def close(self):
+        for terminal in list(self.terminals):
+            self.remove(terminal)
+        self.selector.unregister(self._wakeup_read)
+        self._wakeup_read.close()
+        self._wakeup_write.close()
+        self.selector.close()
@@ -0,0 +1,189 @@
+"""
+ZVT Protocol.
+
+The master/slave exchange of the ZVT protocol without any I/O. The ECR
+is master until it sends a command, then it answers the packets of the
+PT until one of them makes it master again (usually a completion or
+an abort).
+
+ZVTProtocol is fed with the packets to send and the data received, and
+returns what to write and what happened as events. Runners move the
+data: Transmission and AsyncTransmission over their transports, or
+anything with a socket::
+
+    protocol = ZVTProtocol()
+    protocol.send(StatusEnquiry('123456'))
+    sock.sendall(protocol.data_to_send())
+    while not protocol.is_master:
+        for event in protocol.receive_data(sock.recv(4096)):
+            handle(event)
+        sock.sendall(protocol.data_to_send())
+
+Transports which parse packets themselves (like the SerialTransport)
+use receive_packet and packets_to_send instead.
+"""
+from collections import namedtuple
+
+from ecrterm.exceptions import TransmissionException
+from ecrterm.packets.apdu import APDUPacket
+from ecrterm.packets.base_packets import (
+    Abort, Completion, IntermediateStatusInformation, PacketReceived,
+    PrintLine, PrintTextBlock, StatusInformation)
+from ecrterm.transmission.framing import APDUDecoder
+from ecrterm.transmission.signals import TIMEOUT_T4_DEFAULT
+
+#: "Packet Received" never changes, so it is serialized only once.
+PACKET_RECEIVED = PacketReceived().freeze()
+
+
+class Event(namedtuple('Event', ['packet'])):
+    """Something happened in the exchange, `packet` tells what."""
+    __slots__ = ()
+
+
+class StatusEvent(Event):
+    """(Intermediate) status information of the PT."""
+    __slots__ = ()
+
+
+class PrintEvent(Event):
+    """A print line or print text block of the PT."""
+    __slots__ = ()
+
+
+class CompletionEvent(Event):
+    """The PT completed the command."""
+    __slots__ = ()
+
+
+class AbortEvent(Event):
+    """The PT aborted the command."""
+    __slots__ = ()
+
+
+class ResponseEvent(Event):
+    """Any other packet of the PT, e.g. Packet Received."""
+    __slots__ = ()
+
+
+class MasterRegainedEvent(Event):
+    """The transmission of `packet` is over, the ECR is master again."""
+    __slots__ = ()
+
+
+_EVENTS = (
+    (Completion, CompletionEvent),
+    (Abort, AbortEvent),
+    ((StatusInformation, IntermediateStatusInformation), StatusEvent),
+    ((PrintLine, PrintTextBlock), PrintEvent),
+)
+
+
+def event_for(packet):
+    """Returns the event for a packet received from the PT."""
+    for classes, event in _EVENTS:
+        if isinstance(packet, classes):
+            return event(packet)
+    return ResponseEvent(packet)
+
+
+class ZVTProtocol(object):
+    """
+    State of the exchange with one PT. `history` holds all packets as
+    (incoming, packet), `last_history` those of the last transmission.
+
+    The packets' handle_response gets the protocol as `tm`. With a
+    `transmission` (the runner), the protocol asks it to handle the
+    responses and falls back to its attributes, like `transport`, so
+    hooks written for the Transmission keep working.
+    """
+    #: seconds a runner should wait for the next packet as slave.
+    actual_timeout = TIMEOUT_T4_DEFAULT
+
+    def __init__(self, transmission=None):
+        self.transmission = transmission
+        self.is_master = True
+        self.last = None  # saves last sent master
+        self.history = []
+        self.last_history = []
+        self._outgoing = []
+        self._decoder = APDUDecoder()
+
+    def send(self, packet, history=None):
+        """
+        Starts the transmission of a command, queues it for sending.
+        Only the master can send.
+        """
+        if not self.is_master:
+            raise TransmissionException(
+                'Can\'t send until transmisson is ready')
+        self.is_master = False
+        self.last = packet
+        self.last_history = history if history is not None else []
+        self._record(False, packet)
+        self._outgoing.append(packet)
+
+    def send_received(self):
+        """Queue the "Packet Received" Packet."""
+        self._record(False, PACKET_RECEIVED)
+        self._outgoing.append(PACKET_RECEIVED)
+
+    def __getattr__(self, name):
+        # only called for attributes the protocol does not have.
+        transmission = self.__dict__.get('transmission')
+        if transmission is None:
+            raise AttributeError(name)
+        return getattr(transmission, name)
+
+    def handle_packet_response(self, packet, response):
+        """A shortcut for calling the handle_response of the packet."""
+        return packet.handle_response(response, self)
+
+    def receive_packet(self, response):
+        """
+        Handles a packet received from the PT, returns a list of events.
+        Answers to it are queued.
+        """
+        self._record(True, response)
+        events = [event_for(response)]
+        handler = self.transmission or self
+        if not self.is_master and handler.handle_packet_response(
+                self.last, response):
+            self.is_master = True
+            events.append(MasterRegainedEvent(self.last))
+        return events
+
+    def receive_data(self, data):
+        """
+        Handles bytes received from the PT, which may hold any number of
+        packets or parts of them. Returns a list of events.
+        """
+        events = []
+        for apdu in self._decoder.feed(data):
+            events += self.receive_packet(APDUPacket.parse(apdu))
+        return events
+
+    def packets_to_send(self):
+        """Returns the queued packets and clears the queue."""
+        packets, self._outgoing = self._outgoing, []
+        return packets
+
+    def data_to_send(self):
+        """Returns the queued packets as bytes and clears the queue."""
+        return b''.join([packet.to_bytes()
+                         for packet in self.packets_to_send()])
+
+    def reset(self):
+        """
+        Ends the transmission after an error of the runner, like a
+        timeout: the ECR is master again, queued and partial data is
+        dropped.
+        """
+        self.is_master = True
+        self._outgoing = []
+        self._decoder = APDUDecoder()
+
+    def _record(self, incoming, packet):
+        entry = (incoming, packet)
+        self.last_history.append(entry)
+        self.history.append(entry)
@@ -0,0 +1,56 @@
+"""
+Transport Registry.
+
+Transports are registered by the prefix of the device they handle,
+with their class or its dotted path. A dotted path is only imported
+when a device needs it, so a TCP/IP only service never loads pyserial::
+
+    register_transport(
+        'usb://', 'mypackage.transport_usb:UsbTransport')
+    transport = create_transport('usb://0403:6001')
+
+The transport class is called with the device as its only argument.
+"""
+from importlib import import_module
+
+#: (prefix, transport class or 'module:Class'), searched in order.
+TRANSPORTS = []
+
+
+def register_transport(prefix, transport):
+    """
+    Registers a transport for devices starting with prefix, replacing
+    a transport registered for the same prefix.
+    """
+    for index, (known, _) in enumerate(TRANSPORTS):
+        if known == prefix:
+            TRANSPORTS[index] = (prefix, transport)
+            return
+    TRANSPORTS.append((prefix, transport))
+
+
+_SERIAL = 'ecrterm.transmission.transport_serial:SerialTransport'
+register_transport('/', _SERIAL)
+register_transport('COM', _SERIAL)
+register_transport(
+    'socket://', 'ecrterm.transmission.transport_socket:SocketTransport')
+
+
+def get_transport_class(device):
+    """
+    Returns the transport class for device, importing it if needed.
+    Raises ValueError for unknown devices.
+    """
+    for index, (prefix, transport) in enumerate(TRANSPORTS):
+        if device.startswith(prefix):
+            if isinstance(transport, str):
+                module, name = transport.split(':')
+                transport = getattr(import_module(module), name)
+                TRANSPORTS[index] = (prefix, transport)
+            return transport
+    raise ValueError('No transport registered for device %s' % device)
+
+
+def create_transport(device):
+    """Returns a new transport for device."""
+    return get_transport_class(device)(device)
@@ -15,6 +15,9 @@ ETX = 0x03
 ACK = 0x06
 #: NAK
 NAK = 0x15
+#: ACK and NAK as written to the serial port.
+ACK_BYTE = bytes([ACK])
+NAK_BYTE = bytes([NAK])
 #: carriage return
 CR = 0x0d
 #: linefeed
@@ -6,20 +6,24 @@ The Serial Layer is a transport used for
 @author g4b
 """
 import datetime
+from collections import deque
 
 import serial
 from ecrterm.common import Transport, noop
-from ecrterm.conv import bs2hl, hl2bs, toBytes, toHexString
-from ecrterm.crc import crc_xmodem16
+from ecrterm.conv import bs2hl, toBytes, toHexString
 from ecrterm.exceptions import (
     TransportLayerException, TransportTimeoutException)
 from ecrterm.packets.apdu import APDUPacket
+from ecrterm.transmission.framing import (
+    SerialFrameDecoder, encode_serial_frame, frame_crc)
 from ecrterm.transmission.signals import (
-    ACK, DLE, ETX, NAK, STX, TIMEOUT_T1, TIMEOUT_T2)
+    ACK, ACK_BYTE, DLE, ETX, NAK, NAK_BYTE, STX, TIMEOUT_T1, TIMEOUT_T2)
 from ecrterm.utils import ensure_bytes, is_stringlike
 from time import time
 
 SERIAL_DEBUG = False
+_FRAME_START = bytes([DLE, STX])
+_FRAME_END = bytes([DLE, ETX])
 
 
 def std_serial_log(instance, data, incoming=False):
@@ -40,23 +44,34 @@ class SerialMessage(object):
     and inserting it into the final Serial Packet
     CRC and double-DLEs included.
     """
-    apdu = None
+    _apdu = None
+    _crc = None
 
     def __init__(self, apdu=None):
-        if is_stringlike(apdu):
+        if isinstance(apdu, str):
             # try to get the list of bytes.
             apdu = toBytes(apdu.replace(' ', ''))
         elif isinstance(apdu, APDUPacket):
-            apdu = apdu.to_list()
+            apdu = apdu.to_bytes()
         self.apdu = apdu
 
+    def _get_apdu(self):
+        return self._apdu
+
+    def _set_apdu(self, apdu):
+        self._apdu = apdu
+        self._crc = None
+    apdu = property(_get_apdu, _set_apdu)
+
     def _get_crc(self):
-        data = hl2bs(self.apdu + [ETX])
-        try:
-            return crc_xmodem16(data)
-        except Exception:
-            print(self.apdu)
-            raise
+        # the crc is calculated only once per message.
+        if self._crc is None:
+            try:
+                self._crc = frame_crc(self.apdu)
+            except Exception:
+                print(self.apdu)
+                raise
+        return self._crc
 
     def _get_crc_l(self):
         return self._get_crc() & 0x00FF
@@ -71,41 +86,32 @@ class SerialMessage(object):
 
     def enrich(self, apdu):
         # add 0x10 to each 0x10 in apdu
-        # since we use del later, it would occasionally hit the instance
-        apdu = apdu[:]
-        new_apdu = []
-        while len(apdu):
-            if apdu.count(DLE):
-                new_apdu += apdu[:apdu.index(DLE) + 1] + [DLE]
-                del apdu[:apdu.index(DLE) + 1]
-            else:
-                new_apdu += apdu
-                apdu = []
-        return new_apdu
+        return list(bytes(apdu).replace(bytes([DLE]), bytes([DLE, DLE])))
 
     def __repr__(self):
         return 'SerialMessage (APDU: %s, CRC-L: %s CRC-H: %s)' % (
-            toHexString(self.apdu),
+            toHexString(list(self.apdu)),
             hex(self.crc_l),
             hex(self.crc_h))
 
     def dump_message(self):
-        # if 0x10 in apdu:
-        apdu = self.enrich(self.apdu)
-        return [DLE, STX] + apdu + [DLE, ETX, self.crc_l, self.crc_h]
+        return list(self.as_bin())
 
     def as_bin(self):
-        return hl2bs(self.dump_message())
+        return encode_serial_frame(self.apdu, self._get_crc())
 
 
 class SerialTransport(Transport):
     SerialCls = serial.Serial
     slog = noop
     insert_delays = True
+    supports_detection = True
 
     def __init__(self, device):
         self.device = device
         self.connection = None
+        self.decoder = SerialFrameDecoder()
+        self._frames = deque()
 
     def connect(self, timeout=30):
         ser = self.SerialCls(
@@ -133,6 +139,8 @@ class SerialTransport(Transport):
             self.connection.close()
 
     def reset(self):
+        self.decoder.reset()
+        self._frames.clear()
         if self.connection:
             self.connection.flushInput()
             self.connection.flushOutput()
@@ -149,76 +157,54 @@ class SerialTransport(Transport):
         try:
             self.slog([ACK])
         finally:
-            self.connection.write(ensure_bytes(chr(ACK)))
+            self.connection.write(ACK_BYTE)
 
     def write_nak(self):
         try:
             self.slog([NAK])
         finally:
-            self.connection.write(ensure_bytes(chr(NAK)))
+            self.connection.write(NAK_BYTE)
 
     def read(self, timeout=TIMEOUT_T2):
+        """Reads a message packet, returns crc and apdu as lists."""
+        frame = self.read_frame(timeout)
+        return list(frame.crc), list(frame.apdu)
+
+    def read_frame(self, timeout=TIMEOUT_T2):
         """Reads a message packet. any errors are raised directly."""
         # if in 5 seconds no message appears, we respond with a nak and
         # raise an error.
         self.connection.timeout = timeout
-        apdu = []
-        crc = None
-        header = self.connection.read(2)
-        header = bs2hl(header)
-        # test if there was a transmission:
-        if header == []:
-            raise TransportLayerException('Reading Header Timeout')
-        # test our header to be valid
-        if header != [DLE, STX]:
-            self.slog(header, True)
-            raise TransportLayerException('Header Error: %s' % header)
-        # read until DLE, ETX is reached.
-        dle = False
-        # timeout to T1 after header.
-        self.connection.timeout = TIMEOUT_T1
-        while not crc:
-            b = ord(self.connection.read(1))  # read a byte.
-            if b is None:
-                # timeout
+        decoder = self.decoder
+        errors = decoder.errors
+        while not self._frames:
+            # take everything the port has buffered, but at least a byte.
+            waiting = getattr(self.connection, 'in_waiting', 0)
+            chunk = self.connection.read(waiting or 1)
+            if not chunk:
+                if decoder.idle:
+                    raise TransportLayerException('Reading Header Timeout')
                 raise TransportLayerException('Timeout T1 reading stream.')
-            if b == ETX and dle:
-                # dle was set, and this is ETX, so we are at the end.
-                # we read the CRC now.
-                crc = self.connection.read(2)
-                if not crc:
-                    raise TransportLayerException('Timeout T1 reading CRC')
-                else:
-                    crc = bs2hl(crc)
-                # and break
-                continue
-            elif b == DLE:
-                if not dle:
-                    # this is a dle
-                    dle = True
-                    continue
-                else:
-                    # this is the second dle. we take it.
-                    dle = False
-            elif dle:
+            self._frames.extend(decoder.feed(chunk))
+            if decoder.errors != errors:
                 # dle was set, but we got no etx here.
-                # this seems to be an error.
                 raise TransportLayerException('DLE without sense detected.')
-            # we add this byte to our apdu.
-            apdu += [b]
-        self.slog(header + apdu + [DLE, ETX] + crc, True)
-        return crc, apdu
+            # timeout to T1 after header.
+            self.connection.timeout = TIMEOUT_T1
+        frame = self._frames.popleft()
+        self.slog(_FRAME_START + frame.apdu + _FRAME_END + frame.crc, True)
+        return frame
 
     def read_message(self, timeout=TIMEOUT_T2):
         try:
-            crc, apdu = self.read(timeout)
-            msg = SerialMessage(apdu)
+            frame = self.read_frame(timeout)
+            msg = SerialMessage(frame.apdu)
         except Exception:
             # this is a NAK - re-raise for further investigation.
             self.write_nak()
             raise
         # test the CRC:
-        if msg.crc() == crc:
+        if msg.crc() == list(frame.crc):
             self.write_ack()
             return True, msg
         else:
@@ -237,7 +223,7 @@ class SerialTransport(Transport):
         if not crc_ok:
             # Message Fail!?
             self.write_nak()
-            return False, message.apdu
+            return False, list(message.apdu)
         # otherwise
         return True, APDUPacket.parse(message.apdu)
 
@@ -249,7 +235,15 @@ class SerialTransport(Transport):
         yourself.
         """
         if message:
-            self.write(message.as_bin())
+            return self.send_frame(message.as_bin(), tries, no_wait)
+
+    def send_frame(self, frame, tries=0, no_wait=False):
+        """
+        writes a complete serial frame and waits for the acknowledge,
+        then reads the answer unless no_wait is set.
+        """
+        if frame:
+            self.write(frame)
             acknowledge = b''
             ts_start = time()
             while not acknowledge:
@@ -260,12 +254,12 @@ class SerialTransport(Transport):
                     break
             self.slog(acknowledge, True)
             # if nak, we retry, if ack, we read, if other, we raise.
-            if acknowledge == ensure_bytes(chr(ACK)):
+            if acknowledge == ACK_BYTE:
                 # everything alright.
                 if no_wait:
                     return True
                 return self.receive()
-            elif acknowledge == ensure_bytes(chr(NAK)):
+            elif acknowledge == NAK_BYTE:
                 # not everything allright.
                 # if tries < 3:
                 #    return self.send_message(message, tries + 1, no_answer)
@@ -279,6 +273,10 @@ class SerialTransport(Transport):
 
     def send(self, apdu, tries=0, no_wait=False):
         """Automatically converts an apdu into a message."""
+        if isinstance(apdu, APDUPacket):
+            # the frame is kept with the packet.
+            return self.send_frame(
+                apdu.encode_with(encode_serial_frame), tries, no_wait)
         return self.send_message(SerialMessage(apdu), tries, no_wait)
 
 
@@ -1,9 +1,7 @@
-import sys
 from binascii import hexlify
 from socket import (
     IPPROTO_TCP, SHUT_RDWR, SO_KEEPALIVE, SOL_SOCKET, create_connection)
 from socket import timeout as SocketTimeout
-from struct import unpack
 from sys import platform
 
 try:
@@ -30,7 +28,7 @@ except ImportError:
     TCP_KEEPCNT = None
 
 
-def hexformat(data): # -> str:
+def hexformat(data):  # -> str:
     """Return a prettified binary data."""
     hexlified = str(hexlify(data))
     splitted = ':'.join(
@@ -38,6 +36,113 @@ def hexformat(data): # -> str:
     return repr(bytes(data)) + ' -> ' + splitted
 
 
+class SocketReader(object):
+    """
+    Reads APDUs from a socket into one reusable buffer with recv_into.
+    A read takes whatever the kernel has, so APDUs sent back to back
+    (like status, print lines and completion) come with one syscall;
+    the ones not asked for yet stay in the buffer.
+    """
+    __slots__ = ('sock', 'debug', '_buffer', '_view', '_start', '_end')
+
+    def __init__(self, sock, size=4096, debug=False):
+        self.sock = sock
+        self.debug = debug
+        self._buffer = bytearray(size)
+        self._view = memoryview(self._buffer)
+        self._start = 0
+        self._end = 0
+
+    @property
+    def has_apdu(self):
+        """True if a complete APDU is buffered."""
+        return self._apdu_end() is not None
+
+    def reset(self):
+        """Forgets the buffered data, e.g. after a timeout."""
+        self._start = self._end = 0
+
+    def _apdu_size(self):
+        """The size of the first buffered APDU, None before its length."""
+        buf, start = self._buffer, self._start
+        available = self._end - start
+        if available < 3:
+            return None
+        length = buf[start + 2]
+        if length != 0xFF:
+            return 3 + length
+        # two bytes length follow, low byte first.
+        if available < 5:
+            return None
+        return 5 + (buf[start + 3] | buf[start + 4] << 8)
+
+    def _apdu_end(self):
+        """The end of the first buffered APDU, None if incomplete."""
+        size = self._apdu_size()
+        if size is None or self._start + size > self._end:
+            return None
+        return self._start + size
+
+    def _grow(self, size):
+        """Make room for an APDU of size bytes, keeping unread data."""
+        pending = self._view[self._start:self._end].tobytes()
+        self._buffer = bytearray(max(size, 2 * len(self._buffer)))
+        self._buffer[:len(pending)] = pending
+        self._view = memoryview(self._buffer)
+        self._start, self._end = 0, len(pending)
+
+    def _pop(self, end):
+        apdu = bytes(self._view[self._start:end])
+        if end == self._end:
+            self._start = self._end = 0
+        else:
+            self._start = end
+        return apdu
+
+    def _fill(self):
+        """One recv_into behind the buffered data."""
+        size = self._apdu_size()
+        if size is not None and size > len(self._buffer):
+            self._grow(size)
+        elif self._end == len(self._buffer):
+            # move the unread data to the front.
+            pending = self._end - self._start
+            self._buffer[:pending] = self._view[
+                self._start:self._end].tobytes()
+            self._start, self._end = 0, pending
+        try:
+            received = self.sock.recv_into(self._view[self._end:])
+        except SocketTimeout:
+            raise TransportTimeoutException('Timed out.')
+        if self.debug:
+            print('received', received, 'bytes:', hexformat(
+                data=self._view[self._end:self._end + received]))
+        if not received:
+            raise TransportLayerException('TCP Stream disconnected.')
+        self._end += received
+
+    def read_apdu(self):  # -> bytes:
+        """Return the next APDU, receive until it is complete."""
+        end = self._apdu_end()
+        while end is None:
+            self._fill()
+            end = self._apdu_end()
+        return self._pop(end)
+
+    def read(self):  # -> List[bytes]:
+        """
+        Receive once and return all complete APDUs, for non-blocking
+        sockets.
+        """
+        self._fill()
+        apdus = []
+        end = self._apdu_end()
+        while end is not None:
+            apdus.append(self._pop(end))
+            end = self._apdu_end()
+        return apdus
+
+
 class SocketTransport(Transport):
     """
     Transport for TCP/IP. You can set various timeouts by passing
@@ -49,6 +154,7 @@ class SocketTransport(Transport):
     """
     insert_delays = False
     slog = noop
+    socket_reader = None
     defaults = dict(
         connect_timeout=5, so_keepalive=0, tcp_keepidle=1, tcp_keepintvl=3,
         tcp_keepcnt=5, debug='false', packetdebug='false')
@@ -80,7 +186,7 @@ class SocketTransport(Transport):
             from ecrterm.ecr import ecr_log
             self.slog = ecr_log
 
-    def connect(self, timeout = None): # -> bool:
+    def connect(self, timeout = None):  # -> bool:
         """
         Connect to the TCP socket. Return `True` on successful
         connection, `False` on an unsuccessful one.
@@ -90,94 +196,82 @@ class SocketTransport(Transport):
         try:
             self.sock = create_connection(
                 address=(self.ip, self.port), timeout=timeout)
-            if self.so_keepalive:
-                self.sock.setsockopt(
-                    SOL_SOCKET, SO_KEEPALIVE, self.so_keepalive)
-            if self.tcp_keepidle and platform == 'linux':
-                self.sock.setsockopt(
-                    IPPROTO_TCP, TCP_KEEPIDLE, self.tcp_keepidle)
-            if self.tcp_keepintvl and platform in set(['linux', 'darwin']):
-                self.sock.setsockopt(
-                    IPPROTO_TCP, TCP_KEEPINTVL, self.tcp_keepintvl)
-            if self.tcp_keepcnt and TCP_KEEPCNT:
-                self.sock.setsockopt(
-                    IPPROTO_TCP, TCP_KEEPCNT, self.tcp_keepcnt)
+            self.set_keepalive(self.sock)
+            self.socket_reader = SocketReader(
+                self.sock, debug=self._packetdebug)
             return True
         except (Exception, SocketTimeout) as exc:
             raise TransportConnectionFailed(exc.args[0])
 
+    def set_keepalive(self, sock):
+        """Apply the keepalive options of the uri to a connected socket."""
+        if self.so_keepalive:
+            sock.setsockopt(
+                SOL_SOCKET, SO_KEEPALIVE, self.so_keepalive)
+        if self.tcp_keepidle and platform == 'linux':
+            sock.setsockopt(
+                IPPROTO_TCP, TCP_KEEPIDLE, self.tcp_keepidle)
+        if self.tcp_keepintvl and platform in set(['linux', 'darwin']):
+            sock.setsockopt(
+                IPPROTO_TCP, TCP_KEEPINTVL, self.tcp_keepintvl)
+        if self.tcp_keepcnt and TCP_KEEPCNT:
+            sock.setsockopt(
+                IPPROTO_TCP, TCP_KEEPCNT, self.tcp_keepcnt)
+
     def send(self, apdu, tries = 0, no_wait = False):
         """Send data."""
-        to_send = apdu.to_bytes()
-        self.slog(data=bs2hl(binstring=to_send), incoming=False)
-        total_sent = 0
-        msglen = len(to_send)
-        while total_sent < msglen:
-            sent = self.sock.send(to_send[total_sent:])
-            if self._packetdebug:
-                print('sent', sent, 'bytes of', hexformat(
-                    data=to_send[total_sent:]))
-            if sent == 0:
-                raise RuntimeError('Socket connection broken.')
-            total_sent += sent
+        self.send_packets([apdu])
         if no_wait:
             return True
         return self.receive()
 
-    def _receive_bytes(self, length):  # -> bytes:
-        """Receive and return a fixed amount of bytes."""
-        recv_bytes = 0
-        result = b''
-        if self._packetdebug:
-            print('\nwaiting for', length, 'bytes')
-        while recv_bytes < length:
-            try:
-                chunk = self.sock.recv(length - recv_bytes)
-            except SocketTimeout:
-                raise TransportTimeoutException('Timed out.')
-            if self._packetdebug:
-                print('received', len(chunk), 'bytes:', hexformat(data=chunk))
-            if chunk == b'':
-                raise TransportLayerException('TCP Stream disconnected.')
-            result += chunk
-            recv_bytes += len(chunk)
-        return result
-
-    def _receive_length(self): # -> Tuple[bytes, int]:
+    def send_packets(self, packets):
         """
-        Receive the 4 bytes on the socket which indicates the message
-        length, and return the packed and the `int` converted length.
+        Send packets without waiting for an answer. Several packets go
+        out together with one sendmsg, without joining them first.
         """
-        data = self._receive_bytes(length=3)
-        if sys.version_info.major == 2:
-            length = ord(data[2])
-        else:
-            length = data[2]
-        if length != 0xff:
-            return data, length
-        # Need to get 2 more bytes
-        length = self._receive_bytes(length=2)
-        data += length
-        return data, unpack('<H', length)[0]
-
-    def _receive(self, timeout=TIMEOUT_T2): # -> bytes:
+        buffers = [packet.to_bytes() for packet in packets]
+        for to_send in buffers:
+            self.slog(data=bs2hl(binstring=to_send), incoming=False)
+            if self._packetdebug:
+                print('sent', len(to_send), 'bytes of', hexformat(
+                    data=to_send))
+        if len(buffers) == 1:
+            self.sock.sendall(buffers[0])
+            return
+        if not hasattr(self.sock, 'sendmsg'):
+            self.sock.sendall(b''.join(buffers))
+            return
+        sent = self.sock.sendmsg(buffers)
+        # a partial send is finished with the unsent parts of the buffers.
+        for to_send in buffers:
+            if sent >= len(to_send):
+                sent -= len(to_send)
+                continue
+            if sent:
+                to_send = memoryview(to_send)[sent:]
+                sent = 0
+            self.sock.sendall(to_send)
+
+    @property
+    def has_apdu(self):
+        return self.socket_reader is not None and self.socket_reader.has_apdu
+
+    def _receive(self, timeout=TIMEOUT_T2):  # -> bytes:
         """
         Receive the response from the terminal and return is as `bytes`.
         """
-        data, length = self._receive_length()
-        if not length:  # Length is 0
-            return data
-        new_data = self._receive_bytes(length=length)
-        return data + new_data
+        return self.socket_reader.read_apdu()
 
     def receive(
-            self, timeout=None, *args, **kwargs): # -> Tuple[bool, APDUPacket]:
+            self, timeout=None, *args, **kwargs):  # -> Tuple[bool, APDUPacket]:
         """
         Receive data, return success status and ADPUPacket instance.
         """
         if timeout is None:
             timeout = self.connect_timeout
-        self.sock.settimeout(timeout)
+        if not self.socket_reader.has_apdu:
+            self.sock.settimeout(timeout)
         data = self._receive()
         self.slog(data=bs2hl(binstring=data), incoming=True)
         return True, APDUPacket.parse(blob=data)
@@ -0,0 +1,125 @@
+"""
+Asynchronous TCP/IP Transport.
+
+The SocketTransport on asyncio streams: connect, send and receive are
+coroutines, so one event loop can talk to many terminals. Takes the
+same `socket://` uri as SocketTransport, see AsyncECR.
+"""
+import asyncio
+from struct import unpack
+
+from ecrterm.conv import bs2hl
+from ecrterm.exceptions import (
+    TransportConnectionFailed, TransportLayerException,
+    TransportTimeoutException)
+from ecrterm.packets.apdu import APDUPacket
+from ecrterm.transmission.transport_socket import SocketTransport, hexformat
+
+
+class AsyncSocketTransport(SocketTransport):
+    reader = None
+    writer = None
+    _partial = None
+    #: the stream reader does not tell, see Transport.has_apdu.
+    has_apdu = False
+
+    async def connect(self, timeout=None):
+        """
+        Connect to the TCP socket. Return `True` on successful
+        connection, raise TransportConnectionFailed otherwise.
+        """
+        if timeout is None:
+            timeout = self.connect_timeout
+        try:
+            self.reader, self.writer = await asyncio.wait_for(
+                asyncio.open_connection(self.ip, self.port), timeout)
+        except asyncio.TimeoutError:
+            raise TransportConnectionFailed('Connect timed out.')
+        except OSError as exc:
+            raise TransportConnectionFailed(exc.args[-1])
+        self.set_keepalive(self.writer.get_extra_info('socket'))
+        self._partial = bytearray()
+        return True
+
+    def write(self, apdu):
+        """
+        Queue a packet for sending without waiting, the stream sends it
+        in the background. See drain.
+        """
+        to_send = apdu.to_bytes()
+        self.slog(data=bs2hl(binstring=to_send), incoming=False)
+        if self._packetdebug:
+            print('sent', len(to_send), 'bytes of', hexformat(data=to_send))
+        self.writer.write(to_send)
+
+    def send_packets(self, packets):
+        """Queue packets for sending, see write and drain."""
+        for packet in packets:
+            self.write(packet)
+
+    async def drain(self):
+        """Wait until the queued packets are sent."""
+        await self.writer.drain()
+
+    async def send(self, apdu, tries=0, no_wait=False):
+        """Send data."""
+        self.write(apdu)
+        await self.drain()
+        if no_wait:
+            return True
+        return await self.receive()
+
+    async def _receive_bytes(self, length):  # -> bytes:
+        """Receive and return a fixed amount of bytes."""
+        try:
+            data = await self.reader.readexactly(length)
+        except asyncio.IncompleteReadError:
+            raise TransportLayerException('TCP Stream disconnected.')
+        if self._packetdebug:
+            print('received', len(data), 'bytes:', hexformat(data=data))
+        return data
+
+    async def _fill(self, size):
+        """Receive until `_partial` holds size bytes."""
+        data = await self._receive_bytes(size - len(self._partial))
+        self._partial += data
+
+    async def _receive(self):  # -> bytes:
+        """
+        Receive the response from the terminal and return is as `bytes`.
+        The parts already received are kept in `_partial`, so a receive
+        cancelled by its timeout does not lose them.
+        """
+        if len(self._partial) < 3:
+            await self._fill(3)
+        length, header = self._partial[2], 3
+        if length == 0xff:
+            # Need to get 2 more bytes
+            if len(self._partial) < 5:
+                await self._fill(5)
+            length, header = unpack('<H', self._partial[3:5])[0], 5
+        if len(self._partial) < header + length:
+            await self._fill(header + length)
+        data = bytes(self._partial)
+        self._partial.clear()
+        return data
+
+    async def receive(self, timeout=None, *args, **kwargs):
+        """
+        Receive data, return success status and ADPUPacket instance.
+        """
+        if timeout is None:
+            timeout = self.connect_timeout
+        try:
+            data = await asyncio.wait_for(self._receive(), timeout)
+        except asyncio.TimeoutError:
+            raise TransportTimeoutException('Timed out.')
+        self.slog(data=bs2hl(binstring=data), incoming=True)
+        return True, APDUPacket.parse(blob=data)
+
+    async def close(self):
+        """Close the connection."""
+        self.writer.close()
+        if hasattr(self.writer, 'wait_closed'):
+            # python 3.7+
+            await self.writer.wait_closed()
@@ -3,7 +3,6 @@ Utility Functions.
 
 @author g4b
 """
-StatusEnquiry = Completion = ECR = None
 
 
 def is_stringlike(v):
@@ -29,11 +28,9 @@ def detect_pt_serial(device='/dev/ttyUSB0', timeout=2, silent=True, ecr=None):
     @param ecr: give a working ecr to perform this task. note: you have to
         reconnect the transport since the timeout is changed.
     """
-    global ECR, StatusEnquiry, Completion
-    if ECR is None:
-        from ecrterm.ecr import ECR  # avoid circular import
-    if StatusEnquiry is None:
-        from ecrterm.packets.base_packets import StatusEnquiry, Completion
+    # ecrterm.ecr imports this module.
+    from ecrterm.ecr import ECR
+    from ecrterm.packets.base_packets import Completion, StatusEnquiry
 
     def __detect_pt_serial(port, timeout, ecr):
         e = ecr or ECR(port)